@@ -6,7 +6,7 @@ from .models import (
     PeerEvaluation, ContributionEvaluation,
     StudentQRCode, QRCodeScan, StudentLessonPoints
 )
-from .models import StudentClassPoints
+from .models import StudentClassPoints, GradebookEntry, BackgroundJob, TeacherScanTotal, ClassScanTotal, ScanLogCursor, ArchiveChunk, ArchivedScanTotal, CurrentQuizScore
 
 @admin.register(CustomUser)
 class CustomUserAdmin(UserAdmin):
@@ -82,6 +82,15 @@ class QuizScoreAdmin(admin.ModelAdmin):
     list_filter = ('is_cancelled', 'quiz__lesson_session', 'graded_at')
     search_fields = ('student__full_name', 'quiz__quiz_name')
 
+@admin.register(CurrentQuizScore)
+class CurrentQuizScoreAdmin(admin.ModelAdmin):
+    """現在の小テスト結果管理画面"""
+    list_display = ('quiz', 'student', 'quiz_score', 'updated_at')
+    list_filter = ('quiz__lesson_session__classroom',)
+    search_fields = ('student__full_name', 'quiz__quiz_name')
+    raw_id_fields = ('quiz_score',)
+    readonly_fields = ('updated_at',)
+
 @admin.register(PeerEvaluation)
 class PeerEvaluationAdmin(admin.ModelAdmin):
     """ピア評価管理画面"""
@@ -103,18 +112,14 @@ class StudentQRCodeAdmin(admin.ModelAdmin):
     list_display = ('student', 'qr_code_id', 'is_active', 'scan_count', 'created_at', 'last_used_at')
     list_filter = ('is_active', 'created_at', 'last_used_at')
     search_fields = ('student__full_name', 'student__student_number')
-    readonly_fields = ('qr_code_id', 'created_at', 'last_used_at')
-    
-    def scan_count(self, obj):
-        return obj.scans.count()
-    scan_count.short_description = 'スキャン数'
+    readonly_fields = ('qr_code_id', 'created_at', 'last_used_at', 'scan_count')
 
 
 @admin.register(QRCodeScan)
 class QRCodeScanAdmin(admin.ModelAdmin):
     """QRコードスキャン履歴管理画面"""
-    list_display = ('qr_code', 'scanned_by', 'points_awarded', 'scanned_at')
-    list_filter = ('points_awarded', 'scanned_at', 'qr_code__student')
+    list_display = ('qr_code', 'scanned_by', 'classroom', 'points_awarded', 'points_pending', 'scanned_at')
+    list_filter = ('points_awarded', 'points_pending', 'scanned_at', 'qr_code__student')
     search_fields = ('qr_code__student__full_name', 'scanned_by__full_name')
     readonly_fields = ('scanned_at',)
 
@@ -135,3 +140,62 @@ class StudentClassPointsAdmin(admin.ModelAdmin):
     list_filter = ('classroom', 'points', 'created_at')
     search_fields = ('student__full_name', 'classroom__class_name')
     readonly_fields = ('created_at', 'updated_at')
+
+
+@admin.register(TeacherScanTotal)
+class TeacherScanTotalAdmin(admin.ModelAdmin):
+    """教員別スキャン累計管理画面"""
+    list_display = ('teacher', 'scan_count', 'updated_at')
+    search_fields = ('teacher__full_name',)
+    readonly_fields = ('updated_at',)
+
+
+@admin.register(ClassScanTotal)
+class ClassScanTotalAdmin(admin.ModelAdmin):
+    """クラス別スキャン累計管理画面"""
+    list_display = ('classroom', 'scan_count', 'updated_at')
+    search_fields = ('classroom__class_name',)
+    readonly_fields = ('updated_at',)
+
+
+@admin.register(ScanLogCursor)
+class ScanLogCursorAdmin(admin.ModelAdmin):
+    """スキャンログ圧縮状況管理画面"""
+    list_display = ('name', 'last_scan_id', 'compacted_count', 'updated_at')
+    readonly_fields = ('updated_at',)
+
+
+@admin.register(ArchiveChunk)
+class ArchiveChunkAdmin(admin.ModelAdmin):
+    """履歴アーカイブ管理画面"""
+    list_display = ('kind', 'year', 'semester', 'classroom', 'first_id', 'last_id', 'row_count', 'created_at')
+    list_filter = ('kind', 'year', 'semester')
+    exclude = ('data',)
+    readonly_fields = ('created_at',)
+
+
+@admin.register(ArchivedScanTotal)
+class ArchivedScanTotalAdmin(admin.ModelAdmin):
+    """アーカイブ済みスキャン集計管理画面"""
+    list_display = ('qr_code', 'scanned_by', 'classroom', 'scan_count', 'points_awarded', 'updated_at')
+    list_filter = ('classroom',)
+    search_fields = ('qr_code__student__full_name', 'scanned_by__full_name')
+    readonly_fields = ('updated_at',)
+
+
+@admin.register(GradebookEntry)
+class GradebookEntryAdmin(admin.ModelAdmin):
+    """成績簿管理画面"""
+    list_display = ('student', 'classroom', 'lesson_session', 'qr_points', 'quiz_score', 'peer_score', 'updated_at')
+    list_filter = ('classroom',)
+    search_fields = ('student__full_name', 'student__student_number', 'classroom__class_name')
+    readonly_fields = ('updated_at',)
+
+
+@admin.register(BackgroundJob)
+class BackgroundJobAdmin(admin.ModelAdmin):
+    """バックグラウンドジョブ管理画面"""
+    list_display = ('id', 'job_type', 'status', 'progress_current', 'progress_total', 'created_by', 'created_at', 'finished_at')
+    list_filter = ('job_type', 'status')
+    exclude = ('result_file',)
+    readonly_fields = ('created_at', 'started_at', 'finished_at')
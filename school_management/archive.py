@@ -0,0 +1,141 @@
+"""終了した学期の履歴のアーカイブ
+
+QRコードスキャン（QRCodeScan）と取り消し済みの小テスト得点（QuizScore）は削除されずに増え続けるため、
+終了した学期（ClassRoom.year / semester）のクラスの行を、一定件数ごとに gzip 圧縮した
+JSON Lines として ArchiveChunk に追記し、元の行を削除する。
+スキャン数・付与ポイントの合計は ArchivedScanTotal に集計しておき、表示時は現在の行と合算する。
+
+クラスを指定せずに記録したスキャン（classroom が NULL）は学期に属さないため対象外で、
+アーカイブされずに残る。
+"""
+from collections import Counter
+from datetime import date
+import gzip
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import F, Sum
+
+from .models import ArchiveChunk, ArchivedScanTotal, ClassRoom, LessonSession, QRCodeScan, QuizScore
+
+SCAN_FIELDS = [
+    'id', 'qr_code_id', 'scanned_by_id', 'lesson_session_id', 'classroom_id',
+    'points_awarded', 'scanned_at', 'client_scan_id',
+]
+QUIZ_SCORE_FIELDS = ['id', 'quiz_id', 'student_id', 'score', 'graded_by_id', 'graded_at']
+
+
+def encode_rows(rows):
+    """行（辞書）のリストを gzip 圧縮した JSON Lines にする"""
+    lines = '\n'.join(json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False) for row in rows)
+    return gzip.compress(lines.encode('utf-8'))
+
+
+def decode_rows(data):
+    """encode_rows で作成したデータを行（辞書）のリストに戻す"""
+    text = gzip.decompress(bytes(data)).decode('utf-8')
+    return [json.loads(line) for line in text.splitlines() if line]
+
+
+def term_end(year, semester=None):
+    """学期の最終日（前期は9月30日、後期・年度全体は翌年3月31日）"""
+    if semester == 'first':
+        return date(year, 9, 30)
+    return date(year + 1, 3, 31)
+
+
+def closed_classrooms(year, semester=None):
+    """アーカイブ対象のクラス（指定した年度・学期）"""
+    classrooms = ClassRoom.objects.filter(year=year)
+    if semester:
+        classrooms = classrooms.filter(semester=semester)
+    return classrooms.order_by('id')
+
+
+def term_is_over(year, semester=None, today=None):
+    """学期（semester 省略時は年度全体）が終了していればTrue
+
+    学期の最終日を過ぎていても、今日以降の授業回があるクラスがあれば終了していないとみなす。
+    """
+    today = today or date.today()
+    if today <= term_end(year, semester):
+        return False
+    return not LessonSession.objects.filter(
+        classroom__in=closed_classrooms(year, semester), date__gte=today
+    ).exists()
+
+
+def _write_chunk(kind, classroom, rows):
+    ArchiveChunk.objects.create(
+        kind=kind,
+        year=classroom.year,
+        semester=classroom.semester,
+        classroom=classroom,
+        first_id=rows[0]['id'],
+        last_id=rows[-1]['id'],
+        row_count=len(rows),
+        data=encode_rows(rows),
+    )
+
+
+def _add_scan_totals(classroom, rows):
+    """アーカイブしたスキャンを ArchivedScanTotal に加算する"""
+    counts = Counter()
+    points = Counter()
+    for row in rows:
+        key = (row['qr_code_id'], row['scanned_by_id'])
+        counts[key] += 1
+        points[key] += row['points_awarded']
+    for (qr_code_id, scanned_by_id), count in counts.items():
+        lookup = {'qr_code_id': qr_code_id, 'scanned_by_id': scanned_by_id, 'classroom': classroom}
+        updated = ArchivedScanTotal.objects.filter(**lookup).update(
+            scan_count=F('scan_count') + count,
+            points_awarded=F('points_awarded') + points[(qr_code_id, scanned_by_id)],
+        )
+        if not updated:
+            ArchivedScanTotal.objects.create(scan_count=count, points_awarded=points[(qr_code_id, scanned_by_id)], **lookup)
+
+
+def archive_scans(classroom, batch_size=1000):
+    """クラスのQRコードスキャンをアーカイブする。アーカイブした件数を返す
+
+    ポイント未反映（points_pending）のスキャンは compact_scan_log で反映されるまで残す。
+    """
+    total = 0
+    while True:
+        with transaction.atomic():
+            rows = list(
+                QRCodeScan.objects.filter(classroom=classroom, points_pending=False)
+                .order_by('id').values(*SCAN_FIELDS)[:batch_size]
+            )
+            if not rows:
+                return total
+            _write_chunk('qr_scans', classroom, rows)
+            _add_scan_totals(classroom, rows)
+            QRCodeScan.objects.filter(id__in=[row['id'] for row in rows]).delete()
+        total += len(rows)
+
+
+def archive_cancelled_quiz_scores(classroom, batch_size=1000):
+    """クラスの小テストの取り消し済み得点をアーカイブする。アーカイブした件数を返す"""
+    total = 0
+    while True:
+        with transaction.atomic():
+            rows = list(
+                QuizScore.objects.filter(quiz__lesson_session__classroom=classroom, is_cancelled=True)
+                .order_by('id').values(*QUIZ_SCORE_FIELDS)[:batch_size]
+            )
+            if not rows:
+                return total
+            _write_chunk('quiz_scores', classroom, rows)
+            QuizScore.objects.filter(id__in=[row['id'] for row in rows]).delete()
+        total += len(rows)
+
+
+def archived_scan_summary(**lookup):
+    """アーカイブ済みスキャンの (スキャン数, 付与ポイント)（例: qr_code=..., classroom=...）"""
+    totals = ArchivedScanTotal.objects.filter(**lookup).aggregate(
+        scan_count=Sum('scan_count'), points=Sum('points_awarded')
+    )
+    return totals['scan_count'] or 0, totals['points'] or 0
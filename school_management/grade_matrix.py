@@ -0,0 +1,193 @@
+"""クラス評価一覧用の成績マトリクス（学生 × 授業回）を集計するモジュール
+
+学生・授業回の数に関係なく、固定数のクエリでマトリクス全体を構築する。
+表示時は成績簿（GradebookEntry）から読み込み、成績簿の再計算時は元データから集計する。
+"""
+from collections import defaultdict
+
+from django.db.models import Avg, Count
+
+from .models import (
+    ContributionEvaluation, CurrentQuizScore, GradebookEntry, GroupMember, PeerEvaluation, Quiz,
+    StudentClassPoints, StudentLessonPoints,
+)
+from .scan_log import pending_class_points, pending_lesson_points
+
+# ピア評価の配点（1位=5点、2位=3点）
+FIRST_PLACE_POINTS = 5
+SECOND_PLACE_POINTS = 3
+
+
+def session_key(session):
+    """テンプレートで使用する授業回のキー"""
+    return f"第{session.session_number}回"
+
+
+class GradeMatrix:
+    """クラス全体の成績データを保持する"""
+
+    def __init__(self, classroom, sessions):
+        self.classroom = classroom
+        self.sessions = list(sessions)
+        # (student_id, session_id) -> QRポイント
+        self.qr_points = {}
+        # session_id -> 最初の小テストID
+        self.session_quiz = {}
+        # (student_id, session_id) -> 小テスト得点
+        self.quiz_scores = {}
+        # (student_id, session_id) -> ピア評価スコア
+        self.peer_scores = {}
+        # session_id -> 貢献度平均（ピア評価なしの場合はNone）
+        self.peer_averages = {}
+        # student_id -> StudentClassPoints
+        self.class_points = {}
+
+    def session_data(self, student):
+        """学生1人分の授業回ごとのデータを返す"""
+        data = {}
+        for session in self.sessions:
+            key = (student.id, session.id)
+            qr_points = self.qr_points.get(key, 0)
+            quiz_score = self.quiz_scores.get(key, 0)
+            peer_score = self.peer_scores.get(key, 0)
+            data[session_key(session)] = {
+                'qr_points': qr_points,
+                'quiz_score': quiz_score,
+                'peer_score': peer_score,
+                'total_score': qr_points + quiz_score + peer_score,
+                'date': session.date,
+                'has_peer_evaluation': session.has_peer_evaluation,
+                'has_quiz': session.id in self.session_quiz,
+            }
+        return data
+
+    def attended_sessions(self, student):
+        """ポイント記録のある授業回数とQRポイント合計を返す"""
+        count = 0
+        total = 0
+        for session in self.sessions:
+            points = self.qr_points.get((student.id, session.id))
+            if points is not None:
+                count += 1
+                total += points
+        return count, total
+
+
+def _first_quiz_per_session(matrix, session_ids):
+    """授業回ごとに最初の小テストを記録する"""
+    quizzes = Quiz.objects.filter(
+        lesson_session_id__in=session_ids
+    ).order_by('id').values_list('id', 'lesson_session_id')
+    for quiz_id, session_id in quizzes:
+        matrix.session_quiz.setdefault(session_id, quiz_id)
+
+
+def _load_session_aggregates(matrix, classroom):
+    """授業回単位の貢献度平均と保存済みクラスポイントを読み込む"""
+    peer_session_ids = {session.id for session in matrix.sessions if session.has_peer_evaluation}
+    if peer_session_ids:
+        averages = ContributionEvaluation.objects.filter(
+            peer_evaluation__lesson_session_id__in=peer_session_ids
+        ).values('peer_evaluation__lesson_session_id').annotate(avg_score=Avg('contribution_score'))
+        for row in averages:
+            matrix.peer_averages[row['peer_evaluation__lesson_session_id']] = round(row['avg_score'] or 0, 1)
+
+    for session in matrix.sessions:
+        if session.has_peer_evaluation:
+            matrix.peer_averages.setdefault(session.id, 0)
+        else:
+            matrix.peer_averages[session.id] = None
+
+    # 保存済みの出席率・出席点・クラスポイント
+    for scp in StudentClassPoints.objects.filter(classroom=classroom):
+        matrix.class_points[scp.student_id] = scp
+
+
+def build_grade_matrix(classroom, sessions):
+    """成績簿からクラスの成績マトリクスを構築する
+
+    クエリ数は学生数・授業回数に依存しない。
+    """
+    matrix = GradeMatrix(classroom, sessions)
+    session_ids = [session.id for session in matrix.sessions]
+
+    entries = GradebookEntry.objects.filter(
+        classroom=classroom, lesson_session_id__in=session_ids
+    ).values_list('student_id', 'lesson_session_id', 'qr_points', 'has_lesson_points', 'quiz_score', 'peer_score')
+    for student_id, session_id, qr_points, has_lesson_points, quiz_score, peer_score in entries:
+        key = (student_id, session_id)
+        if has_lesson_points:
+            matrix.qr_points[key] = qr_points
+        if quiz_score:
+            matrix.quiz_scores[key] = quiz_score
+        if peer_score:
+            matrix.peer_scores[key] = peer_score
+
+    _first_quiz_per_session(matrix, session_ids)
+    _load_session_aggregates(matrix, classroom)
+
+    # 未反映のスキャン分（QR_SCAN_DEFERRED_POINTS）を合算
+    session_id_set = set(session_ids)
+    for key, points in pending_lesson_points([classroom.id]).items():
+        if key[1] in session_id_set:
+            matrix.qr_points[key] = matrix.qr_points.get(key, 0) + points
+    for (student_id, _), points in pending_class_points([classroom.id]).items():
+        # 最初のスキャンがまだ未反映の学生は保存しない行を作る
+        class_points = matrix.class_points.setdefault(
+            student_id, StudentClassPoints(student_id=student_id, classroom=classroom, points=0)
+        )
+        class_points.points += points
+    return matrix
+
+
+def compute_grade_matrix(classroom, sessions):
+    """元データ（ポイント・小テスト・ピア評価）から成績マトリクスを集計する
+
+    成績簿の一括再計算に使用する。クエリ数は学生数・授業回数に依存しない。
+    """
+    matrix = GradeMatrix(classroom, sessions)
+    session_ids = [session.id for session in matrix.sessions]
+    peer_session_ids = {session.id for session in matrix.sessions if session.has_peer_evaluation}
+
+    # QRコードポイント
+    lesson_points = StudentLessonPoints.objects.filter(
+        lesson_session_id__in=session_ids
+    ).values_list('student_id', 'lesson_session_id', 'points')
+    for student_id, session_id, points in lesson_points:
+        matrix.qr_points[(student_id, session_id)] = points
+
+    # 小テスト（授業回ごとに最初の1件を使用）
+    _first_quiz_per_session(matrix, session_ids)
+
+    quiz_sessions = {quiz_id: session_id for session_id, quiz_id in matrix.session_quiz.items()}
+    if quiz_sessions:
+        scores = CurrentQuizScore.objects.filter(
+            quiz_id__in=quiz_sessions.keys()
+        ).values_list('quiz_id', 'student_id', 'quiz_score__score')
+        for quiz_id, student_id, score in scores:
+            matrix.quiz_scores[(student_id, quiz_sessions[quiz_id])] = score
+
+    # ピア評価（1位・2位の得票数をグループ単位で集計し、メンバーに展開）
+    if peer_session_ids:
+        group_scores = defaultdict(int)
+        first_votes = PeerEvaluation.objects.filter(
+            lesson_session_id__in=peer_session_ids
+        ).values('first_place_group_id').annotate(votes=Count('id'))
+        for row in first_votes:
+            group_scores[row['first_place_group_id']] += row['votes'] * FIRST_PLACE_POINTS
+
+        second_votes = PeerEvaluation.objects.filter(
+            lesson_session_id__in=peer_session_ids
+        ).values('second_place_group_id').annotate(votes=Count('id'))
+        for row in second_votes:
+            group_scores[row['second_place_group_id']] += row['votes'] * SECOND_PLACE_POINTS
+
+        memberships = GroupMember.objects.filter(
+            group__lesson_session_id__in=peer_session_ids
+        ).values_list('student_id', 'group_id', 'group__lesson_session_id')
+        for student_id, group_id, session_id in memberships:
+            key = (student_id, session_id)
+            matrix.peer_scores[key] = matrix.peer_scores.get(key, 0) + group_scores.get(group_id, 0)
+
+    _load_session_aggregates(matrix, classroom)
+    return matrix
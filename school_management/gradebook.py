@@ -0,0 +1,153 @@
+"""成績簿（GradebookEntry）の差分更新と一括再計算"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .grade_matrix import (
+    FIRST_PLACE_POINTS, SECOND_PLACE_POINTS, compute_grade_matrix,
+)
+from .models import (
+    ClassRoom, CurrentQuizScore, GradebookEntry, GroupMember, LessonSession, PeerEvaluation,
+    Quiz, StudentLessonPoints,
+)
+
+ENTRY_FIELDS = ['qr_points', 'has_lesson_points', 'quiz_score', 'peer_score']
+
+
+def compute_entries(lesson_session, student_ids):
+    """1つの授業回について、指定した学生の成績簿の値を元データから計算する"""
+    student_ids = set(student_ids)
+    values = {
+        student_id: {'qr_points': 0, 'has_lesson_points': False, 'quiz_score': 0, 'peer_score': 0}
+        for student_id in student_ids
+    }
+    if not student_ids:
+        return values
+
+    # QRコードポイント
+    lesson_points = StudentLessonPoints.objects.filter(
+        lesson_session=lesson_session, student_id__in=student_ids
+    ).values_list('student_id', 'points')
+    for student_id, points in lesson_points:
+        values[student_id]['qr_points'] = points
+        values[student_id]['has_lesson_points'] = True
+
+    # 小テスト（授業回の最初の小テストの現在の得点）
+    quiz_id = Quiz.objects.filter(lesson_session=lesson_session).order_by('id').values_list('id', flat=True).first()
+    if quiz_id:
+        scores = CurrentQuizScore.objects.filter(
+            quiz_id=quiz_id, student_id__in=student_ids
+        ).values_list('student_id', 'quiz_score__score')
+        for student_id, score in scores:
+            values[student_id]['quiz_score'] = score
+
+    # ピア評価（1位=5点、2位=3点）
+    if lesson_session.has_peer_evaluation:
+        memberships = GroupMember.objects.filter(
+            group__lesson_session=lesson_session, student_id__in=student_ids
+        ).values_list('student_id', 'group_id')
+        student_groups = defaultdict(list)
+        for student_id, group_id in memberships:
+            student_groups[student_id].append(group_id)
+
+        group_ids = {group_id for groups in student_groups.values() for group_id in groups}
+        if group_ids:
+            group_scores = defaultdict(int)
+            votes = PeerEvaluation.objects.filter(lesson_session=lesson_session).filter(
+                Q(first_place_group_id__in=group_ids) | Q(second_place_group_id__in=group_ids)
+            ).values_list('first_place_group_id', 'second_place_group_id')
+            for first_id, second_id in votes:
+                group_scores[first_id] += FIRST_PLACE_POINTS
+                group_scores[second_id] += SECOND_PLACE_POINTS
+            for student_id, groups in student_groups.items():
+                values[student_id]['peer_score'] = sum(group_scores[group_id] for group_id in groups)
+
+    return values
+
+
+def refresh_entries(lesson_session_id, student_ids, create=True):
+    """指定した学生・授業回の成績簿を差分更新する
+
+    create=False の場合は既存の行のみ更新する（削除の連鎖中に行を作らないため）。
+    """
+    student_ids = {student_id for student_id in student_ids if student_id}
+    if not student_ids:
+        return
+    lesson_session = LessonSession.objects.filter(id=lesson_session_id).first()
+    if lesson_session is None:
+        return
+
+    values = compute_entries(lesson_session, student_ids)
+    if create:
+        GradebookEntry.objects.bulk_create(
+            [
+                GradebookEntry(
+                    classroom_id=lesson_session.classroom_id,
+                    student_id=student_id,
+                    lesson_session_id=lesson_session.id,
+                    **fields
+                )
+                for student_id, fields in values.items()
+            ],
+            update_conflicts=True,
+            unique_fields=['classroom', 'student', 'lesson_session'],
+            update_fields=ENTRY_FIELDS + ['updated_at'],
+        )
+    else:
+        for student_id, fields in values.items():
+            GradebookEntry.objects.filter(
+                lesson_session_id=lesson_session.id, student_id=student_id
+            ).update(**fields)
+
+
+def add_qr_points(lesson_session, student_id, amount):
+    """QRポイントの加算を成績簿に反映する（F式による加算、行がなければ再計算）"""
+    updated = GradebookEntry.objects.filter(
+        classroom_id=lesson_session.classroom_id,
+        student_id=student_id,
+        lesson_session_id=lesson_session.id
+    ).update(qr_points=F('qr_points') + amount, has_lesson_points=True, updated_at=timezone.now())
+    if not updated:
+        refresh_entries(lesson_session.id, [student_id])
+
+
+def refresh_session(lesson_session_id, create=True):
+    """授業回のグループメンバーと既存の成績簿の行をまとめて更新する"""
+    student_ids = set(GroupMember.objects.filter(
+        group__lesson_session_id=lesson_session_id
+    ).values_list('student_id', flat=True))
+    student_ids.update(GradebookEntry.objects.filter(
+        lesson_session_id=lesson_session_id
+    ).values_list('student_id', flat=True))
+    refresh_entries(lesson_session_id, student_ids, create=create)
+
+
+def rebuild_gradebook(classroom):
+    """クラスの成績簿を元データから一括再計算する。作成した行数を返す"""
+    sessions = LessonSession.objects.filter(classroom=classroom).order_by('session_number')
+    matrix = compute_grade_matrix(classroom, sessions)
+
+    keys = set(matrix.qr_points) | set(matrix.quiz_scores) | set(matrix.peer_scores)
+    entries = [
+        GradebookEntry(
+            classroom=classroom,
+            student_id=student_id,
+            lesson_session_id=session_id,
+            qr_points=matrix.qr_points.get((student_id, session_id), 0),
+            has_lesson_points=(student_id, session_id) in matrix.qr_points,
+            quiz_score=matrix.quiz_scores.get((student_id, session_id), 0),
+            peer_score=matrix.peer_scores.get((student_id, session_id), 0),
+        )
+        for student_id, session_id in keys
+    ]
+    with transaction.atomic():
+        GradebookEntry.objects.filter(classroom=classroom).delete()
+        GradebookEntry.objects.bulk_create(entries, batch_size=500)
+    return len(entries)
+
+
+def rebuild_all():
+    """全クラスの成績簿を再計算する"""
+    return {classroom: rebuild_gradebook(classroom) for classroom in ClassRoom.objects.all()}
@@ -0,0 +1,103 @@
+"""小テストの採点結果の一括保存と現在の得点（CurrentQuizScore）の管理
+
+再採点では既存の QuizScore を取り消して新しい行を追加するため、履歴は QuizScore に残し、
+小テスト×学生ごとの現在の得点は CurrentQuizScore（有効な QuizScore を指す1行）で引く。
+"""
+from django.db import transaction
+from django.db.models import Min
+
+from . import gradebook
+from .models import CurrentQuizScore, QuizScore
+
+
+def save_quiz_scores(quiz, submitted, graded_by):
+    """採点結果をまとめて保存し、変更した学生IDのリストを返す
+
+    submitted は {学生ID: 得点}。現在の有効な得点と同じものは書き込まない。
+    変更がある学生は既存の結果を1回のUPDATEで取り消し、新しい結果を bulk_create で作成する。
+    """
+    if not submitted:
+        return []
+
+    with transaction.atomic():
+        current_scores = {}
+        current_ids = {}
+        active = QuizScore.objects.select_for_update().filter(
+            quiz=quiz, student_id__in=submitted.keys(), is_cancelled=False
+        ).order_by('id').values_list('id', 'student_id', 'score')
+        for score_id, student_id, score in active:
+            current_ids.setdefault(student_id, []).append(score_id)
+            current_scores.setdefault(student_id, score)
+
+        changed = {
+            student_id: score
+            for student_id, score in submitted.items()
+            if current_scores.get(student_id) != score
+        }
+        if not changed:
+            return []
+
+        cancel_ids = [score_id for student_id in changed for score_id in current_ids.get(student_id, [])]
+        if cancel_ids:
+            QuizScore.objects.filter(id__in=cancel_ids).update(is_cancelled=True)
+        QuizScore.objects.bulk_create([
+            QuizScore(quiz=quiz, student_id=student_id, score=score, graded_by=graded_by)
+            for student_id, score in changed.items()
+        ])
+
+        # 一括更新はシグナルが発生しないため現在の得点と成績簿を直接更新する
+        refresh_current_scores(quiz.id, list(changed))
+        gradebook.refresh_entries(quiz.lesson_session_id, list(changed))
+
+    return list(changed)
+
+
+def refresh_current_scores(quiz_id, student_ids):
+    """指定した学生の現在の得点を、取り消されていない最初の採点結果に合わせる
+
+    有効な採点結果がない学生の行は削除する。
+    """
+    student_ids = {student_id for student_id in student_ids if student_id}
+    if not quiz_id or not student_ids:
+        return
+    current = dict(
+        QuizScore.objects.filter(quiz_id=quiz_id, student_id__in=student_ids, is_cancelled=False).order_by()
+        .values('student_id').annotate(score_id=Min('id')).values_list('student_id', 'score_id')
+    )
+    missing = student_ids - current.keys()
+    if missing:
+        CurrentQuizScore.objects.filter(quiz_id=quiz_id, student_id__in=missing).delete()
+    if current:
+        CurrentQuizScore.objects.bulk_create(
+            [
+                CurrentQuizScore(quiz_id=quiz_id, student_id=student_id, quiz_score_id=score_id)
+                for student_id, score_id in current.items()
+            ],
+            update_conflicts=True,
+            unique_fields=['quiz', 'student'],
+            update_fields=['quiz_score', 'updated_at'],
+        )
+
+
+def current_quiz_scores(**lookup):
+    """現在の得点（QuizScore）のクエリセット。lookup は CurrentQuizScore の条件（例: quiz=..., student=...）"""
+    return QuizScore.objects.filter(
+        current_pointer__isnull=False,
+        **{f'current_pointer__{field}': value for field, value in lookup.items()}
+    )
+
+
+def rebuild_current_scores():
+    """現在の得点を採点結果から作り直す（不整合の修復用）。作成した行数を返す"""
+    rows = (
+        QuizScore.objects.filter(is_cancelled=False).order_by()
+        .values('quiz_id', 'student_id').annotate(score_id=Min('id'))
+        .values_list('quiz_id', 'student_id', 'score_id')
+    )
+    with transaction.atomic():
+        CurrentQuizScore.objects.all().delete()
+        created = CurrentQuizScore.objects.bulk_create([
+            CurrentQuizScore(quiz_id=quiz_id, student_id=student_id, quiz_score_id=score_id)
+            for quiz_id, student_id, score_id in rows
+        ], batch_size=1000)
+    return len(created)
@@ -0,0 +1,141 @@
+"""バックグラウンドジョブ
+
+時間のかかる処理（学生の一括登録・QRシートの作成・成績簿の再計算）を
+BackgroundJob テーブルに登録し、``manage.py run_workers`` のワーカープロセスで実行する。
+外部のメッセージブローカーは使わず、ジョブの受け渡しはDBのみで行う。
+"""
+import io
+import traceback
+
+from django.db.models import F
+from django.utils import timezone
+
+from . import gradebook
+from .models import BackgroundJob, ClassRoom
+from .qr_images import ensure_qr_codes, get_qr_pngs, iter_zip, sheet_label, write_sheet_pdf, zip_entry_name
+from .student_import import format_errors, import_students, parse_student_lines
+
+JOB_HANDLERS = {}
+
+
+def job_handler(job_type):
+    """ジョブの処理関数を登録するデコレータ"""
+    def decorator(func):
+        JOB_HANDLERS[job_type] = func
+        return func
+    return decorator
+
+
+class JobContext:
+    """処理関数に渡す実行中ジョブの情報（進捗報告・結果ファイルの添付）"""
+
+    def __init__(self, job):
+        self.job = job
+        self.params = job.params
+        self.file = None
+
+    def progress(self, current, total=None, message=None):
+        fields = {'progress_current': current}
+        if total is not None:
+            fields['progress_total'] = total
+        if message is not None:
+            fields['message'] = message
+        BackgroundJob.objects.filter(pk=self.job.pk).update(**fields)
+
+    def attach_file(self, filename, content_type, data):
+        self.file = (filename, content_type, data)
+
+
+def enqueue(job_type, params, user=None):
+    """ジョブを登録する（ワーカーが空き次第実行される）"""
+    if job_type not in JOB_HANDLERS:
+        raise ValueError(f'未登録のジョブ種類です: {job_type}')
+    return BackgroundJob.objects.create(job_type=job_type, params=params, created_by=user)
+
+
+def claim_next():
+    """待機中のジョブを1件取得して実行中にする（取得できなければNone）
+
+    状態を条件にした UPDATE で確保するため、複数のワーカーが同じジョブを実行することはない。
+    """
+    pending = BackgroundJob.objects.filter(status='pending').order_by('created_at', 'id')
+    for job_id in pending.values_list('id', flat=True)[:10]:
+        claimed = BackgroundJob.objects.filter(id=job_id, status='pending').update(
+            status='running', started_at=timezone.now()
+        )
+        if claimed:
+            return job_id
+    return None
+
+
+def run_job(job_id):
+    """ジョブを実行して結果を保存する（ワーカープロセスから呼ばれる）"""
+    job = BackgroundJob.objects.get(id=job_id)
+    context = JobContext(job)
+    try:
+        result = JOB_HANDLERS[job.job_type](context)
+    except Exception:
+        BackgroundJob.objects.filter(pk=job.pk).update(
+            status='failed', error=traceback.format_exc(), finished_at=timezone.now()
+        )
+        return 'failed'
+
+    fields = {'status': 'succeeded', 'result': result, 'finished_at': timezone.now(),
+              'progress_current': F('progress_total')}
+    if context.file:
+        fields['result_filename'], fields['result_content_type'], fields['result_file'] = context.file
+    BackgroundJob.objects.filter(pk=job.pk).update(**fields)
+    return 'succeeded'
+
+
+@job_handler('import_students')
+def import_students_job(context):
+    """学生をクラスに一括登録する（params: class_id, student_data）"""
+    classroom = ClassRoom.objects.get(id=context.params['class_id'])
+    context.progress(0, 2, '入力を検証しています')
+    rows, parse_errors = parse_student_lines(
+        context.params['student_data'], ('student_number', 'full_name', 'email'), required=2, separators=(',', '\t')
+    )
+    context.progress(1, 2, f'{len(rows)}名を登録しています')
+    students, import_errors = import_students(rows, lambda row: 'student123', classroom=classroom)
+    return {'added': len(students), 'errors': format_errors(parse_errors + import_errors)}
+
+
+@job_handler('qr_sheet')
+def qr_sheet_job(context):
+    """クラス全員のQRコードをPDF/ZIPにまとめる（params: class_id, format, base_url）"""
+    classroom = ClassRoom.objects.get(id=context.params['class_id'])
+    export_format = context.params.get('format', 'pdf')
+    base_url = context.params['base_url'].rstrip('/')
+
+    students = list(classroom.students.all().order_by('student_number'))
+    context.progress(0, len(students) + 1, 'QRコードを作成しています')
+    qr_codes = ensure_qr_codes(students)
+    scan_urls = [base_url + qr_codes[student.id].scan_path(classroom.id) for student in students]
+    pngs = get_qr_pngs(scan_urls)
+    context.progress(len(students), message='ファイルを作成しています')
+
+    filename = f'qr_codes_class{classroom.id}'
+    if export_format == 'zip':
+        files = [(zip_entry_name(student), pngs[scan_url]) for student, scan_url in zip(students, scan_urls)]
+        context.attach_file(f'{filename}.zip', 'application/zip', b''.join(iter_zip(files)))
+    else:
+        buffer = io.BytesIO()
+        write_sheet_pdf([(sheet_label(student), pngs[scan_url]) for student, scan_url in zip(students, scan_urls)], buffer)
+        context.attach_file(f'{filename}.pdf', 'application/pdf', buffer.getvalue())
+    return {'count': len(students)}
+
+
+@job_handler('rebuild_gradebook')
+def rebuild_gradebook_job(context):
+    """成績簿を再計算する（params: class_ids、省略時は全クラス）"""
+    classrooms = ClassRoom.objects.all().order_by('id')
+    if context.params.get('class_ids'):
+        classrooms = classrooms.filter(id__in=context.params['class_ids'])
+    classrooms = list(classrooms)
+
+    total = 0
+    for index, classroom in enumerate(classrooms):
+        context.progress(index, len(classrooms), f'{classroom} を再計算しています')
+        total += gradebook.rebuild_gradebook(classroom)
+    return {'entries': total}
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from school_management.archive import archive_cancelled_quiz_scores, archive_scans, closed_classrooms, term_is_over
+from school_management.models import ClassRoom
+
+
+class Command(BaseCommand):
+    help = '終了した学期のQRコードスキャン履歴と取り消し済みの小テスト得点を圧縮してアーカイブします'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--year', type=int, required=True, help='対象年度')
+        parser.add_argument('--semester', choices=[value for value, _ in ClassRoom.SEMESTER_CHOICES],
+                            help='対象学期（省略時は年度全体）')
+        parser.add_argument('--batch-size', type=int, default=1000, help='1つのアーカイブにまとめる行数（既定: 1000）')
+        parser.add_argument('--force', action='store_true', help='終了していない学期でもアーカイブする')
+
+    def handle(self, *args, **options):
+        classrooms = list(closed_classrooms(options['year'], options['semester']))
+        if not classrooms:
+            raise CommandError('指定された年度・学期のクラスが見つかりません。')
+        if not options['force'] and not term_is_over(options['year'], options['semester']):
+            raise CommandError('指定された学期はまだ終了していません（実行する場合は --force を指定してください）。')
+
+        batch_size = max(1, options['batch_size'])
+        total_scans = total_scores = 0
+        for classroom in classrooms:
+            scans = archive_scans(classroom, batch_size)
+            scores = archive_cancelled_quiz_scores(classroom, batch_size)
+            total_scans += scans
+            total_scores += scores
+            self.stdout.write(f'{classroom}: スキャン{scans}件, 取り消し済み得点{scores}件')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'アーカイブしました（スキャン{total_scans}件, 取り消し済み得点{total_scores}件）'
+        ))
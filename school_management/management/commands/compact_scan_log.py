@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from school_management.points import compact_scan_log
+
+
+class Command(BaseCommand):
+    help = 'ポイント未反映のスキャン（QR_SCAN_DEFERRED_POINTS）をポイント・スキャン数に反映します'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='1トランザクションで反映するスキャン数（既定: 1000）')
+        parser.add_argument('--interval', type=float, default=0,
+                            help='指定した秒数ごとに繰り返し実行する（省略時は1回で終了）')
+
+    def handle(self, *args, **options):
+        while True:
+            count = compact_scan_log(batch_size=max(1, options['batch_size']))
+            if count or not options['interval']:
+                self.stdout.write(self.style.SUCCESS(f'{count}件のスキャンを反映しました'))
+            if not options['interval']:
+                return
+            try:
+                time.sleep(options['interval'])
+            except KeyboardInterrupt:
+                return
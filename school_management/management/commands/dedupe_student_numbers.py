@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from school_management.models import CustomUser
+from school_management.student_numbers import resolve_duplicate_student_numbers
+
+
+class Command(BaseCommand):
+    help = '重複している学籍番号を検出し、--apply 指定時は重複分の学籍番号を付け直します'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--apply', action='store_true',
+                            help='学籍番号を付け直す（省略時は一覧表示のみ）')
+
+    def handle(self, *args, **options):
+        changes = resolve_duplicate_student_numbers(CustomUser, apply=options['apply'])
+        if not changes:
+            self.stdout.write(self.style.SUCCESS('重複している学籍番号はありません'))
+            return
+
+        for user, old_number, new_number in changes:
+            self.stdout.write(f'{old_number}: {user.full_name}（ID {user.id}, {user.role}） → {new_number}')
+
+        if options['apply']:
+            self.stdout.write(self.style.SUCCESS(f'{len(changes)}件の学籍番号を付け直しました'))
+        else:
+            self.stdout.write(self.style.WARNING(
+                f'{len(changes)}件の重複があります。--apply を指定すると上記のとおり付け直します'
+            ))
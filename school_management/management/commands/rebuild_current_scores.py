@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from school_management.grading import rebuild_current_scores
+
+
+class Command(BaseCommand):
+    help = '小テストの現在の得点（CurrentQuizScore）を採点結果から作り直します'
+
+    def handle(self, *args, **options):
+        count = rebuild_current_scores()
+        self.stdout.write(self.style.SUCCESS(f'現在の得点を作り直しました（{count}件）'))
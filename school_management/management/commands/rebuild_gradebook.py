@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from school_management.gradebook import rebuild_gradebook
+from school_management.models import ClassRoom
+
+
+class Command(BaseCommand):
+    help = '成績簿（GradebookEntry）を元データから一括再計算します'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--class-id', type=int, action='append', dest='class_ids',
+                            help='対象クラスID（複数指定可、省略時は全クラス）')
+
+    def handle(self, *args, **options):
+        classrooms = ClassRoom.objects.all().order_by('id')
+        if options['class_ids']:
+            classrooms = classrooms.filter(id__in=options['class_ids'])
+            if not classrooms.exists():
+                raise CommandError('指定されたクラスが見つかりません。')
+
+        total = 0
+        for classroom in classrooms:
+            count = rebuild_gradebook(classroom)
+            total += count
+            self.stdout.write(f'{classroom}: {count}件')
+
+        self.stdout.write(self.style.SUCCESS(f'成績簿を再計算しました（合計{total}件）'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from school_management.points import rebuild_scan_counters
+
+
+class Command(BaseCommand):
+    help = 'スキャン数（QRコード別・教員別・クラス別）をスキャン履歴から再集計します'
+
+    def handle(self, *args, **options):
+        count = rebuild_scan_counters()
+        self.stdout.write(self.style.SUCCESS(f'スキャン数を再集計しました（QRコード{count}件）'))
@@ -0,0 +1,86 @@
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import multiprocessing
+import time
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from school_management.jobs import claim_next, run_job
+from school_management.models import BackgroundJob
+
+
+class Command(BaseCommand):
+    help = 'バックグラウンドジョブをワーカープロセスで実行します'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2, help='ワーカープロセス数（既定: 2）')
+        parser.add_argument('--poll-interval', type=float, default=2.0, help='待機中ジョブの確認間隔（秒）')
+        parser.add_argument('--once', action='store_true', help='待機中のジョブをすべて実行したら終了する')
+        parser.add_argument('--inline', action='store_true', help='プロセスプールを使わずこのプロセスで実行する（デバッグ用）')
+        parser.add_argument('--requeue-running', action='store_true',
+                            help='起動時に「実行中」のまま残っているジョブを待機中に戻す（ワーカー異常終了後の復旧用）')
+
+    def handle(self, *args, **options):
+        if options['requeue_running']:
+            count = BackgroundJob.objects.filter(status='running').update(status='pending', started_at=None)
+            self.stdout.write(f'{count}件のジョブを待機中に戻しました')
+
+        if options['inline']:
+            self.run_inline(options)
+        else:
+            self.run_pool(options)
+
+    def run_inline(self, options):
+        while True:
+            job_id = claim_next()
+            if job_id is None:
+                if options['once']:
+                    return
+                time.sleep(options['poll_interval'])
+                continue
+            self.report(job_id, run_job(job_id))
+
+    def run_pool(self, options):
+        workers = max(1, options['workers'])
+        # ワーカーはspawnで起動し、親プロセスのDB接続を引き継がないようにする
+        connections.close_all()
+        executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=django.setup,
+        )
+        running = {}
+        self.stdout.write(f'ワーカーを{workers}プロセスで起動しました')
+        try:
+            while True:
+                while len(running) < workers:
+                    job_id = claim_next()
+                    if job_id is None:
+                        break
+                    running[executor.submit(run_job, job_id)] = job_id
+
+                if not running:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_interval'])
+                    continue
+
+                done, _ = wait(running, timeout=options['poll_interval'], return_when=FIRST_COMPLETED)
+                for future in done:
+                    job_id = running.pop(future)
+                    try:
+                        status = future.result()
+                    except Exception as e:
+                        # ワーカープロセス自体が異常終了した場合
+                        BackgroundJob.objects.filter(id=job_id).update(status='failed', error=str(e))
+                        status = 'failed'
+                    self.report(job_id, status)
+        except KeyboardInterrupt:
+            self.stdout.write('停止しています（実行中のジョブの完了を待ちます）')
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def report(self, job_id, status):
+        style = self.style.SUCCESS if status == 'succeeded' else self.style.ERROR
+        self.stdout.write(style(f'ジョブ #{job_id}: {status}'))
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:51
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('school_management', '0015_studentclasspoints_attendance_points'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GradebookEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('qr_points', models.IntegerField(default=0, verbose_name='QRポイント')),
+                ('has_lesson_points', models.BooleanField(default=False, verbose_name='授業ポイント記録あり')),
+                ('quiz_score', models.IntegerField(default=0, verbose_name='小テスト得点')),
+                ('peer_score', models.IntegerField(default=0, verbose_name='ピア評価スコア')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新日時')),
+                ('classroom', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='gradebook_entries', to='school_management.classroom', verbose_name='クラス')),
+                ('lesson_session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='gradebook_entries', to='school_management.lessonsession', verbose_name='授業セッション')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='gradebook_entries', to=settings.AUTH_USER_MODEL, verbose_name='学生')),
+            ],
+            options={
+                'verbose_name': '成績簿',
+                'verbose_name_plural': '成績簿',
+                'unique_together': {('classroom', 'student', 'lesson_session')},
+            },
+        ),
+    ]
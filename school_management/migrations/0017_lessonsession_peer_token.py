@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:57
+
+import hashlib
+
+from django.db import migrations, models
+
+
+def backfill_peer_tokens(apps, schema_editor):
+    """既存の授業回に従来のリンクと同じトークンを設定する"""
+    LessonSession = apps.get_model('school_management', 'LessonSession')
+    sessions = list(LessonSession.objects.filter(peer_token__isnull=True).only('id'))
+    for session in sessions:
+        session.peer_token = hashlib.md5(f"peer_{session.id}".encode()).hexdigest()
+    LessonSession.objects.bulk_update(sessions, ['peer_token'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('school_management', '0016_gradebookentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lessonsession',
+            name='peer_token',
+            field=models.CharField(blank=True, editable=False, max_length=32, null=True, unique=True, verbose_name='ピア評価トークン'),
+        ),
+        migrations.RunPython(backfill_peer_tokens, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:01
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('school_management', '0017_lessonsession_peer_token'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BackgroundJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('job_type', models.CharField(max_length=50, verbose_name='種類')),
+                ('params', models.JSONField(blank=True, default=dict, verbose_name='パラメータ')),
+                ('status', models.CharField(choices=[('pending', '待機中'), ('running', '実行中'), ('succeeded', '完了'), ('failed', '失敗')], default='pending', max_length=10, verbose_name='状態')),
+                ('progress_current', models.IntegerField(default=0, verbose_name='進捗')),
+                ('progress_total', models.IntegerField(default=0, verbose_name='全体量')),
+                ('message', models.CharField(blank=True, max_length=200, verbose_name='メッセージ')),
+                ('result', models.JSONField(blank=True, null=True, verbose_name='結果')),
+                ('result_file', models.BinaryField(blank=True, null=True, verbose_name='結果ファイル')),
+                ('result_filename', models.CharField(blank=True, max_length=200, verbose_name='結果ファイル名')),
+                ('result_content_type', models.CharField(blank=True, max_length=100, verbose_name='結果ファイル形式')),
+                ('error', models.TextField(blank=True, verbose_name='エラー')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='登録日時')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='開始日時')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='終了日時')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='background_jobs', to=settings.AUTH_USER_MODEL, verbose_name='登録者')),
+            ],
+            options={
+                'verbose_name': 'バックグラウンドジョブ',
+                'verbose_name_plural': 'バックグラウンドジョブ',
+                'indexes': [models.Index(fields=['status', 'created_at'], name='school_mana_status_a82b22_idx')],
+            },
+        ),
+    ]
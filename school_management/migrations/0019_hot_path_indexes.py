@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('school_management', '0018_backgroundjob'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='customuser',
+            index=models.Index(fields=['role', 'student_number'], name='user_role_student_number_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lessonsession',
+            index=models.Index(fields=['classroom', 'date'], name='lessonsession_class_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lessonsession',
+            index=models.Index(condition=models.Q(('has_peer_evaluation', True)), fields=['classroom', 'date'], name='lessonsession_peer_eval_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='qrcodescan',
+            index=models.Index(fields=['scanned_by', 'scanned_at'], name='qrcodescan_scanner_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='qrcodescan',
+            index=models.Index(fields=['qr_code', 'scanned_at'], name='qrcodescan_qr_code_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='quizscore',
+            index=models.Index(fields=['quiz', 'student', 'is_cancelled'], name='quizscore_quiz_student_idx'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:13
+
+from django.db import migrations
+from django.db.models import Count
+
+
+def resolve_duplicates(apps, schema_editor):
+    """一意制約の追加前に残っている重複を解消する（通常は事前に dedupe_student_numbers で確認・解消しておく）
+
+    学生ロール優先・登録の古い順で先頭のユーザーの学籍番号を残し、
+    それ以外のユーザーは末尾にユーザーIDを付けた番号に付け直す。
+    """
+    CustomUser = apps.get_model('school_management', 'CustomUser')
+    numbers = (
+        CustomUser.objects.exclude(student_number='')
+        .values('student_number')
+        .annotate(count=Count('id'))
+        .filter(count__gt=1)
+        .values_list('student_number', flat=True)
+    )
+    duplicates = {}
+    users = CustomUser.objects.filter(student_number__in=list(numbers)).order_by('student_number', 'id')
+    for user in users:
+        duplicates.setdefault(user.student_number, []).append(user)
+    for student_number, group in duplicates.items():
+        group.sort(key=lambda user: (user.role != 'student', user.id))
+        for user in group[1:]:
+            suffix = f'-{user.id}'
+            CustomUser.objects.filter(pk=user.pk).update(student_number=student_number[:20 - len(suffix)] + suffix)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('school_management', '0019_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(resolve_duplicates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('school_management', '0020_resolve_duplicate_student_numbers'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='customuser',
+            name='student_number',
+            field=models.CharField(blank=True, db_index=True, max_length=20, verbose_name='学籍番号'),
+        ),
+        migrations.AddConstraint(
+            model_name='customuser',
+            constraint=models.UniqueConstraint(condition=models.Q(('student_number', ''), _negated=True), fields=('student_number',), name='unique_student_number'),
+        ),
+    ]
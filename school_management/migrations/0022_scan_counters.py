@@ -0,0 +1,70 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:16
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_scan_counters(apps, schema_editor):
+    """既存のスキャン履歴からスキャン数を集計する（クラス別は授業回のクラスに計上）"""
+    QRCodeScan = apps.get_model('school_management', 'QRCodeScan')
+    StudentQRCode = apps.get_model('school_management', 'StudentQRCode')
+    TeacherScanTotal = apps.get_model('school_management', 'TeacherScanTotal')
+    ClassScanTotal = apps.get_model('school_management', 'ClassScanTotal')
+
+    scans = QRCodeScan.objects.order_by()
+    for qr_code_id, count in scans.values('qr_code_id').annotate(count=Count('id')).values_list('qr_code_id', 'count'):
+        StudentQRCode.objects.filter(id=qr_code_id).update(scan_count=count)
+    TeacherScanTotal.objects.bulk_create([
+        TeacherScanTotal(teacher_id=teacher_id, scan_count=count)
+        for teacher_id, count in scans.values('scanned_by_id').annotate(count=Count('id')).values_list('scanned_by_id', 'count')
+    ])
+    ClassScanTotal.objects.bulk_create([
+        ClassScanTotal(classroom_id=classroom_id, scan_count=count)
+        for classroom_id, count in scans.filter(lesson_session__isnull=False)
+        .values('lesson_session__classroom_id').annotate(count=Count('id'))
+        .values_list('lesson_session__classroom_id', 'count')
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('school_management', '0021_unique_student_number'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='studentqrcode',
+            name='scan_count',
+            field=models.IntegerField(default=0, verbose_name='スキャン数'),
+        ),
+        migrations.CreateModel(
+            name='ClassScanTotal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scan_count', models.IntegerField(default=0, verbose_name='スキャン数')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新日時')),
+                ('classroom', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='scan_total', to='school_management.classroom', verbose_name='クラス')),
+            ],
+            options={
+                'verbose_name': 'クラス別スキャン累計',
+                'verbose_name_plural': 'クラス別スキャン累計',
+            },
+        ),
+        migrations.CreateModel(
+            name='TeacherScanTotal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scan_count', models.IntegerField(default=0, verbose_name='スキャン数')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新日時')),
+                ('teacher', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='scan_total', to=settings.AUTH_USER_MODEL, verbose_name='教員')),
+            ],
+            options={
+                'verbose_name': '教員別スキャン累計',
+                'verbose_name_plural': '教員別スキャン累計',
+            },
+        ),
+        migrations.RunPython(backfill_scan_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:22
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('school_management', '0022_scan_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='qrcodescan',
+            name='client_scan_id',
+            field=models.CharField(blank=True, max_length=64, null=True, verbose_name='端末スキャンID'),
+        ),
+        migrations.AlterField(
+            model_name='qrcodescan',
+            name='scanned_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='スキャン日時'),
+        ),
+        migrations.AddConstraint(
+            model_name='qrcodescan',
+            constraint=models.UniqueConstraint(fields=('scanned_by', 'client_scan_id'), name='unique_client_scan_id'),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_scan_classroom(apps, schema_editor):
+    """既存のスキャンは授業回のクラスを記録する"""
+    QRCodeScan = apps.get_model('school_management', 'QRCodeScan')
+    LessonSession = apps.get_model('school_management', 'LessonSession')
+    QRCodeScan.objects.filter(lesson_session__isnull=False).update(
+        classroom_id=models.Subquery(
+            LessonSession.objects.filter(id=models.OuterRef('lesson_session_id')).values('classroom_id')[:1]
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('school_management', '0023_qrcodescan_client_scan_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScanLogCursor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True, verbose_name='名前')),
+                ('last_scan_id', models.BigIntegerField(default=0, verbose_name='反映済みスキャンID')),
+                ('compacted_count', models.BigIntegerField(default=0, verbose_name='反映済みスキャン数')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新日時')),
+            ],
+            options={
+                'verbose_name': 'スキャンログ圧縮状況',
+                'verbose_name_plural': 'スキャンログ圧縮状況',
+            },
+        ),
+        migrations.AddField(
+            model_name='qrcodescan',
+            name='classroom',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='qr_scans', to='school_management.classroom', verbose_name='クラス'),
+        ),
+        migrations.AddField(
+            model_name='qrcodescan',
+            name='points_pending',
+            field=models.BooleanField(default=False, verbose_name='ポイント未反映'),
+        ),
+        migrations.AddIndex(
+            model_name='qrcodescan',
+            index=models.Index(condition=models.Q(('points_pending', True)), fields=['id'], name='qrcodescan_pending_idx'),
+        ),
+        migrations.RunPython(backfill_scan_classroom, migrations.RunPython.noop),
+    ]
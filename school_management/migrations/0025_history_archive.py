@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:37
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('school_management', '0024_scan_log'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchiveChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('qr_scans', 'QRコードスキャン'), ('quiz_scores', '小テスト得点（取り消し済み）')], max_length=20, verbose_name='種類')),
+                ('year', models.IntegerField(verbose_name='年度')),
+                ('semester', models.CharField(choices=[('first', '前期'), ('second', '後期')], max_length=10, verbose_name='学期')),
+                ('first_id', models.BigIntegerField(verbose_name='先頭の行ID')),
+                ('last_id', models.BigIntegerField(verbose_name='末尾の行ID')),
+                ('row_count', models.IntegerField(verbose_name='行数')),
+                ('data', models.BinaryField(verbose_name='データ')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='作成日時')),
+                ('classroom', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='archive_chunks', to='school_management.classroom', verbose_name='クラス')),
+            ],
+            options={
+                'verbose_name': '履歴アーカイブ',
+                'verbose_name_plural': '履歴アーカイブ',
+                'indexes': [models.Index(fields=['kind', 'year', 'semester'], name='school_mana_kind_579700_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedScanTotal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scan_count', models.IntegerField(default=0, verbose_name='スキャン数')),
+                ('points_awarded', models.IntegerField(default=0, verbose_name='付与ポイント')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新日時')),
+                ('classroom', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_scan_totals', to='school_management.classroom', verbose_name='クラス')),
+                ('qr_code', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_scan_totals', to='school_management.studentqrcode', verbose_name='QRコード')),
+                ('scanned_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_scan_totals', to=settings.AUTH_USER_MODEL, verbose_name='スキャン者')),
+            ],
+            options={
+                'verbose_name': 'アーカイブ済みスキャン集計',
+                'verbose_name_plural': 'アーカイブ済みスキャン集計',
+                'unique_together': {('qr_code', 'scanned_by', 'classroom')},
+            },
+        ),
+    ]
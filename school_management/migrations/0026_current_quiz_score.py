@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:40
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Min
+
+
+def backfill_current_scores(apps, schema_editor):
+    """小テスト×学生ごとに、取り消されていない最初の採点結果を現在の得点とする"""
+    QuizScore = apps.get_model('school_management', 'QuizScore')
+    CurrentQuizScore = apps.get_model('school_management', 'CurrentQuizScore')
+
+    rows = (
+        QuizScore.objects.filter(is_cancelled=False).order_by()
+        .values('quiz_id', 'student_id').annotate(score_id=Min('id'))
+        .values_list('quiz_id', 'student_id', 'score_id')
+    )
+    CurrentQuizScore.objects.bulk_create([
+        CurrentQuizScore(quiz_id=quiz_id, student_id=student_id, quiz_score_id=score_id)
+        for quiz_id, student_id, score_id in rows
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('school_management', '0025_history_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CurrentQuizScore',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新日時')),
+                ('quiz', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='current_scores', to='school_management.quiz', verbose_name='小テスト')),
+                ('quiz_score', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='current_pointer', to='school_management.quizscore', verbose_name='採点結果')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='current_quiz_scores', to=settings.AUTH_USER_MODEL, verbose_name='学生')),
+            ],
+            options={
+                'verbose_name': '現在の小テスト結果',
+                'verbose_name_plural': '現在の小テスト結果',
+                'unique_together': {('quiz', 'student')},
+            },
+        ),
+        migrations.RunPython(backfill_current_scores, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('school_management', '0026_current_quiz_score'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='customuser',
+            name='student_number',
+            field=models.CharField(blank=True, max_length=20, verbose_name='学籍番号'),
+        ),
+    ]
@@ -2,6 +2,8 @@ from django.db import models
 from django.contrib.auth.models import AbstractUser, BaseUserManager
 from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.utils import timezone
+import hashlib
 import uuid
 
 
@@ -81,6 +83,17 @@ class CustomUser(AbstractUser):
     class Meta:
         verbose_name = 'ユーザー'
         verbose_name_plural = 'ユーザー'
+        indexes = [
+            models.Index(fields=['role', 'student_number'], name='user_role_student_number_idx'),
+        ]
+        constraints = [
+            # 学籍番号は空（教員など）以外で一意
+            models.UniqueConstraint(
+                fields=['student_number'],
+                condition=~models.Q(student_number=''),
+                name='unique_student_number',
+            ),
+        ]
 
     def __str__(self):
         return self.full_name
@@ -131,6 +144,7 @@ class LessonSession(models.Model):
     has_quiz = models.BooleanField(default=False, verbose_name='小テストあり')
     has_peer_evaluation = models.BooleanField(default=False, verbose_name='ピア評価あり')
     peer_evaluation_closed = models.BooleanField(default=False, verbose_name='ピア評価締切済み')
+    peer_token = models.CharField(max_length=32, unique=True, null=True, blank=True, editable=False, verbose_name='ピア評価トークン')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -138,10 +152,28 @@ class LessonSession(models.Model):
         verbose_name = '授業回'
         verbose_name_plural = '授業回'
         unique_together = ['classroom', 'session_number']
+        indexes = [
+            # 今日の授業回の検索（QRスキャン）・日付順の一覧
+            models.Index(fields=['classroom', 'date'], name='lessonsession_class_date_idx'),
+            # ピア評価ありの授業回のみ（学生ダッシュボード）
+            models.Index(fields=['classroom', 'date'], condition=models.Q(has_peer_evaluation=True), name='lessonsession_peer_eval_idx'),
+        ]
 
     def __str__(self):
         return f"{self.classroom.class_name} 第{self.session_number}回"
 
+    @staticmethod
+    def make_peer_token(session_id):
+        """匿名ピア評価リンク用トークン（既存リンクと同じ形式）"""
+        return hashlib.md5(f"peer_{session_id}".encode()).hexdigest()
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # トークンはIDから決まるため、初回保存後に設定する
+        if not self.peer_token:
+            self.peer_token = self.make_peer_token(self.pk)
+            LessonSession.objects.filter(pk=self.pk).update(peer_token=self.peer_token)
+
 
 class Group(models.Model):
     """グループ"""
@@ -224,11 +256,33 @@ class QuizScore(models.Model):
     class Meta:
         verbose_name = '小テスト結果'
         verbose_name_plural = '小テスト結果'
+        indexes = [
+            models.Index(fields=['quiz', 'student', 'is_cancelled'], name='quizscore_quiz_student_idx'),
+        ]
 
     def __str__(self):
         return f"{self.quiz} - {self.student.full_name}: {self.score}点"
 
 
+class CurrentQuizScore(models.Model):
+    """小テストの現在の採点結果（小テスト×学生ごとに1行、有効な QuizScore を指す）
+
+    再採点の履歴は QuizScore に残し、表示・集計ではこの表から現在の得点を引く。
+    """
+    quiz = models.ForeignKey(Quiz, on_delete=models.CASCADE, verbose_name='小テスト', related_name='current_scores')
+    student = models.ForeignKey(Student, on_delete=models.CASCADE, verbose_name='学生', related_name='current_quiz_scores')
+    quiz_score = models.OneToOneField(QuizScore, on_delete=models.CASCADE, verbose_name='採点結果', related_name='current_pointer')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='更新日時')
+
+    class Meta:
+        verbose_name = '現在の小テスト結果'
+        verbose_name_plural = '現在の小テスト結果'
+        unique_together = ['quiz', 'student']
+
+    def __str__(self):
+        return f"{self.quiz} - {self.student.full_name}"
+
+
 class Question(models.Model):
     """小テストの問題"""
     QUESTION_TYPE_CHOICES = [
@@ -371,6 +425,7 @@ class StudentQRCode(models.Model):
     is_active = models.BooleanField(default=True, verbose_name='有効')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='作成日時')
     last_used_at = models.DateTimeField(null=True, blank=True, verbose_name='最終使用日時')
+    scan_count = models.IntegerField(default=0, verbose_name='スキャン数')
     
     class Meta:
         verbose_name = '学生QRコード'
@@ -382,8 +437,25 @@ class StudentQRCode(models.Model):
     @property
     def qr_code_url(self):
         """QRコードのURLを生成"""
+        return self.scan_path()
+
+    def scan_path(self, class_id=None, signed=None):
+        """スキャンURLのパスを生成
+
+        signed が True（省略時は QR_SIGNED_PAYLOADS の設定値）の場合は署名付きトークンのURL、
+        それ以外はQRコードIDのURL（?class_id= 付き）を返す。
+        """
+        from django.conf import settings
         from django.urls import reverse
-        return reverse('qr_code_scan', kwargs={'qr_code_id': self.qr_code_id})
+        if signed is None:
+            signed = settings.QR_SIGNED_PAYLOADS
+        if signed:
+            from .qr_tokens import make_scan_token
+            return reverse('school_management:qr_code_scan_signed', kwargs={'token': make_scan_token(self, class_id)})
+        path = reverse('school_management:qr_code_scan', kwargs={'qr_code_id': self.qr_code_id})
+        if class_id:
+            path += f'?class_id={class_id}'
+        return path
 
 
 class QRCodeScan(models.Model):
@@ -391,18 +463,78 @@ class QRCodeScan(models.Model):
     qr_code = models.ForeignKey(StudentQRCode, on_delete=models.CASCADE, verbose_name='QRコード', related_name='scans')
     scanned_by = models.ForeignKey(Student, on_delete=models.CASCADE, verbose_name='スキャン者', related_name='qr_scans')
     lesson_session = models.ForeignKey(LessonSession, on_delete=models.CASCADE, verbose_name='授業セッション', related_name='qr_scans', null=True, blank=True)
+    # クラスポイントを付与したクラス（授業回がない場合も含む）
+    classroom = models.ForeignKey(ClassRoom, on_delete=models.CASCADE, verbose_name='クラス', related_name='qr_scans', null=True, blank=True)
     points_awarded = models.IntegerField(default=1, verbose_name='付与ポイント')
-    scanned_at = models.DateTimeField(auto_now_add=True, verbose_name='スキャン日時')
+    # ポイント・スキャン数が未反映（QR_SCAN_DEFERRED_POINTS でスキャンログのみ記録した場合）
+    points_pending = models.BooleanField(default=False, verbose_name='ポイント未反映')
+    # オフラインで記録したスキャンは端末側のスキャン日時を保存する
+    scanned_at = models.DateTimeField(default=timezone.now, verbose_name='スキャン日時')
+    # 端末が採番するスキャンID（まとめて送信されたスキャンの重複登録防止用）
+    client_scan_id = models.CharField(max_length=64, null=True, blank=True, verbose_name='端末スキャンID')
     
     class Meta:
         verbose_name = 'QRコードスキャン'
         verbose_name_plural = 'QRコードスキャン'
         # unique_together制約を削除 - 何度でもスキャン可能にする
+        constraints = [
+            models.UniqueConstraint(fields=['scanned_by', 'client_scan_id'], name='unique_client_scan_id'),
+        ]
+        indexes = [
+            # スキャン者・QRコードごとの履歴（新しい順）
+            models.Index(fields=['scanned_by', 'scanned_at'], name='qrcodescan_scanner_idx'),
+            models.Index(fields=['qr_code', 'scanned_at'], name='qrcodescan_qr_code_idx'),
+            # ポイント未反映のスキャン（圧縮処理・未反映分の合算用）
+            models.Index(fields=['id'], condition=models.Q(points_pending=True), name='qrcodescan_pending_idx'),
+        ]
     
     def __str__(self):
         return f"{self.qr_code.student.full_name}のQRコードを{self.scanned_by.full_name}がスキャン"
 
 
+class ScanLogCursor(models.Model):
+    """スキャンログ圧縮の進捗（最後に反映したスキャンID）"""
+    name = models.CharField(max_length=50, unique=True, verbose_name='名前')
+    last_scan_id = models.BigIntegerField(default=0, verbose_name='反映済みスキャンID')
+    compacted_count = models.BigIntegerField(default=0, verbose_name='反映済みスキャン数')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='更新日時')
+
+    class Meta:
+        verbose_name = 'スキャンログ圧縮状況'
+        verbose_name_plural = 'スキャンログ圧縮状況'
+
+    def __str__(self):
+        return f"{self.name}: {self.last_scan_id}"
+
+
+class TeacherScanTotal(models.Model):
+    """教員ごとのQRコードスキャン累計（スキャン時に加算）"""
+    teacher = models.OneToOneField(Teacher, on_delete=models.CASCADE, verbose_name='教員', related_name='scan_total')
+    scan_count = models.IntegerField(default=0, verbose_name='スキャン数')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='更新日時')
+
+    class Meta:
+        verbose_name = '教員別スキャン累計'
+        verbose_name_plural = '教員別スキャン累計'
+
+    def __str__(self):
+        return f"{self.teacher.full_name} - {self.scan_count}回"
+
+
+class ClassScanTotal(models.Model):
+    """クラスごとのQRコードスキャン累計（スキャン時に加算）"""
+    classroom = models.OneToOneField(ClassRoom, on_delete=models.CASCADE, verbose_name='クラス', related_name='scan_total')
+    scan_count = models.IntegerField(default=0, verbose_name='スキャン数')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='更新日時')
+
+    class Meta:
+        verbose_name = 'クラス別スキャン累計'
+        verbose_name_plural = 'クラス別スキャン累計'
+
+    def __str__(self):
+        return f"{self.classroom.class_name} - {self.scan_count}回"
+
+
 class StudentLessonPoints(models.Model):
     """学生の授業ごとのポイント管理"""
     student = models.ForeignKey(CustomUser, on_delete=models.CASCADE, verbose_name='学生', related_name='lesson_points')
@@ -437,3 +569,123 @@ class StudentClassPoints(models.Model):
 
     def __str__(self):
         return f"{self.student.full_name} - {self.classroom.class_name} - {self.points}pt"
+
+
+class GradebookEntry(models.Model):
+    """成績簿（クラス・学生・授業回ごとの集計値を非正規化して保持）
+
+    StudentLessonPoints / QuizScore / PeerEvaluation などの変更時にシグナルで
+    差分更新される。一括再計算は ``manage.py rebuild_gradebook`` を使用する。
+    """
+    classroom = models.ForeignKey(ClassRoom, on_delete=models.CASCADE, verbose_name='クラス', related_name='gradebook_entries')
+    student = models.ForeignKey(CustomUser, on_delete=models.CASCADE, verbose_name='学生', related_name='gradebook_entries')
+    lesson_session = models.ForeignKey(LessonSession, on_delete=models.CASCADE, verbose_name='授業セッション', related_name='gradebook_entries')
+    qr_points = models.IntegerField(default=0, verbose_name='QRポイント')
+    has_lesson_points = models.BooleanField(default=False, verbose_name='授業ポイント記録あり')
+    quiz_score = models.IntegerField(default=0, verbose_name='小テスト得点')
+    peer_score = models.IntegerField(default=0, verbose_name='ピア評価スコア')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='更新日時')
+
+    class Meta:
+        verbose_name = '成績簿'
+        verbose_name_plural = '成績簿'
+        unique_together = ['classroom', 'student', 'lesson_session']
+
+    def __str__(self):
+        return f"{self.student.full_name} - {self.lesson_session}"
+
+    @property
+    def total_score(self):
+        return self.qr_points + self.quiz_score + self.peer_score
+
+
+class BackgroundJob(models.Model):
+    """バックグラウンドジョブ（``manage.py run_workers`` が順に実行する）"""
+    STATUS_CHOICES = [
+        ('pending', '待機中'),
+        ('running', '実行中'),
+        ('succeeded', '完了'),
+        ('failed', '失敗'),
+    ]
+
+    job_type = models.CharField(max_length=50, verbose_name='種類')
+    params = models.JSONField(default=dict, blank=True, verbose_name='パラメータ')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending', verbose_name='状態')
+    progress_current = models.IntegerField(default=0, verbose_name='進捗')
+    progress_total = models.IntegerField(default=0, verbose_name='全体量')
+    message = models.CharField(max_length=200, blank=True, verbose_name='メッセージ')
+    result = models.JSONField(null=True, blank=True, verbose_name='結果')
+    result_file = models.BinaryField(null=True, blank=True, verbose_name='結果ファイル')
+    result_filename = models.CharField(max_length=200, blank=True, verbose_name='結果ファイル名')
+    result_content_type = models.CharField(max_length=100, blank=True, verbose_name='結果ファイル形式')
+    error = models.TextField(blank=True, verbose_name='エラー')
+    created_by = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, blank=True, verbose_name='登録者', related_name='background_jobs')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='登録日時')
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name='開始日時')
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name='終了日時')
+
+    class Meta:
+        verbose_name = 'バックグラウンドジョブ'
+        verbose_name_plural = 'バックグラウンドジョブ'
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.job_type} #{self.pk} ({self.get_status_display()})"
+
+    @property
+    def is_finished(self):
+        return self.status in ('succeeded', 'failed')
+
+    @property
+    def progress_percent(self):
+        if not self.progress_total:
+            return 100 if self.status == 'succeeded' else 0
+        return min(100, int(self.progress_current * 100 / self.progress_total))
+
+
+class ArchiveChunk(models.Model):
+    """終了した学期の履歴データ（gzip圧縮した JSON Lines、追記のみ）"""
+    KIND_CHOICES = [
+        ('qr_scans', 'QRコードスキャン'),
+        ('quiz_scores', '小テスト得点（取り消し済み）'),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, verbose_name='種類')
+    year = models.IntegerField(verbose_name='年度')
+    semester = models.CharField(max_length=10, choices=ClassRoom.SEMESTER_CHOICES, verbose_name='学期')
+    classroom = models.ForeignKey(ClassRoom, on_delete=models.SET_NULL, null=True, blank=True, verbose_name='クラス', related_name='archive_chunks')
+    first_id = models.BigIntegerField(verbose_name='先頭の行ID')
+    last_id = models.BigIntegerField(verbose_name='末尾の行ID')
+    row_count = models.IntegerField(verbose_name='行数')
+    data = models.BinaryField(verbose_name='データ')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='作成日時')
+
+    class Meta:
+        verbose_name = '履歴アーカイブ'
+        verbose_name_plural = '履歴アーカイブ'
+        indexes = [
+            models.Index(fields=['kind', 'year', 'semester']),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} {self.year}年 {self.get_semester_display()} ({self.row_count}件)"
+
+
+class ArchivedScanTotal(models.Model):
+    """アーカイブしたQRコードスキャンの集計（QRコード・スキャン者・クラスごと）"""
+    qr_code = models.ForeignKey(StudentQRCode, on_delete=models.CASCADE, verbose_name='QRコード', related_name='archived_scan_totals')
+    scanned_by = models.ForeignKey(CustomUser, on_delete=models.CASCADE, verbose_name='スキャン者', related_name='archived_scan_totals')
+    classroom = models.ForeignKey(ClassRoom, on_delete=models.CASCADE, verbose_name='クラス', related_name='archived_scan_totals')
+    scan_count = models.IntegerField(default=0, verbose_name='スキャン数')
+    points_awarded = models.IntegerField(default=0, verbose_name='付与ポイント')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='更新日時')
+
+    class Meta:
+        verbose_name = 'アーカイブ済みスキャン集計'
+        verbose_name_plural = 'アーカイブ済みスキャン集計'
+        unique_together = ['qr_code', 'scanned_by', 'classroom']
+
+    def __str__(self):
+        return f"{self.qr_code} - {self.classroom}: {self.scan_count}回"
@@ -0,0 +1,159 @@
+"""ピア評価結果の集計
+
+授業回ごとのグループ別得票数・評価提出数と、学生ごとの貢献度平均を
+グループ数・評価数に関係なく一定回数のクエリで集計する。
+
+集計結果は授業回ごとにキャッシュし、評価の提出・締切時にバージョンを更新して無効化する。
+"""
+import uuid
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Avg, Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from .models import ContributionEvaluation, Group, GroupMember, PeerEvaluation
+
+# ランキングのスコア（1位票×2点 + 2位票×1点）
+FIRST_VOTE_SCORE = 2
+SECOND_VOTE_SCORE = 1
+
+# 集計結果のキャッシュ保持時間（秒）。無効化はバージョン更新で行う
+RESULTS_CACHE_TIMEOUT = 60 * 60
+
+
+class PeerResults:
+    """ピア評価結果（ビュー・テンプレート共通）"""
+
+    def __init__(self, lesson_session):
+        self.lesson_session = lesson_session
+        self.group_stats = []            # スコア順のグループ別集計
+        self.student_stats = []          # 学籍番号順の学生別集計
+        self.evaluations = []            # コメント表示用の評価一覧
+        self.total_evaluations = 0
+        self.total_groups = 0
+
+    @property
+    def group_votes(self):
+        """{'グループN': {'first': 票数, 'second': 票数}}（票のあるグループのみ）"""
+        return {
+            f"グループ{stat['group'].group_number}": {'first': stat['first_place_votes'], 'second': stat['second_place_votes']}
+            for stat in self.group_stats
+            if stat['total_votes']
+        }
+
+    @property
+    def avg_contribution_scores(self):
+        """{氏名: 貢献度平均}"""
+        return {stat['student_name']: stat['average_contribution'] for stat in self.student_stats}
+
+
+def _vote_count(field):
+    """グループが field として選ばれた評価数のサブクエリ"""
+    counts = (
+        PeerEvaluation.objects.filter(**{field: OuterRef('pk')})
+        .order_by()
+        .values(field)
+        .annotate(count=Count('id'))
+        .values('count')
+    )
+    return Coalesce(Subquery(counts, output_field=IntegerField()), Value(0))
+
+
+def aggregate_peer_results(lesson_session):
+    """授業回のピア評価結果を集計する（クエリ数は4回で一定）"""
+    results = PeerResults(lesson_session)
+
+    # グループ別の1位票・2位票・評価提出数（1クエリ）
+    groups = Group.objects.filter(lesson_session=lesson_session).annotate(
+        first_place_count=_vote_count('first_place_group'),
+        second_place_count=_vote_count('second_place_group'),
+        evaluations_given_count=_vote_count('evaluator_group'),
+    ).order_by('group_number')
+
+    group_stats_by_id = {}
+    for group in groups:
+        stat = {
+            'group': group,
+            'first_place_votes': group.first_place_count,
+            'second_place_votes': group.second_place_count,
+            'total_votes': group.first_place_count + group.second_place_count,
+            'evaluations_given': group.evaluations_given_count,
+            'score': group.first_place_count * FIRST_VOTE_SCORE + group.second_place_count * SECOND_VOTE_SCORE,
+        }
+        group_stats_by_id[group.id] = stat
+        results.group_stats.append(stat)
+    results.group_stats.sort(key=lambda stat: stat['score'], reverse=True)
+    results.total_groups = len(results.group_stats)
+
+    # 学生別の貢献度平均・評価された回数（1クエリ）
+    contributions = (
+        ContributionEvaluation.objects.filter(peer_evaluation__lesson_session=lesson_session)
+        .values('evaluatee_id', 'evaluatee__full_name', 'evaluatee__student_number')
+        .annotate(average=Avg('contribution_score'), count=Count('id'))
+        .order_by('evaluatee__student_number', 'evaluatee_id')
+    )
+    # 学生の所属グループ（1クエリ）
+    member_groups = dict(
+        GroupMember.objects.filter(group__lesson_session=lesson_session).values_list('student_id', 'group_id')
+    )
+    for row in contributions:
+        group_stat = group_stats_by_id.get(member_groups.get(row['evaluatee_id']))
+        results.student_stats.append({
+            'student_id': row['evaluatee_id'],
+            'student_name': row['evaluatee__full_name'],
+            'student_number': row['evaluatee__student_number'],
+            'group': group_stat['group'] if group_stat else None,
+            'first_place_votes': group_stat['first_place_votes'] if group_stat else 0,
+            'second_place_votes': group_stat['second_place_votes'] if group_stat else 0,
+            'evaluations_given': group_stat['evaluations_given'] if group_stat else 0,
+            'average_contribution': round(row['average'], 2),
+            'contribution_count': row['count'],
+        })
+
+    # コメント表示用の評価一覧（1クエリ）
+    results.evaluations = list(
+        PeerEvaluation.objects.filter(lesson_session=lesson_session)
+        .select_related('evaluator_group')
+        .order_by('created_at')
+    )
+    results.total_evaluations = len(results.evaluations)
+    return results
+
+
+def _version_key(session_id):
+    return f'peer_results:version:{session_id}'
+
+
+def _results_key(session_id):
+    return f'peer_results:{session_id}'
+
+
+def bump_results_version(session_id):
+    """授業回の集計結果キャッシュを無効化する
+
+    バージョンは毎回新しい値にするため、キャッシュから消えた後に再設定されても古い結果と一致しない。
+    コミット前に再集計されて古い結果がキャッシュされないよう、更新はコミット後に行う。
+    """
+    if session_id:
+        transaction.on_commit(lambda: cache.set(_version_key(session_id), uuid.uuid4().hex, None))
+
+
+def get_peer_results(lesson_session):
+    """キャッシュ済みの集計結果を返す。バージョンが変わっていれば再集計する"""
+    version_key = _version_key(lesson_session.id)
+    results_key = _results_key(lesson_session.id)
+    cached = cache.get_many([version_key, results_key])
+
+    version = cached.get(version_key)
+    if version is None:
+        version = uuid.uuid4().hex
+        cache.set(version_key, version, None)
+    elif results_key in cached and cached[results_key][0] == version:
+        results = cached[results_key][1]
+        results.lesson_session = lesson_session
+        return results
+
+    results = aggregate_peer_results(lesson_session)
+    cache.set(results_key, (version, results), RESULTS_CACHE_TIMEOUT)
+    return results
@@ -0,0 +1,123 @@
+"""クラスのポイント一覧（学生ごとのQRポイント合計・平均と順位）の集計
+
+学生ごとの合計・授業回数・平均は成績簿（GradebookEntry）を学生単位に GROUP BY して求め、
+順位は RANK() OVER、クラス全体の平均・最高・最低は1回の集計クエリで求める。
+クエリ数は学生数に依存しない。
+"""
+from django.db.models import Avg, Case, Count, F, FloatField, Max, Min, Q, Sum, Value, When, Window
+from django.db.models.functions import Cast, Coalesce, Rank, Round
+
+from .models import GradebookEntry, StudentClassPoints
+from .scan_log import merge_pending_points
+
+
+def grade_level(average_points):
+    """平均ポイントによる成績評価 (評価, 表示色)"""
+    if average_points >= 5:
+        return '優秀', 'success'
+    if average_points >= 3:
+        return '良好', 'warning'
+    if average_points >= 1:
+        return '普通', 'info'
+    return '要努力', 'secondary'
+
+
+def _student_totals(classroom):
+    """クラスの学生に合計ポイント・授業回数・平均ポイントを付けたクエリセット"""
+    entry_filter = Q(gradebook_entries__classroom=classroom, gradebook_entries__has_lesson_points=True)
+    return classroom.students.annotate(
+        total_points=Coalesce(Sum('gradebook_entries__qr_points', filter=entry_filter), 0),
+        session_count=Count('gradebook_entries', filter=entry_filter),
+        average_points=Case(
+            When(session_count__gt=0, then=Cast(
+                Round(Cast('total_points', FloatField()) / F('session_count'), 1), FloatField()
+            )),
+            default=Value(0.0),
+            output_field=FloatField(),
+        ),
+    )
+
+
+def _rank_in_python(rows, lesson_points_map):
+    """未反映のスキャン分を合算した授業回ポイントから合計・平均・順位を計算し直す"""
+    for student in rows:
+        lesson_points = lesson_points_map.get(student.id, [])
+        student.total_points = sum(point.qr_points for point in lesson_points)
+        student.session_count = len(lesson_points)
+        student.average_points = (
+            round(student.total_points / student.session_count, 1) if student.session_count else 0
+        )
+    rows.sort(key=lambda student: (-student.average_points, student.student_number))
+    for index, student in enumerate(rows):
+        if index and student.average_points == rows[index - 1].average_points:
+            student.rank = rows[index - 1].rank
+        else:
+            student.rank = index + 1
+
+    averages = [student.average_points for student in rows]
+    if not averages:
+        return {'class_average': 0, 'max_average': 0, 'min_average': 0}
+    return {
+        'class_average': round(sum(averages) / len(averages), 1),
+        'max_average': max(averages),
+        'min_average': min(averages),
+    }
+
+
+def class_point_rankings(classroom):
+    """ポイント一覧の (学生ごとの行のリスト, クラス全体の統計) を返す
+
+    行は平均ポイントの高い順（同点は学生番号順）で、順位は同点を同順位とする。
+    """
+    totals = _student_totals(classroom)
+    rows = list(
+        totals.annotate(rank=Window(Rank(), order_by=F('average_points').desc()))
+        .order_by('-average_points', 'student_number')
+    )
+
+    # 授業回別の詳細表示用
+    lesson_points_map = {}
+    entries = GradebookEntry.objects.filter(
+        classroom=classroom,
+        has_lesson_points=True
+    ).select_related('lesson_session').order_by('lesson_session__session_number')
+    for entry in entries:
+        lesson_points_map.setdefault(entry.student_id, []).append(entry)
+
+    # クラス単位の合計ポイント
+    class_points_map = dict(
+        StudentClassPoints.objects.filter(classroom=classroom).values_list('student_id', 'points')
+    )
+
+    # 未反映のスキャン分（QR_SCAN_DEFERRED_POINTS）を合算した場合は順位・統計を計算し直す
+    if merge_pending_points(classroom, lesson_points_map, class_points_map):
+        stats = _rank_in_python(rows, lesson_points_map)
+    else:
+        stats = totals.aggregate(
+            class_average=Avg('average_points'),
+            max_average=Max('average_points'),
+            min_average=Min('average_points'),
+        )
+        stats = {
+            'class_average': round(stats['class_average'], 1) if rows else 0,
+            'max_average': stats['max_average'] if rows else 0,
+            'min_average': stats['min_average'] if rows else 0,
+        }
+    stats['total_students'] = len(rows)
+
+    student_grades = []
+    for student in rows:
+        level, color = grade_level(student.average_points)
+        student_grades.append({
+            'student': student,
+            'rank': student.rank,
+            'total_points': student.total_points,
+            'average_points': student.average_points,
+            'session_count': student.session_count,
+            'lesson_points': lesson_points_map.get(student.id, []),
+            'grade_level': level,
+            'grade_color': color,
+            'overall_points': student.points,  # 全体のポイント（参考用）
+            'class_points': class_points_map.get(student.id),  # クラス単位のポイント（あれば表示）
+        })
+    return student_grades, stats
@@ -0,0 +1,314 @@
+"""QRコードスキャンによるポイント付与処理
+
+スキャン数（QRコード別・教員別・クラス別）もスキャン時に加算しておき、
+一覧画面で COUNT(*) を実行しなくて済むようにする。
+QR_SCAN_DEFERRED_POINTS の場合はスキャン履歴の追加のみ行い、compact_scan_log でまとめて反映する。
+"""
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Case, Count, F, Max, Sum, Value, When
+from django.utils import timezone
+
+from . import gradebook
+from .models import (
+    ArchivedScanTotal, ClassScanTotal, LessonSession, QRCodeScan, ScanLogCursor, StudentClassPoints,
+    StudentLessonPoints, StudentQRCode, TeacherScanTotal,
+)
+from .scan_log import deferred_points_enabled, pending_class_points
+
+
+def increment_counter(model, field, amount, **lookup):
+    """F式で field を加算する。行がなければ作成し、作成した場合はTrueを返す
+
+    読み込み→加算→保存を行わないため、同時にスキャンされても加算が失われない。
+    """
+    if model.objects.filter(**lookup).update(**{field: F(field) + amount, 'updated_at': timezone.now()}):
+        return False
+    obj, created = model.objects.get_or_create(defaults={field: amount}, **lookup)
+    if not created:
+        # 作成の競合に負けた場合は既存の行に加算する
+        model.objects.filter(pk=obj.pk).update(**{field: F(field) + amount, 'updated_at': timezone.now()})
+    return created
+
+
+def increment_points(model, amount, **lookup):
+    """ポイントを加算する（increment_counter の points 用）"""
+    return increment_counter(model, 'points', amount, **lookup)
+
+
+def record_scan(qr_code, scanned_by, lesson_session=None, classroom=None, points=1):
+    """スキャン履歴の作成とポイント加算を1つのトランザクションで行う
+
+    lesson_session がある場合は授業回ポイント、classroom がある場合はクラス累計ポイントを加算する。
+    加算後のクラス累計ポイントを scan.class_points に設定して返す。
+    QR_SCAN_DEFERRED_POINTS の場合はスキャン履歴の追加のみ行い、加算は compact_scan_log に任せる。
+    """
+    if deferred_points_enabled():
+        scan = QRCodeScan.objects.create(
+            qr_code=qr_code,
+            scanned_by=scanned_by,
+            lesson_session=lesson_session,
+            classroom=classroom,
+            points_awarded=points,
+            points_pending=True,
+        )
+        scan.class_points = class_points_total(qr_code.student_id, classroom) if classroom else None
+        return scan
+
+    now = timezone.now()
+    with transaction.atomic():
+        scan = QRCodeScan.objects.create(
+            qr_code=qr_code,
+            scanned_by=scanned_by,
+            lesson_session=lesson_session,
+            classroom=classroom,
+            points_awarded=points
+        )
+
+        if classroom:
+            # 授業セッションごとのポイント（セッションがある場合のみ）
+            if lesson_session:
+                created = increment_points(
+                    StudentLessonPoints, points,
+                    student_id=qr_code.student_id, lesson_session=lesson_session
+                )
+                # 新規作成時はシグナルで成績簿が更新される。F式の更新はシグナルが発生しないため直接反映する
+                if not created:
+                    gradebook.add_qr_points(lesson_session, qr_code.student_id, points)
+
+            # クラス累計ポイント（加算後の値を応答用に保持する）
+            increment_points(
+                StudentClassPoints, points,
+                student_id=qr_code.student_id, classroom=classroom
+            )
+            scan.class_points = StudentClassPoints.objects.filter(
+                student_id=qr_code.student_id, classroom=classroom
+            ).values_list('points', flat=True).first()
+        else:
+            scan.class_points = None
+
+        # QRコードの最終使用日時とスキャン数のみ更新
+        StudentQRCode.objects.filter(pk=qr_code.pk).update(last_used_at=now, scan_count=F('scan_count') + 1)
+        qr_code.last_used_at = now
+
+        # 教員別・クラス別のスキャン累計
+        increment_counter(TeacherScanTotal, 'scan_count', 1, teacher=scanned_by)
+        if classroom:
+            increment_counter(ClassScanTotal, 'scan_count', 1, classroom=classroom)
+
+    return scan
+
+
+def _lock_compaction():
+    """スキャンログの反映状況の行をロックし、compact_scan_log と同時に実行されないようにする（トランザクション内で呼び出す）"""
+    cursor, _ = ScanLogCursor.objects.get_or_create(name='points')
+    return ScanLogCursor.objects.select_for_update().get(pk=cursor.pk)
+
+
+def save_class_points(classroom, rows):
+    """クラスの学生のクラスポイント（と出席率・出席点）をまとめて上書き保存する
+
+    rows は {学生ID: {'points', ...}}（各行のキーは同じにする）。points は画面に表示した値
+    （反映済み＋未反映のスキャン分）として扱い、未反映分を差し引いて保存する。
+    差し引いた未反映分は compact_scan_log で加算されるため、二重に数えない。
+    StudentClassPoints を1回の INSERT ... ON CONFLICT で作成・更新する。
+    """
+    if not rows:
+        return
+    with transaction.atomic():
+        pending = {}
+        if deferred_points_enabled():
+            _lock_compaction()
+            pending = pending_class_points([classroom.id], list(rows))
+        update_fields = list(next(iter(rows.values())))
+        StudentClassPoints.objects.bulk_create(
+            [
+                StudentClassPoints(
+                    student_id=student_id,
+                    classroom=classroom,
+                    **dict(fields, points=int(fields['points']) - pending.get((student_id, classroom.id), 0)),
+                )
+                for student_id, fields in rows.items()
+            ],
+            update_conflicts=True,
+            unique_fields=['student', 'classroom'],
+            update_fields=update_fields + ['updated_at'],
+        )
+
+
+def class_points_total(student_id, classroom):
+    """反映済みのクラスポイントと未反映のスキャン分を合算した値"""
+    stored = StudentClassPoints.objects.filter(
+        student_id=student_id, classroom=classroom
+    ).values_list('points', flat=True).first() or 0
+    return stored + pending_class_points([classroom.id], [student_id]).get((student_id, classroom.id), 0)
+
+
+def _apply_scan_totals(rows):
+    """スキャンの集計行をポイント・スキャン数に反映する
+
+    rows は qr_code_id, student_id, scanned_by_id, lesson_session_id, classroom_id,
+    points（付与ポイント合計）, count（スキャン数）, last_scanned_at を持つ辞書。
+    学生・QRコード・教員・クラスごとに合計してから1回ずつ加算する。
+    """
+    lesson_points = Counter()
+    class_points = Counter()
+    qr_code_counts = Counter()
+    last_scanned = {}
+    teacher_counts = Counter()
+    classroom_counts = Counter()
+    session_classrooms = {}
+    for row in rows:
+        qr_code_counts[row['qr_code_id']] += row['count']
+        last_scanned[row['qr_code_id']] = max(row['last_scanned_at'], last_scanned.get(row['qr_code_id'], row['last_scanned_at']))
+        teacher_counts[row['scanned_by_id']] += row['count']
+        if row['classroom_id']:
+            class_points[(row['student_id'], row['classroom_id'])] += row['points']
+            classroom_counts[row['classroom_id']] += row['count']
+            if row['lesson_session_id']:
+                lesson_points[(row['student_id'], row['lesson_session_id'])] += row['points']
+                session_classrooms[row['lesson_session_id']] = row['classroom_id']
+
+    for (student_id, session_id), amount in lesson_points.items():
+        created = increment_points(StudentLessonPoints, amount, student_id=student_id, lesson_session_id=session_id)
+        if not created:
+            gradebook.add_qr_points(
+                LessonSession(id=session_id, classroom_id=session_classrooms[session_id]), student_id, amount
+            )
+
+    for (student_id, classroom_id), amount in class_points.items():
+        increment_points(StudentClassPoints, amount, student_id=student_id, classroom_id=classroom_id)
+
+    for qr_code_id, count in qr_code_counts.items():
+        # 最終使用日時は新しい場合のみ更新する（オフラインの古いスキャンで戻さない）
+        StudentQRCode.objects.filter(pk=qr_code_id).update(
+            scan_count=F('scan_count') + count,
+            last_used_at=Case(
+                When(last_used_at__gte=last_scanned[qr_code_id], then=F('last_used_at')),
+                default=Value(last_scanned[qr_code_id]),
+            ),
+        )
+
+    for teacher_id, count in teacher_counts.items():
+        increment_counter(TeacherScanTotal, 'scan_count', count, teacher_id=teacher_id)
+    for classroom_id, count in classroom_counts.items():
+        increment_counter(ClassScanTotal, 'scan_count', count, classroom_id=classroom_id)
+
+
+def record_scan_batch(scanned_by, scans, points=1):
+    """まとめて送信されたスキャンを一括で登録する（オフライン記録の取り込み用）
+
+    scans は {'qr_code', 'lesson_session', 'classroom', 'scanned_at', 'client_scan_id'} の辞書のリスト。
+    スキャン履歴は bulk_create で作成し、ポイント・スキャン数は学生（QRコード・クラス）ごとに
+    合計してから1回ずつ加算する。作成したスキャン履歴のリストを返す。
+    """
+    if not scans:
+        return []
+
+    deferred = deferred_points_enabled()
+    with transaction.atomic():
+        created_scans = QRCodeScan.objects.bulk_create([
+            QRCodeScan(
+                qr_code=item['qr_code'],
+                scanned_by=scanned_by,
+                lesson_session=item['lesson_session'],
+                classroom=item['classroom'],
+                points_awarded=points,
+                scanned_at=item['scanned_at'],
+                client_scan_id=item['client_scan_id'],
+                points_pending=deferred,
+            )
+            for item in scans
+        ])
+
+        if not deferred:
+            _apply_scan_totals(
+                {
+                    'qr_code_id': scan.qr_code_id,
+                    'student_id': scan.qr_code.student_id,
+                    'scanned_by_id': scan.scanned_by_id,
+                    'lesson_session_id': scan.lesson_session_id,
+                    'classroom_id': scan.classroom_id,
+                    'points': scan.points_awarded,
+                    'count': 1,
+                    'last_scanned_at': scan.scanned_at,
+                }
+                for scan in created_scans
+            )
+
+    return created_scans
+
+
+def compact_scan_log(batch_size=1000):
+    """ポイント未反映のスキャンをポイント・スキャン数に反映する。反映したスキャン数を返す
+
+    開始時点の未反映スキャンの最大IDまでを、ID順に batch_size 件ずつ
+    1つのトランザクションで集計（GROUP BY）・反映し、未反映フラグを下ろす。
+    スキャンIDはコミット順に並ぶとは限らないため、対象は最大IDより後ろではなく未反映フラグで選ぶ。
+    """
+    high_water_mark = QRCodeScan.objects.filter(points_pending=True).aggregate(max_id=Max('id'))['max_id']
+    if high_water_mark is None:
+        return 0
+
+    total = 0
+    while True:
+        with transaction.atomic():
+            # 反映状況の行をロックし、圧縮処理・クラスポイントの上書きと同時に実行されないようにする
+            cursor = _lock_compaction()
+
+            scan_ids = list(
+                QRCodeScan.objects.filter(points_pending=True, id__lte=high_water_mark)
+                .order_by('id').values_list('id', flat=True)[:batch_size]
+            )
+            if not scan_ids:
+                return total
+
+            rows = (
+                QRCodeScan.objects.filter(id__in=scan_ids).order_by()
+                .values('qr_code_id', 'scanned_by_id', 'lesson_session_id', 'classroom_id', student_id=F('qr_code__student_id'))
+                .annotate(points=Sum('points_awarded'), count=Count('id'), last_scanned_at=Max('scanned_at'))
+            )
+            _apply_scan_totals(rows)
+            QRCodeScan.objects.filter(id__in=scan_ids).update(points_pending=False)
+
+            cursor.last_scan_id = max(cursor.last_scan_id, scan_ids[-1])
+            cursor.compacted_count += len(scan_ids)
+            cursor.save()
+            total += len(scan_ids)
+
+
+def rebuild_scan_counters():
+    """スキャン履歴からスキャン数を集計し直す（不整合の修復用）
+
+    クラス別の累計はスキャンでクラスポイントを付与したクラスに計上する。
+    アーカイブ済みのスキャンは ArchivedScanTotal の集計を加える。
+    """
+    def counts(field):
+        # 未反映のスキャンは compact_scan_log で加算されるため数えない
+        live = QRCodeScan.objects.filter(points_pending=False, **{f'{field}__isnull': False}).order_by()
+        archived = ArchivedScanTotal.objects.order_by()
+        result = Counter(dict(live.values(field).annotate(count=Count('id')).values_list(field, 'count')))
+        result.update(dict(archived.values(field).annotate(count=Sum('scan_count')).values_list(field, 'count')))
+        return result
+
+    with transaction.atomic():
+        qr_counts = counts('qr_code_id')
+        qr_codes = list(StudentQRCode.objects.only('id', 'scan_count'))
+        for qr_code in qr_codes:
+            qr_code.scan_count = qr_counts.get(qr_code.id, 0)
+        StudentQRCode.objects.bulk_update(qr_codes, ['scan_count'], batch_size=500)
+
+        TeacherScanTotal.objects.all().delete()
+        TeacherScanTotal.objects.bulk_create([
+            TeacherScanTotal(teacher_id=teacher_id, scan_count=count)
+            for teacher_id, count in counts('scanned_by_id').items()
+        ])
+
+        ClassScanTotal.objects.all().delete()
+        ClassScanTotal.objects.bulk_create([
+            ClassScanTotal(classroom_id=classroom_id, scan_count=count)
+            for classroom_id, count in counts('classroom_id').items()
+        ])
+
+    return len(qr_codes)
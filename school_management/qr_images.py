@@ -0,0 +1,195 @@
+"""QRコード画像（PNG）の生成・キャッシュと一括エクスポート
+
+画像はエンコードする内容（スキャンURL）のハッシュをキーにキャッシュする。
+キャッシュは settings.CACHES の 'qr_images'（LRUで古いものから削除）を使用する。
+"""
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import io
+import os
+import tempfile
+import zipfile
+
+import qrcode
+from django.core.cache import caches
+from django.core.cache.backends.base import InvalidCacheBackendError
+from PIL import Image, ImageDraw, ImageFont
+
+from .models import StudentQRCode
+
+QR_IMAGE_CACHE = 'qr_images'
+
+# キャッシュにない画像がこの数以上ある場合はプロセスプールで並列生成する
+POOL_THRESHOLD = 8
+POOL_MAX_WORKERS = 4
+
+# PDFシートのレイアウト（A4・150dpi、3列×4行）
+PAGE_SIZE = (1240, 1754)
+SHEET_COLUMNS = 3
+SHEET_ROWS = 4
+SHEET_MARGIN = 60
+QR_SIZE = 330
+
+
+def _cache():
+    try:
+        return caches[QR_IMAGE_CACHE]
+    except InvalidCacheBackendError:
+        return caches['default']
+
+
+def content_hash(data):
+    """エンコード内容のハッシュ（キャッシュキー・ETagに使用）"""
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+def _cache_key(data):
+    return f'qr:{content_hash(data)}'
+
+
+def render_qr_png(data):
+    """QRコード画像をPNGバイト列として生成する"""
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=qrcode.constants.ERROR_CORRECT_L,
+        box_size=10,
+        border=4,
+    )
+    qr.add_data(data)
+    qr.make(fit=True)
+
+    img = qr.make_image(fill_color="black", back_color="white")
+    buffer = io.BytesIO()
+    img.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def get_qr_png(data):
+    """キャッシュ済みのPNGを返す。なければ生成してキャッシュする"""
+    cache = _cache()
+    key = _cache_key(data)
+    png = cache.get(key)
+    if png is None:
+        png = render_qr_png(data)
+        cache.set(key, png)
+    return png
+
+
+def get_qr_pngs(data_list):
+    """複数のPNGをまとめて取得する（{data: png}）
+
+    キャッシュにないものは件数が多ければプロセスプールで並列に生成する。
+    """
+    cache = _cache()
+    keys = {data: _cache_key(data) for data in data_list}
+    cached = cache.get_many(keys.values())
+    pngs = {data: cached[key] for data, key in keys.items() if key in cached}
+
+    missing = [data for data in keys if data not in pngs]
+    if len(missing) >= POOL_THRESHOLD:
+        workers = min(POOL_MAX_WORKERS, os.cpu_count() or 1, len(missing))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            rendered = list(executor.map(render_qr_png, missing))
+    else:
+        rendered = [render_qr_png(data) for data in missing]
+
+    new_pngs = dict(zip(missing, rendered))
+    if new_pngs:
+        cache.set_many({keys[data]: png for data, png in new_pngs.items()})
+    pngs.update(new_pngs)
+    return pngs
+
+
+def ensure_qr_codes(students):
+    """学生ごとのQRコードをまとめて取得し、ないものは一括作成する（{student_id: StudentQRCode}）"""
+    student_ids = [student.id for student in students]
+    qr_codes = {}
+    for qr_code in StudentQRCode.objects.filter(student_id__in=student_ids).order_by('id'):
+        qr_codes.setdefault(qr_code.student_id, qr_code)
+
+    missing = [StudentQRCode(student_id=student_id, is_active=True) for student_id in student_ids if student_id not in qr_codes]
+    if missing:
+        StudentQRCode.objects.bulk_create(missing)
+        for qr_code in missing:
+            qr_codes[qr_code.student_id] = qr_code
+    return qr_codes
+
+
+def sheet_label(student):
+    """PDFシートに表示するラベル（学籍番号）"""
+    return student.student_number or str(student.id)
+
+
+def zip_entry_name(student):
+    """ZIP内のファイル名"""
+    return f'{student.student_number or student.id}_{student.full_name}.png'
+
+
+def _label_font():
+    try:
+        return ImageFont.load_default(size=28)
+    except TypeError:
+        return ImageFont.load_default()
+
+
+def write_sheet_pdf(items, fp):
+    """QRコードを並べた複数ページのPDFを書き出す
+
+    items は (ラベル, PNGバイト列) のリスト。ラベルは学籍番号など。
+    """
+    per_page = SHEET_COLUMNS * SHEET_ROWS
+    cell_width = (PAGE_SIZE[0] - SHEET_MARGIN * 2) // SHEET_COLUMNS
+    cell_height = (PAGE_SIZE[1] - SHEET_MARGIN * 2) // SHEET_ROWS
+    font = _label_font()
+
+    pages = []
+    for start in range(0, max(len(items), 1), per_page):
+        page = Image.new('RGB', PAGE_SIZE, 'white')
+        draw = ImageDraw.Draw(page)
+        for index, (label, png) in enumerate(items[start:start + per_page]):
+            column, row = index % SHEET_COLUMNS, index // SHEET_COLUMNS
+            left = SHEET_MARGIN + column * cell_width
+            top = SHEET_MARGIN + row * cell_height
+            qr_image = Image.open(io.BytesIO(png)).convert('RGB').resize((QR_SIZE, QR_SIZE), Image.NEAREST)
+            page.paste(qr_image, (left + (cell_width - QR_SIZE) // 2, top))
+            draw.text((left + cell_width // 2, top + QR_SIZE + 10), label, fill='black', font=font, anchor='ma')
+        pages.append(page)
+
+    pages[0].save(fp, format='PDF', save_all=True, append_images=pages[1:], resolution=150)
+
+
+def sheet_pdf_file(items):
+    """PDFを一時ファイルに書き出して返す（レスポンスでチャンクごとに送信するため）"""
+    fp = tempfile.TemporaryFile()
+    write_sheet_pdf(items, fp)
+    fp.seek(0)
+    return fp
+
+
+class _ChunkBuffer:
+    """ZipFileの書き込み先。書き込まれたデータを取り出してストリーミングする"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def iter_zip(files):
+    """(ファイル名, バイト列) のリストからZIPをチャンク単位で生成する"""
+    buffer = _ChunkBuffer()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED) as archive:
+        for name, data in files:
+            archive.writestr(name, data)
+            yield buffer.pop()
+    yield buffer.pop()
@@ -0,0 +1,67 @@
+"""署名付きQRコード
+
+QRコードのURLにQRコードの行ID・学生ID・クラスIDと HMAC 署名を含めておき、
+スキャン時に StudentQRCode を検索せずに検証・振り分けできるようにする。
+無効化・削除されたQRコードは、キャッシュした有効なQRコードIDの集合に含まれないことで弾く。
+
+有効なIDの集合は QR_DENY_LIST_TTL 秒でキャッシュから消える。変更したプロセスではコミット時に
+すぐ作り直すが、既定のキャッシュはプロセスごとの LocMemCache のため、他のプロセス（他のワーカー・
+ジョブのワーカー・シェル）での無効化・削除が反映されるまでは最大 QR_DENY_LIST_TTL 秒かかる。
+すぐに反映させる場合は共有キャッシュ（Redis など）を default に設定する。
+"""
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import StudentQRCode
+
+SIGNING_SALT = 'school_management.qr_scan'
+DENY_LIST_KEY = 'qr_tokens:active_ids'
+
+_signer = signing.Signer(salt=SIGNING_SALT)
+
+
+def make_scan_token(qr_code, class_id=None):
+    """「QRコードID.学生ID.クラスID:署名」形式のトークンを作成する（クラス指定なしは0）"""
+    return _signer.sign(f'{qr_code.pk}.{qr_code.student_id}.{int(class_id or 0)}')
+
+
+def read_scan_token(token):
+    """トークンを検証して (QRコードID, 学生ID, クラスID or None) を返す
+
+    署名が一致しない・形式が不正な場合は signing.BadSignature を送出する。
+    """
+    value = _signer.unsign(token)
+    try:
+        qr_code_id, student_id, class_id = (int(part) for part in value.split('.'))
+    except ValueError:
+        raise signing.BadSignature('QRコードのトークン形式が不正です')
+    return qr_code_id, student_id, class_id or None
+
+
+def active_qr_code_ids():
+    """有効なQRコードIDの集合（キャッシュになければDBから作成する）"""
+    active = cache.get(DENY_LIST_KEY)
+    if active is None:
+        active = frozenset(StudentQRCode.objects.filter(is_active=True).values_list('id', flat=True))
+        cache.set(DENY_LIST_KEY, active, settings.QR_DENY_LIST_TTL)
+    return active
+
+
+def is_revoked(qr_code_id):
+    """QRコードが無効化・削除されていればTrue
+
+    キャッシュ作成後に追加されたQRコードは集合に含まれないため、その場合のみDBで確認する。
+    """
+    if qr_code_id in active_qr_code_ids():
+        return False
+    if StudentQRCode.objects.filter(pk=qr_code_id, is_active=True).exists():
+        cache.delete(DENY_LIST_KEY)
+        return False
+    return True
+
+
+def invalidate_deny_list():
+    """QRコードの追加・有効/無効の変更・削除時に有効なIDの集合を作り直させる（コミット後に実行）"""
+    transaction.on_commit(lambda: cache.delete(DENY_LIST_KEY))
@@ -0,0 +1,71 @@
+"""QRコードの連続スキャンの抑止
+
+スキャナーアプリは同じQRコードを1秒間に何度も読み取ることがあるため、
+同じ教員が同じQRコードを同じ授業回（またはクラス）で QR_SCAN_DEBOUNCE_SECONDS 秒以内に
+再度スキャンした場合は、キャッシュの確認だけで応答しDBには書き込まない。
+抑止した回数は日ごと（全体・教員別）にキャッシュで数える。
+キャッシュは settings.CACHES の 'scans' を使用する（default の件数上限で抑止キーが早く削除されないようにするため）。
+"""
+from datetime import date
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import InvalidCacheBackendError
+
+SCAN_CACHE = 'scans'
+
+# 抑止回数のキャッシュ保持時間（秒）
+SUPPRESSED_COUNT_TIMEOUT = 2 * 24 * 60 * 60
+
+
+def scan_cache():
+    """スキャン用のキャッシュ（'scans' が未設定の場合は default）"""
+    try:
+        return caches[SCAN_CACHE]
+    except InvalidCacheBackendError:
+        return caches['default']
+
+
+def _debounce_key(qr_code_id, teacher_id, lesson_session, classroom):
+    if lesson_session:
+        scope = f'session{lesson_session.id}'
+    elif classroom:
+        scope = f'class{classroom.id}'
+    else:
+        scope = 'none'
+    return f'scan_debounce:{qr_code_id}:{teacher_id}:{scope}'
+
+
+def _suppressed_key(day, teacher_id=None):
+    key = f'scan_debounce:suppressed:{day.isoformat()}'
+    return f'{key}:{teacher_id}' if teacher_id else key
+
+
+def _increment(key):
+    cache = scan_cache()
+    if cache.add(key, 1, SUPPRESSED_COUNT_TIMEOUT):
+        return
+    try:
+        cache.incr(key)
+    except ValueError:
+        # add と incr の間に期限切れになった場合
+        cache.add(key, 1, SUPPRESSED_COUNT_TIMEOUT)
+
+
+def should_record_scan(qr_code_id, teacher_id, lesson_session=None, classroom=None):
+    """スキャンを記録すべきならTrue、直前の同じスキャンの重複ならFalseを返す"""
+    window = settings.QR_SCAN_DEBOUNCE_SECONDS
+    if window <= 0:
+        return True
+    if scan_cache().add(_debounce_key(qr_code_id, teacher_id, lesson_session, classroom), 1, window):
+        return True
+
+    today = date.today()
+    _increment(_suppressed_key(today))
+    _increment(_suppressed_key(today, teacher_id))
+    return False
+
+
+def suppressed_scan_count(teacher_id=None, day=None):
+    """抑止した重複スキャンの回数（teacher_id 省略時は全体）"""
+    return scan_cache().get(_suppressed_key(day or date.today(), teacher_id), 0)
@@ -0,0 +1,104 @@
+"""ポイント未反映のスキャンログの参照
+
+QR_SCAN_DEFERRED_POINTS が有効な場合、スキャン時は QRCodeScan を追加するだけで、
+ポイント・スキャン数は ``manage.py compact_scan_log`` で後からまとめて反映する。
+表示する値は反映済みの値に未反映分（points_pending=True のスキャン）を合算して求める。
+"""
+from django.conf import settings
+from django.db.models import Count, Sum
+
+from .models import GradebookEntry, LessonSession, QRCodeScan, StudentLessonPoints
+
+
+def deferred_points_enabled():
+    return settings.QR_SCAN_DEFERRED_POINTS
+
+
+def _pending_scans():
+    return QRCodeScan.objects.filter(points_pending=True).order_by()
+
+
+def pending_class_points(classroom_ids, student_ids=None):
+    """未反映のクラスポイント {(学生ID, クラスID): ポイント}"""
+    if not deferred_points_enabled():
+        return {}
+    scans = _pending_scans().filter(classroom_id__in=classroom_ids)
+    if student_ids is not None:
+        scans = scans.filter(qr_code__student_id__in=student_ids)
+    rows = scans.values('qr_code__student_id', 'classroom_id').annotate(points=Sum('points_awarded'))
+    return {(row['qr_code__student_id'], row['classroom_id']): row['points'] for row in rows}
+
+
+def pending_lesson_points(classroom_ids, student_ids=None):
+    """クラスの授業回の未反映ポイント {(学生ID, 授業回ID): ポイント}"""
+    if not deferred_points_enabled():
+        return {}
+    scans = _pending_scans().filter(classroom_id__in=classroom_ids, lesson_session__isnull=False)
+    if student_ids is not None:
+        scans = scans.filter(qr_code__student_id__in=student_ids)
+    rows = scans.values('qr_code__student_id', 'lesson_session_id').annotate(points=Sum('points_awarded'))
+    return {(row['qr_code__student_id'], row['lesson_session_id']): row['points'] for row in rows}
+
+
+def pending_scan_counts(field, ids):
+    """未反映のスキャン数 {ID: 件数}（field は qr_code_id / scanned_by_id / classroom_id）"""
+    if not deferred_points_enabled():
+        return {}
+    rows = _pending_scans().filter(**{f'{field}__in': ids}).values(field).annotate(count=Count('id'))
+    return {row[field]: row['count'] for row in rows}
+
+
+def merge_pending_points(classroom, lesson_points_map, class_points_map):
+    """クラスのポイント表示用データに未反映のスキャン分を合算する
+
+    lesson_points_map は {学生ID: [GradebookEntry, ...]}、class_points_map は {学生ID: ポイント}。
+    成績簿の行がまだない授業回は保存しない GradebookEntry を追加する。
+    授業回ごとのポイントに未反映分を合算した場合はTrueを返す。
+    """
+    pending_lessons = pending_lesson_points([classroom.id])
+    pending_classes = pending_class_points([classroom.id])
+    if not pending_lessons and not pending_classes:
+        return False
+
+    entries = {
+        (entry.student_id, entry.lesson_session_id): entry
+        for student_entries in lesson_points_map.values()
+        for entry in student_entries
+    }
+    missing_session_ids = {key[1] for key in pending_lessons if key not in entries}
+    sessions = LessonSession.objects.in_bulk(missing_session_ids) if missing_session_ids else {}
+    for (student_id, session_id), points in pending_lessons.items():
+        entry = entries.get((student_id, session_id))
+        if entry:
+            entry.qr_points += points
+            continue
+        lesson_points_map.setdefault(student_id, []).append(GradebookEntry(
+            classroom=classroom, student_id=student_id, lesson_session=sessions[session_id],
+            qr_points=points, has_lesson_points=True,
+        ))
+    for student_entries in lesson_points_map.values():
+        student_entries.sort(key=lambda entry: entry.lesson_session.session_number)
+
+    for (student_id, _), points in pending_classes.items():
+        class_points_map[student_id] = class_points_map.get(student_id, 0) + points
+    return bool(pending_lessons)
+
+
+def merge_pending_lesson_points(student_id, classroom_ids, lesson_points):
+    """学生の授業回ポイント（StudentLessonPoints のリスト）に未反映のスキャン分を合算する
+
+    行がまだない授業回は保存しない StudentLessonPoints を追加し、授業日の新しい順に並べて返す。
+    """
+    pending = pending_lesson_points(classroom_ids, [student_id])
+    if not pending:
+        return lesson_points
+
+    rows = {row.lesson_session_id: row for row in lesson_points}
+    missing_session_ids = [session_id for (_, session_id) in pending if session_id not in rows]
+    sessions = LessonSession.objects.select_related('classroom').in_bulk(missing_session_ids) if missing_session_ids else {}
+    for (_, session_id), points in pending.items():
+        row = rows.get(session_id)
+        if row is None:
+            row = rows[session_id] = StudentLessonPoints(student_id=student_id, lesson_session=sessions[session_id], points=0)
+        row.points += points
+    return sorted(rows.values(), key=lambda row: row.lesson_session.date, reverse=True)
@@ -0,0 +1,93 @@
+"""QRコードスキャン時の対象クラス・授業回の解決
+
+スキャンのたびに「指定クラスの担当確認」と「今日の授業回の検索」を行うと、
+連続スキャン中は同じ結果を何百回も問い合わせることになる。
+教員・クラス・日付ごとに解決結果をキャッシュし、授業回の作成・編集や
+担当教員の変更時に教員単位のバージョンを更新して無効化する。
+キャッシュは scan_debounce と同じ 'scans' を使用する。
+
+'scans' がプロセスごとのキャッシュ（LocMemCache）の場合、バージョン更新は授業回を作成・編集した
+プロセスにしか届かない。他の Web ワーカーが古い結果を使い続けないよう、授業回が見つからなかった結果は
+キャッシュせず、見つかった結果も RESOLVER_CACHE_TIMEOUT 秒（連続スキャン1回分程度）で期限切れにする。
+すぐに反映させるには 'scans' に共有キャッシュを設定する。
+"""
+from datetime import date
+import uuid
+
+from django.db import transaction
+
+from .models import ClassRoom, LessonSession
+from .scan_debounce import scan_cache
+
+# 解決結果のキャッシュ保持時間（秒）。同じプロセス内の無効化はバージョン更新で行い、
+# 他のプロセスでの変更はこの秒数以内に反映される
+RESOLVER_CACHE_TIMEOUT = 5
+
+
+def _version_key(teacher_id):
+    return f'scan_session:version:{teacher_id}'
+
+
+def _resolved_key(teacher_id, class_id, day):
+    return f'scan_session:{teacher_id}:{class_id or "all"}:{day.isoformat()}'
+
+
+def bump_teacher_versions(teacher_ids):
+    """教員ごとの解決結果キャッシュを無効化する（コミット後に実行）"""
+    teacher_ids = list(teacher_ids)
+    if teacher_ids:
+        transaction.on_commit(
+            lambda: scan_cache().set_many({_version_key(teacher_id): uuid.uuid4().hex for teacher_id in teacher_ids}, None)
+        )
+
+
+def bump_classroom_teachers(classroom_id):
+    """クラスの担当教員全員の解決結果キャッシュを無効化する"""
+    if classroom_id:
+        bump_teacher_versions(
+            ClassRoom.teachers.through.objects.filter(classroom_id=classroom_id).values_list('customuser_id', flat=True)
+        )
+
+
+def _lookup_scan_target(teacher, class_id, day):
+    """クラスと今日の授業回をDBから取得する"""
+    target_classroom = None
+    if class_id:
+        try:
+            target_classroom = ClassRoom.objects.get(id=class_id, teachers=teacher)
+        except (ClassRoom.DoesNotExist, ValueError):
+            pass
+
+    if target_classroom:
+        # 指定されたクラスの今日の授業セッション
+        sessions = LessonSession.objects.filter(classroom=target_classroom, date=day)
+    else:
+        # すべての担当クラスから今日の授業セッション
+        sessions = LessonSession.objects.filter(classroom__teachers=teacher, date=day)
+    current_session = sessions.select_related('classroom').order_by('-created_at').first()
+    return target_classroom, current_session
+
+
+def resolve_scan_target(teacher, class_id=None):
+    """スキャンを計上するクラス（class_id の指定があれば）と今日の授業回を返す
+
+    (指定クラス or None, 今日の授業回 or None) のタプル。キャッシュにあればDBを参照しない。
+    授業回が見つからなかった場合は、他のプロセスで作成された授業回をすぐに使えるようキャッシュしない。
+    """
+    day = date.today()
+    version_key = _version_key(teacher.id)
+    resolved_key = _resolved_key(teacher.id, class_id, day)
+    cache = scan_cache()
+    cached = cache.get_many([version_key, resolved_key])
+
+    version = cached.get(version_key)
+    if version is None:
+        version = uuid.uuid4().hex
+        cache.set(version_key, version, None)
+    elif resolved_key in cached and cached[resolved_key][0] == version:
+        return cached[resolved_key][1]
+
+    resolved = _lookup_scan_target(teacher, class_id, day)
+    if resolved[1] is not None:
+        cache.set(resolved_key, (version, resolved), RESOLVER_CACHE_TIMEOUT)
+    return resolved
@@ -0,0 +1,151 @@
+"""元データの変更に合わせて集計を更新するシグナル
+
+成績簿（GradebookEntry）・現在の小テスト得点（CurrentQuizScore）の差分更新と、
+ピア評価結果・スキャン対象授業回・有効なQRコードIDのキャッシュの無効化を行う。
+"""
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from . import gradebook
+from .grading import refresh_current_scores
+from .models import (
+    ClassRoom, ContributionEvaluation, GradebookEntry, Group, GroupMember, LessonSession, PeerEvaluation, Quiz,
+    QuizScore, StudentLessonPoints, StudentQRCode,
+)
+from .peer_results import bump_results_version
+from .qr_tokens import invalidate_deny_list
+from .scan_sessions import bump_classroom_teachers, bump_teacher_versions
+
+
+@receiver(post_save, sender=StudentLessonPoints)
+def lesson_points_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    gradebook.refresh_entries(instance.lesson_session_id, [instance.student_id])
+
+
+@receiver(post_delete, sender=StudentLessonPoints)
+def lesson_points_deleted(sender, instance, **kwargs):
+    gradebook.refresh_entries(instance.lesson_session_id, [instance.student_id], create=False)
+
+
+def _quiz_session_id(quiz_id):
+    return Quiz.objects.filter(id=quiz_id).values_list('lesson_session_id', flat=True).first()
+
+
+@receiver(post_save, sender=QuizScore)
+def quiz_score_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    refresh_current_scores(instance.quiz_id, [instance.student_id])
+    gradebook.refresh_entries(_quiz_session_id(instance.quiz_id), [instance.student_id])
+
+
+@receiver(post_delete, sender=QuizScore)
+def quiz_score_deleted(sender, instance, **kwargs):
+    refresh_current_scores(instance.quiz_id, [instance.student_id])
+    gradebook.refresh_entries(_quiz_session_id(instance.quiz_id), [instance.student_id], create=False)
+
+
+@receiver(post_save, sender=Quiz)
+@receiver(post_delete, sender=Quiz)
+def quiz_changed(sender, instance, raw=False, created=False, **kwargs):
+    # 授業回の「最初の小テスト」が変わる可能性があるため既存の行を更新する
+    if raw or created:
+        return
+    student_ids = GradebookEntry.objects.filter(
+        lesson_session_id=instance.lesson_session_id
+    ).values_list('student_id', flat=True)
+    gradebook.refresh_entries(instance.lesson_session_id, student_ids, create=False)
+
+
+@receiver(post_save, sender=PeerEvaluation)
+def peer_evaluation_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    gradebook.refresh_session(instance.lesson_session_id)
+
+
+@receiver(post_delete, sender=PeerEvaluation)
+def peer_evaluation_deleted(sender, instance, **kwargs):
+    gradebook.refresh_session(instance.lesson_session_id, create=False)
+
+
+def _group_session_id(group_id):
+    return Group.objects.filter(id=group_id).values_list('lesson_session_id', flat=True).first()
+
+
+@receiver(post_save, sender=GroupMember)
+def group_member_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    gradebook.refresh_entries(_group_session_id(instance.group_id), [instance.student_id])
+
+
+@receiver(post_delete, sender=GroupMember)
+def group_member_deleted(sender, instance, **kwargs):
+    gradebook.refresh_entries(_group_session_id(instance.group_id), [instance.student_id], create=False)
+
+
+@receiver(post_save, sender=LessonSession)
+def lesson_session_saved(sender, instance, raw=False, created=False, **kwargs):
+    # ピア評価の有無が変わるとピア評価スコアが変わる
+    if raw or created:
+        return
+    gradebook.refresh_session(instance.id)
+
+
+@receiver(post_save, sender=PeerEvaluation)
+@receiver(post_delete, sender=PeerEvaluation)
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def peer_results_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    bump_results_version(instance.lesson_session_id)
+
+
+@receiver(post_save, sender=ContributionEvaluation)
+@receiver(post_delete, sender=ContributionEvaluation)
+def contribution_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    bump_results_version(
+        PeerEvaluation.objects.filter(id=instance.peer_evaluation_id).values_list('lesson_session_id', flat=True).first()
+    )
+
+
+@receiver(post_save, sender=GroupMember)
+@receiver(post_delete, sender=GroupMember)
+def group_member_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    bump_results_version(_group_session_id(instance.group_id))
+
+
+@receiver(post_save, sender=LessonSession)
+@receiver(post_delete, sender=LessonSession)
+def lesson_session_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    bump_classroom_teachers(instance.classroom_id)
+
+
+@receiver(m2m_changed, sender=ClassRoom.teachers.through)
+def classroom_teachers_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    # 担当クラスが変わると、その教員のスキャン対象クラス・授業回が変わる
+    if reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            bump_teacher_versions([instance.pk])
+    elif action == 'pre_clear':
+        bump_classroom_teachers(instance.pk)
+    elif action in ('post_add', 'post_remove'):
+        bump_teacher_versions(pk_set)
+
+
+@receiver(post_save, sender=StudentQRCode)
+@receiver(post_delete, sender=StudentQRCode)
+def qr_code_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    invalidate_deny_list()
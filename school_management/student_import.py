@@ -0,0 +1,140 @@
+"""学生の一括登録処理
+
+CSVの各行を検証したうえで、重複チェックをまとめて行い、
+ユーザー・クラス所属・クラスポイントを bulk_create で一括作成する。
+"""
+from concurrent.futures import ProcessPoolExecutor
+import os
+
+from django.contrib.auth.base_user import BaseUserManager
+from django.contrib.auth.hashers import make_password
+from django.db import IntegrityError, transaction
+
+from .models import ClassRoom, CustomUser, StudentClassPoints
+
+# パスワードがこの件数以上ある場合はプロセスプールでハッシュ化する
+HASH_POOL_THRESHOLD = 8
+HASH_POOL_MAX_WORKERS = 4
+
+
+class StudentRow:
+    """一括登録の1行分のデータ"""
+
+    def __init__(self, line_num, student_number, full_name, furigana='', email=None):
+        self.line_num = line_num
+        self.student_number = student_number
+        self.full_name = full_name
+        self.furigana = furigana
+        self.email = BaseUserManager.normalize_email(email) if email else None
+
+
+def parse_student_lines(text, columns, required, separators=(',',)):
+    """入力テキストを StudentRow のリストに変換する（rows, errors）
+
+    columns は各列に対応する StudentRow の引数名。先頭 required 列は必須。
+    errors は (行番号, メッセージ) のリスト。
+    """
+    rows = []
+    errors = []
+    for line_num, line in enumerate(text.split('\n'), 1):
+        line = line.strip()
+        if not line:
+            continue
+
+        for separator in separators[1:]:
+            line = line.replace(separator, separators[0])
+        parts = [part.strip() for part in line.split(separators[0])]
+        if len(parts) < required or not all(parts[:required]):
+            errors.append((line_num, f'必要な項目が不足しています - {line}'))
+            continue
+
+        values = dict(zip(columns, parts))
+        rows.append(StudentRow(line_num, **values))
+    return rows, errors
+
+
+def hash_passwords(passwords):
+    """パスワードをまとめてハッシュ化する（件数が多い場合はプロセスプールで並列化）"""
+    if len(passwords) < HASH_POOL_THRESHOLD:
+        return [make_password(password) for password in passwords]
+    workers = min(HASH_POOL_MAX_WORKERS, os.cpu_count() or 1, len(passwords))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(make_password, passwords, chunksize=max(1, len(passwords) // (workers * 4))))
+
+
+def import_students(rows, password_for, classroom=None):
+    """学生を一括作成する（created_students, errors）
+
+    errors は (行番号, メッセージ) のリスト。
+    password_for は StudentRow を受け取り初期パスワードを返す関数。
+    classroom を指定した場合はクラスへの追加とクラスポイントの初期化も行う。
+    """
+    errors = []
+
+    # 既存データとの重複チェック（キーごとにIN句で1回ずつ）
+    numbers = {row.student_number for row in rows}
+    emails = {row.email for row in rows if row.email}
+    existing_numbers = set(
+        CustomUser.objects.filter(student_number__in=numbers).values_list('student_number', flat=True)
+    )
+    existing_emails = set(
+        CustomUser.objects.filter(email__in=emails).values_list('email', flat=True)
+    ) if emails else set()
+
+    valid_rows = []
+    for row in rows:
+        if row.student_number in existing_numbers:
+            errors.append((row.line_num, f'学籍番号 "{row.student_number}" は既に登録されています'))
+            continue
+        if row.email and row.email in existing_emails:
+            errors.append((row.line_num, f'メールアドレス "{row.email}" は既に登録されています'))
+            continue
+        # 同じ入力内での重複も後の行をエラーにする
+        existing_numbers.add(row.student_number)
+        if row.email:
+            existing_emails.add(row.email)
+        valid_rows.append(row)
+
+    if not valid_rows:
+        return [], errors
+
+    hashed = hash_passwords([password_for(row) for row in valid_rows])
+    students = [
+        CustomUser(
+            email=row.email,
+            full_name=row.full_name,
+            furigana=row.furigana,
+            student_number=row.student_number,
+            role='student',
+            password=password,
+        )
+        for row, password in zip(valid_rows, hashed)
+    ]
+
+    try:
+        with transaction.atomic():
+            CustomUser.objects.bulk_create(students)
+            if classroom is not None:
+                Membership = ClassRoom.students.through
+                Membership.objects.bulk_create(
+                    [Membership(classroom_id=classroom.id, customuser_id=student.id) for student in students],
+                    ignore_conflicts=True,
+                )
+                StudentClassPoints.objects.bulk_create(
+                    [StudentClassPoints(student=student, classroom=classroom, points=0) for student in students],
+                    ignore_conflicts=True,
+                )
+    except IntegrityError:
+        # チェック後に他の登録と競合した場合は全件を取り消して報告する
+        errors.extend(
+            (row.line_num, f'データの重複により登録できませんでした（学籍番号 "{row.student_number}"）')
+            for row in valid_rows
+        )
+        return [], errors
+
+    return students, errors
+
+
+def format_errors(errors):
+    """(行番号, メッセージ) のリストを行番号順の表示用文字列にする"""
+    return [f'行{line_num}: {message}' for line_num, message in sorted(errors, key=lambda error: error[0])]
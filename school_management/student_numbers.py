@@ -0,0 +1,45 @@
+"""学籍番号の重複検出と解消
+
+一意制約（unique_student_number）の追加前に既存データの重複を解消するために使う。
+マイグレーション 0020 は同じ処理を固定したコピーを持つため、ここを変更してもマイグレーションには影響しない。
+"""
+from django.db.models import Count
+
+
+def find_duplicate_student_numbers(user_model):
+    """重複している学籍番号ごとのユーザー一覧 {学籍番号: [ユーザー, ...]}
+
+    各一覧は残すユーザーが先頭になるよう並べる（学生ロール優先、次に登録の古い順）。
+    """
+    numbers = (
+        user_model.objects.exclude(student_number='')
+        .values('student_number')
+        .annotate(count=Count('id'))
+        .filter(count__gt=1)
+        .values_list('student_number', flat=True)
+    )
+    duplicates = {}
+    users = user_model.objects.filter(student_number__in=list(numbers)).order_by('student_number', 'id')
+    for user in users:
+        duplicates.setdefault(user.student_number, []).append(user)
+    for group in duplicates.values():
+        group.sort(key=lambda user: (user.role != 'student', user.id))
+    return duplicates
+
+
+def renamed_student_number(student_number, user_id, max_length=20):
+    """重複したユーザーに付け直す学籍番号（末尾にユーザーIDを付加）"""
+    suffix = f'-{user_id}'
+    return student_number[:max_length - len(suffix)] + suffix
+
+
+def resolve_duplicate_student_numbers(user_model, apply=False):
+    """先頭のユーザー以外の学籍番号を付け直す。変更内容 [(ユーザー, 旧番号, 新番号)] を返す"""
+    changes = []
+    for student_number, users in find_duplicate_student_numbers(user_model).items():
+        for user in users[1:]:
+            new_number = renamed_student_number(student_number, user.id)
+            changes.append((user, student_number, new_number))
+            if apply:
+                user_model.objects.filter(pk=user.pk).update(student_number=new_number)
+    return changes
@@ -0,0 +1,96 @@
+from datetime import date
+import io
+
+from django.core.management import CommandError, call_command
+from django.test import TestCase, Client
+from django.urls import reverse
+from school_management.archive import decode_rows, term_is_over
+from school_management.models import (
+    CustomUser, ClassRoom, CurrentQuizScore, LessonSession, Quiz, QuizScore, StudentQRCode, QRCodeScan, ArchiveChunk,
+    ArchivedScanTotal, StudentClassPoints, GradebookEntry, TeacherScanTotal, ClassScanTotal,
+)
+from school_management.points import rebuild_scan_counters, record_scan
+
+
+class HistoryArchiveTest(TestCase):
+    def setUp(self):
+        self.teacher = CustomUser.objects.create_user(email='t@example.com', full_name='T', password='tpass', role='teacher')
+        self.student = CustomUser.objects.create_user(email='s@example.com', full_name='S', password='spass', role='student', student_number='S1')
+        self.old_class = ClassRoom.objects.create(class_name='Old', year=2024, semester='first')
+        self.new_class = ClassRoom.objects.create(class_name='New', year=2025, semester='first')
+        for classroom in (self.old_class, self.new_class):
+            classroom.teachers.add(self.teacher)
+            classroom.students.add(self.student)
+        self.old_session = LessonSession.objects.create(classroom=self.old_class, session_number=1, date=date(2024, 5, 1))
+        self.qr_code = StudentQRCode.objects.create(student=self.student)
+        for _ in range(3):
+            record_scan(self.qr_code, self.teacher, lesson_session=self.old_session, classroom=self.old_class)
+        record_scan(self.qr_code, self.teacher, classroom=self.new_class)
+
+        self.quiz = Quiz.objects.create(lesson_session=self.old_session, quiz_name='Q1', max_score=10)
+        QuizScore.objects.create(quiz=self.quiz, student=self.student, score=3, graded_by=self.teacher, is_cancelled=True)
+        QuizScore.objects.create(quiz=self.quiz, student=self.student, score=7, graded_by=self.teacher)
+
+    def archive(self, **options):
+        call_command('archive_history', year=2024, batch_size=2, stdout=io.StringIO(), **options)
+
+    def test_archives_closed_term_in_chunks(self):
+        gradebook_before = GradebookEntry.objects.get(student=self.student, lesson_session=self.old_session).qr_points
+        self.archive()
+
+        self.assertEqual(list(QRCodeScan.objects.values_list('classroom_id', flat=True)), [self.new_class.id])
+        chunks = ArchiveChunk.objects.filter(kind='qr_scans').order_by('first_id')
+        self.assertEqual([chunk.row_count for chunk in chunks], [2, 1])
+        rows = [row for chunk in chunks for row in decode_rows(chunk.data)]
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[0]['classroom_id'], self.old_class.id)
+
+        # 有効な得点は残し、取り消し済みの得点だけをアーカイブする
+        self.assertEqual(list(QuizScore.objects.values_list('score', flat=True)), [7])
+        quiz_chunk = ArchiveChunk.objects.get(kind='quiz_scores')
+        self.assertEqual(decode_rows(quiz_chunk.data)[0]['score'], 3)
+
+        total = ArchivedScanTotal.objects.get(qr_code=self.qr_code, classroom=self.old_class)
+        self.assertEqual((total.scan_count, total.points_awarded), (3, 3))
+        self.assertEqual(StudentClassPoints.objects.get(student=self.student, classroom=self.old_class).points, 3)
+        self.assertEqual(
+            GradebookEntry.objects.get(student=self.student, lesson_session=self.old_session).qr_points, gradebook_before
+        )
+
+    def test_history_totals_include_archived_scans(self):
+        self.archive()
+        client = Client()
+        client.force_login(self.teacher)
+        response = client.get(reverse('school_management:qr_code_detail', kwargs={'student_id': self.student.id}))
+        self.assertEqual(response.context['scan_count'], 4)
+        self.assertEqual(response.context['total_points'], 4)
+        self.assertEqual(response.context['archived_scan_count'], 3)
+
+        client.force_login(self.student)
+        response = client.get(reverse('school_management:student_qr_code'))
+        self.assertEqual(response.context['scan_count'], 4)
+
+    def test_rebuild_counters_after_archive(self):
+        self.archive()
+        rebuild_scan_counters()
+        self.qr_code.refresh_from_db()
+        self.assertEqual(self.qr_code.scan_count, 4)
+        self.assertEqual(TeacherScanTotal.objects.get(teacher=self.teacher).scan_count, 4)
+        self.assertEqual(ClassScanTotal.objects.get(classroom=self.old_class).scan_count, 3)
+
+    def test_archiving_keeps_current_score_pointer(self):
+        self.archive()
+        self.assertEqual(CurrentQuizScore.objects.get(quiz=self.quiz, student=self.student).quiz_score.score, 7)
+
+    def test_ongoing_term_is_rejected_without_force(self):
+        self.assertTrue(term_is_over(2024, 'first', today=date(2024, 10, 1)))
+        self.assertFalse(term_is_over(2024, 'first', today=date(2024, 9, 30)))
+        self.assertFalse(term_is_over(2024, None, today=date(2025, 3, 31)))
+        LessonSession.objects.create(classroom=self.old_class, session_number=2, date=date(2024, 10, 5))
+        self.assertFalse(term_is_over(2024, 'first', today=date(2024, 10, 1)))
+
+        current = date.today()
+        ClassRoom.objects.create(class_name='Now', year=current.year, semester='second')
+        with self.assertRaises(CommandError):
+            call_command('archive_history', year=current.year, stdout=io.StringIO())
+        call_command('archive_history', year=current.year, force=True, stdout=io.StringIO())
@@ -0,0 +1,161 @@
+from datetime import date
+import uuid
+
+from django.db import connection
+from django.test import TestCase, Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from school_management.models import (
+    CustomUser, ClassRoom, LessonSession, Quiz, QuizScore, Group, GroupMember,
+    PeerEvaluation, ContributionEvaluation, StudentClassPoints, StudentLessonPoints,
+)
+
+
+class ClassEvaluationViewTest(TestCase):
+    def setUp(self):
+        self.teacher = CustomUser.objects.create_user(email='t@example.com', full_name='T', password='tpass', role='teacher')
+        self.classroom = ClassRoom.objects.create(class_name='C1', year=2025, semester='first')
+        self.classroom.teachers.add(self.teacher)
+        self.student_count = 0
+        self.session_count = 0
+        self.client = Client()
+        self.client.force_login(self.teacher)
+
+    def add_students(self, n):
+        students = []
+        for _ in range(n):
+            self.student_count += 1
+            student = CustomUser.objects.create_user(
+                email=f's{self.student_count}@example.com', full_name=f'S{self.student_count}',
+                password='spass', role='student', student_number=f'S{self.student_count:03d}'
+            )
+            self.classroom.students.add(student)
+            students.append(student)
+        return students
+
+    def add_session(self, students):
+        """QRポイント・小テスト・ピア評価を含む授業回を作成"""
+        self.session_count += 1
+        session = LessonSession.objects.create(
+            classroom=self.classroom, session_number=self.session_count, date=date(2025, 4, self.session_count),
+            has_quiz=True, has_peer_evaluation=True
+        )
+        quiz = Quiz.objects.create(lesson_session=session, quiz_name='Q', max_score=10)
+        group_a = Group.objects.create(lesson_session=session, group_number=1)
+        group_b = Group.objects.create(lesson_session=session, group_number=2)
+        for i, student in enumerate(students):
+            StudentLessonPoints.objects.create(student=student, lesson_session=session, points=i + 1)
+            QuizScore.objects.create(quiz=quiz, student=student, score=i, graded_by=self.teacher)
+            GroupMember.objects.create(group=group_a if i % 2 == 0 else group_b, student=student)
+        evaluation = PeerEvaluation.objects.create(
+            lesson_session=session, evaluator_token=uuid.uuid4(), evaluator_group=group_b,
+            first_place_group=group_a, second_place_group=group_b
+        )
+        ContributionEvaluation.objects.create(peer_evaluation=evaluation, evaluatee=students[0], contribution_score=4)
+        return session
+
+    def count_queries(self):
+        url = reverse('school_management:class_evaluation', kwargs={'class_id': self.classroom.id})
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries), response
+
+    def test_query_count_does_not_scale_with_roster(self):
+        students = self.add_students(2)
+        self.add_session(students)
+        small_count, _ = self.count_queries()
+
+        students += self.add_students(10)
+        self.add_session(students)
+        self.add_session(students)
+        large_count, _ = self.count_queries()
+
+        self.assertEqual(small_count, large_count)
+
+    def test_session_data_values(self):
+        students = self.add_students(2)
+        session = self.add_session(students)
+        _, response = self.count_queries()
+
+        evaluations = {e['student'].id: e for e in response.context['student_evaluations']}
+        first = evaluations[students[0].id]['session_data']['第1回']
+        second = evaluations[students[1].id]['session_data']['第1回']
+        # 1人目: グループA（1位1票=5点）、QR 1pt、小テスト0点
+        self.assertEqual(first['peer_score'], 5)
+        self.assertEqual(first['qr_points'], 1)
+        self.assertEqual(first['quiz_score'], 0)
+        self.assertTrue(first['has_quiz'])
+        # 2人目: グループB（2位1票=3点）、QR 2pt、小テスト1点
+        self.assertEqual(second['peer_score'], 3)
+        self.assertEqual(second['total_score'], 3 + 2 + 1)
+        self.assertEqual(response.context['session_peer_averages'][session.id], 4.0)
+
+
+class ClassPointsViewTest(TestCase):
+    def setUp(self):
+        self.teacher = CustomUser.objects.create_user(email='t@example.com', full_name='T', password='tpass', role='teacher')
+        self.classroom = ClassRoom.objects.create(class_name='C1', year=2025, semester='first')
+        self.classroom.teachers.add(self.teacher)
+        self.sessions = [
+            LessonSession.objects.create(classroom=self.classroom, session_number=i, date=date(2025, 4, i))
+            for i in (1, 2)
+        ]
+        self.students = []
+        self.client = Client()
+        self.client.force_login(self.teacher)
+
+    def add_student(self, *points):
+        number = len(self.students) + 1
+        student = CustomUser.objects.create_user(
+            email=f's{number}@example.com', full_name=f'S{number}',
+            password='spass', role='student', student_number=f'S{number:03d}'
+        )
+        self.classroom.students.add(student)
+        for session, value in zip(self.sessions, points):
+            StudentLessonPoints.objects.create(student=student, lesson_session=session, points=value)
+        self.students.append(student)
+        return student
+
+    def get(self):
+        url = reverse('school_management:class_points', kwargs={'class_id': self.classroom.id})
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries), response
+
+    def test_totals_rank_and_stats(self):
+        top = self.add_student(6, 4)
+        tied = self.add_student(5)
+        other_tied = self.add_student(3, 7)
+        absent = self.add_student()
+        StudentClassPoints.objects.create(student=top, classroom=self.classroom, points=10)
+
+        _, response = self.get()
+        grades = response.context['student_grades']
+        self.assertEqual(
+            [(g['student'].id, g['rank'], g['total_points'], g['session_count'], g['average_points']) for g in grades],
+            [(top.id, 1, 10, 2, 5.0), (tied.id, 1, 5, 1, 5.0), (other_tied.id, 1, 10, 2, 5.0), (absent.id, 4, 0, 0, 0)],
+        )
+        self.assertEqual(grades[0]['class_points'], 10)
+        self.assertIsNone(grades[1]['class_points'])
+        self.assertEqual([p.qr_points for p in grades[0]['lesson_points']], [6, 4])
+        self.assertEqual(grades[3]['grade_level'], '要努力')
+        self.assertEqual(response.context['class_stats'], {
+            'total_students': 4, 'class_average': 3.8, 'max_average': 5.0, 'min_average': 0.0,
+        })
+
+    def test_query_count_does_not_scale_with_roster(self):
+        self.add_student(1, 2)
+        small_count, _ = self.get()
+        for i in range(10):
+            self.add_student(i, i + 1)
+        large_count, response = self.get()
+        self.assertEqual(small_count, large_count)
+        self.assertEqual(response.context['student_grades'][0]['average_points'], 9.5)
+
+    def test_empty_class(self):
+        _, response = self.get()
+        self.assertEqual(response.context['class_stats'], {
+            'total_students': 0, 'class_average': 0, 'max_average': 0, 'min_average': 0,
+        })
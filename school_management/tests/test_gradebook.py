@@ -0,0 +1,86 @@
+from datetime import date
+from io import StringIO
+import uuid
+
+from django.core.management import call_command
+from django.test import TestCase
+from school_management.models import (
+    CustomUser, ClassRoom, LessonSession, Quiz, QuizScore, Group, GroupMember,
+    PeerEvaluation, StudentLessonPoints, GradebookEntry,
+)
+
+
+class GradebookTest(TestCase):
+    def setUp(self):
+        self.teacher = CustomUser.objects.create_user(email='t@example.com', full_name='T', password='tpass', role='teacher')
+        self.student = CustomUser.objects.create_user(email='s1@example.com', full_name='S1', password='spass', role='student', student_number='S001')
+        self.other = CustomUser.objects.create_user(email='s2@example.com', full_name='S2', password='spass', role='student', student_number='S002')
+        self.classroom = ClassRoom.objects.create(class_name='C1', year=2025, semester='first')
+        self.classroom.teachers.add(self.teacher)
+        self.classroom.students.add(self.student, self.other)
+        self.session = LessonSession.objects.create(
+            classroom=self.classroom, session_number=1, date=date(2025, 4, 1), has_quiz=True, has_peer_evaluation=True
+        )
+        self.quiz = Quiz.objects.create(lesson_session=self.session, quiz_name='Q', max_score=10)
+        self.group_a = Group.objects.create(lesson_session=self.session, group_number=1)
+        self.group_b = Group.objects.create(lesson_session=self.session, group_number=2)
+        GroupMember.objects.create(group=self.group_a, student=self.student)
+        GroupMember.objects.create(group=self.group_b, student=self.other)
+
+    def entry(self, student):
+        return GradebookEntry.objects.get(classroom=self.classroom, student=student, lesson_session=self.session)
+
+    def test_signals_update_entries(self):
+        StudentLessonPoints.objects.create(student=self.student, lesson_session=self.session, points=3)
+        QuizScore.objects.create(quiz=self.quiz, student=self.student, score=8, graded_by=self.teacher)
+        PeerEvaluation.objects.create(
+            lesson_session=self.session, evaluator_token=uuid.uuid4(),
+            first_place_group=self.group_a, second_place_group=self.group_b
+        )
+
+        entry = self.entry(self.student)
+        self.assertTrue(entry.has_lesson_points)
+        self.assertEqual(entry.qr_points, 3)
+        self.assertEqual(entry.quiz_score, 8)
+        self.assertEqual(entry.peer_score, 5)
+        self.assertEqual(self.entry(self.other).peer_score, 3)
+
+    def test_regrade_and_delete(self):
+        QuizScore.objects.create(quiz=self.quiz, student=self.student, score=4, graded_by=self.teacher)
+        QuizScore.objects.filter(quiz=self.quiz, student=self.student).update(is_cancelled=True)
+        QuizScore.objects.create(quiz=self.quiz, student=self.student, score=9, graded_by=self.teacher)
+        self.assertEqual(self.entry(self.student).quiz_score, 9)
+
+        evaluation = PeerEvaluation.objects.create(
+            lesson_session=self.session, evaluator_token=uuid.uuid4(),
+            first_place_group=self.group_a, second_place_group=self.group_b
+        )
+        self.assertEqual(self.entry(self.student).peer_score, 5)
+        evaluation.delete()
+        self.assertEqual(self.entry(self.student).peer_score, 0)
+
+    def test_rebuild_command(self):
+        StudentLessonPoints.objects.create(student=self.student, lesson_session=self.session, points=2)
+        QuizScore.objects.create(quiz=self.quiz, student=self.other, score=7, graded_by=self.teacher)
+        PeerEvaluation.objects.create(
+            lesson_session=self.session, evaluator_token=uuid.uuid4(),
+            first_place_group=self.group_b, second_place_group=self.group_a
+        )
+        expected = set(GradebookEntry.objects.values_list('student_id', 'qr_points', 'has_lesson_points', 'quiz_score', 'peer_score'))
+
+        GradebookEntry.objects.all().delete()
+        call_command('rebuild_gradebook', stdout=StringIO())
+
+        rebuilt = set(GradebookEntry.objects.values_list('student_id', 'qr_points', 'has_lesson_points', 'quiz_score', 'peer_score'))
+        self.assertEqual(rebuilt, expected)
+        self.assertEqual(self.entry(self.other).quiz_score, 7)
+        self.assertEqual(self.entry(self.other).peer_score, 5)
+
+    def test_session_delete_cascades(self):
+        StudentLessonPoints.objects.create(student=self.student, lesson_session=self.session, points=1)
+        PeerEvaluation.objects.create(
+            lesson_session=self.session, evaluator_token=uuid.uuid4(),
+            first_place_group=self.group_a, second_place_group=self.group_b
+        )
+        self.session.delete()
+        self.assertFalse(GradebookEntry.objects.exists())
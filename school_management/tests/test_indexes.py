@@ -0,0 +1,60 @@
+"""主要な検索クエリがインデックスを使うことを EXPLAIN で確認する（SQLite / PostgreSQL）"""
+from datetime import date
+
+from django.db import connection
+from django.test import TestCase
+from school_management.models import ClassRoom, CustomUser, LessonSession, QRCodeScan, QuizScore
+
+
+class HotPathIndexTest(TestCase):
+    def setUp(self):
+        self.classroom = ClassRoom.objects.create(class_name='C1', year=2025, semester='first')
+        self.teacher = CustomUser.objects.create(email='t@example.com', full_name='T', role='teacher')
+
+    def explain(self, queryset):
+        if connection.vendor == 'postgresql':
+            # 行数が少ないと順次走査が選ばれるため、インデックスが使えるかだけを確認する
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        return queryset.explain()
+
+    def assert_uses_index(self, queryset, index_name=None):
+        plan = self.explain(queryset)
+        table = queryset.model._meta.db_table
+        if connection.vendor == 'postgresql':
+            self.assertNotIn('Seq Scan', plan, plan)
+            self.assertIn('Index', plan, plan)
+        else:
+            self.assertRegex(plan, rf'SEARCH {table} USING (COVERING )?INDEX', plan)
+            if index_name:
+                self.assertIn(index_name, plan)
+
+    def test_quiz_score_lookup(self):
+        self.assert_uses_index(
+            QuizScore.objects.filter(quiz_id=1, student_id=2, is_cancelled=False), 'quizscore_quiz_student_idx'
+        )
+
+    def test_todays_session_lookup(self):
+        self.assert_uses_index(
+            LessonSession.objects.filter(classroom=self.classroom, date=date.today()).order_by('-created_at'),
+            'lessonsession_class_date_idx',
+        )
+
+    def test_peer_evaluation_sessions(self):
+        self.assert_uses_index(
+            LessonSession.objects.filter(classroom=self.classroom, has_peer_evaluation=True).order_by('-date'),
+            'lessonsession_peer_eval_idx',
+        )
+
+    def test_scans_by_teacher(self):
+        self.assert_uses_index(QRCodeScan.objects.filter(scanned_by=self.teacher))
+
+    def test_scans_by_qr_code(self):
+        self.assert_uses_index(
+            QRCodeScan.objects.filter(qr_code_id=1).order_by('-scanned_at'), 'qrcodescan_qr_code_idx'
+        )
+
+    def test_student_number_lookup(self):
+        self.assert_uses_index(
+            CustomUser.objects.filter(student_number='S001', role='student'), 'user_role_student_number_idx'
+        )
@@ -0,0 +1,122 @@
+from io import StringIO
+import multiprocessing
+import os
+from unittest import mock
+
+from django.apps import apps
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from school_management import jobs
+from school_management.models import BackgroundJob, CustomUser, ClassRoom, StudentClassPoints
+
+
+def run_pending_jobs():
+    call_command('run_workers', '--once', '--inline', stdout=StringIO())
+
+
+def worker_job(job_id):
+    """プロセスプールのテスト用ジョブ（spawn したワーカーでは DB を使わずに状態だけ返す）"""
+    in_worker = multiprocessing.current_process().name != 'MainProcess' and apps.ready
+    return 'succeeded' if in_worker and isinstance(job_id, int) else 'failed'
+
+
+def crashing_job(job_id):
+    """ワーカープロセスの異常終了を再現する"""
+    os._exit(1)
+
+
+@override_settings(BACKGROUND_JOBS=True)
+class BackgroundJobTest(TestCase):
+    def setUp(self):
+        self.teacher = CustomUser.objects.create_user(email='t@example.com', full_name='T', password='tpass', role='teacher')
+        self.classroom = ClassRoom.objects.create(class_name='C1', year=2025, semester='first')
+        self.classroom.teachers.add(self.teacher)
+        self.client = Client()
+        self.client.force_login(self.teacher)
+
+    def test_bulk_add_runs_as_job(self):
+        url = reverse('school_management:bulk_student_add', kwargs={'class_id': self.classroom.id})
+        response = self.client.post(url, {'student_data': 'S001,学生1\nS002,学生2\nS003'})
+        job = BackgroundJob.objects.get()
+        self.assertRedirects(response, reverse('school_management:job_status', kwargs={'job_id': job.id}), fetch_redirect_response=False)
+        self.assertEqual(job.status, 'pending')
+        self.assertEqual(self.classroom.students.count(), 0)
+
+        run_pending_jobs()
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'succeeded')
+        self.assertEqual(job.progress_percent, 100)
+        self.assertEqual(self.classroom.students.count(), 2)
+        self.assertEqual(StudentClassPoints.objects.filter(classroom=self.classroom).count(), 2)
+
+        data = self.client.get(reverse('school_management:job_status', kwargs={'job_id': job.id}), {'format': 'json'}).json()
+        self.assertEqual(data['status'], 'succeeded')
+        self.assertEqual(data['result']['added'], 2)
+        self.assertEqual(len(data['result']['errors']), 1)
+        self.assertTrue(data['result']['errors'][0].startswith('行3:'))
+
+        page = self.client.get(reverse('school_management:job_status', kwargs={'job_id': job.id}))
+        self.assertEqual(page.status_code, 200)
+
+    def test_qr_sheet_job_download(self):
+        student = CustomUser.objects.create_user(email='s@example.com', full_name='S', password='spass', role='student', student_number='S001')
+        self.classroom.students.add(student)
+        url = reverse('school_management:class_qr_codes_export', kwargs={'class_id': self.classroom.id})
+        self.client.get(url, {'format': 'pdf'})
+        job = BackgroundJob.objects.get()
+
+        run_pending_jobs()
+
+        data = self.client.get(reverse('school_management:job_status', kwargs={'job_id': job.id}), HTTP_ACCEPT='application/json').json()
+        self.assertEqual(data['status'], 'succeeded')
+        response = self.client.get(data['download_url'])
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertTrue(response.content.startswith(b'%PDF'))
+
+        # 他の教員からは参照できない
+        other = CustomUser.objects.create_user(email='t2@example.com', full_name='T2', password='tpass', role='teacher')
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(data['download_url']).status_code, 404)
+
+    def test_failed_job_records_error(self):
+        job = jobs.enqueue('qr_sheet', {'class_id': 0, 'base_url': 'http://testserver/'}, user=self.teacher)
+        run_pending_jobs()
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.assertIn('DoesNotExist', job.error)
+        self.assertIsNone(jobs.claim_next())
+
+
+class ProcessPoolWorkerTest(TestCase):
+    """run_workers のプロセスプール（spawn）経由の実行
+
+    ワーカーはテスト用DBに接続できないため、run_job をDBを使わない関数に差し替え、
+    ジョブIDの受け渡しと結果・異常終了の扱いを確認する。
+    """
+
+    def setUp(self):
+        self.teacher = CustomUser.objects.create_user(email='t@example.com', full_name='T', password='tpass', role='teacher')
+
+    def run_pool(self, job_func, workers=2):
+        out = StringIO()
+        with mock.patch('school_management.management.commands.run_workers.run_job', job_func):
+            call_command('run_workers', '--once', '--workers', str(workers), '--poll-interval', '0.2', stdout=out)
+        return out.getvalue()
+
+    def test_jobs_run_in_spawned_workers(self):
+        job_ids = [jobs.enqueue('rebuild_gradebook', {}, user=self.teacher).id for _ in range(3)]
+        output = self.run_pool(worker_job)
+        for job_id in job_ids:
+            self.assertIn(f'ジョブ #{job_id}: succeeded', output)
+        self.assertEqual(set(BackgroundJob.objects.values_list('status', flat=True)), {'running'})
+        self.assertIsNone(jobs.claim_next())
+
+    def test_crashed_worker_marks_job_failed(self):
+        job = jobs.enqueue('rebuild_gradebook', {}, user=self.teacher)
+        output = self.run_pool(crashing_job, workers=1)
+        self.assertIn(f'ジョブ #{job.id}: failed', output)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.assertTrue(job.error)
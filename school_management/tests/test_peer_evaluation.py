@@ -0,0 +1,152 @@
+from datetime import date
+import hashlib
+import uuid
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from school_management.models import (
+    ClassRoom, ContributionEvaluation, CustomUser, Group, GroupMember, LessonSession, PeerEvaluation,
+)
+from school_management.peer_results import aggregate_peer_results, get_peer_results
+
+
+class PeerEvaluationTokenTest(TestCase):
+    def setUp(self):
+        self.classroom = ClassRoom.objects.create(class_name='C1', year=2025, semester='first')
+        self.sessions = [
+            LessonSession.objects.create(
+                classroom=self.classroom, session_number=i, date=date(2025, 4, i), has_peer_evaluation=True
+            )
+            for i in range(1, 6)
+        ]
+        self.client = Client()
+
+    def test_token_matches_legacy_link(self):
+        session = self.sessions[3]
+        legacy_token = hashlib.md5(f"peer_{session.id}".encode()).hexdigest()
+        self.assertEqual(session.peer_token, legacy_token)
+        self.assertEqual(LessonSession.objects.get(peer_token=legacy_token), session)
+
+    def test_form_lookup_is_single_query(self):
+        session = self.sessions[3]
+        url = reverse('school_management:peer_evaluation_form', kwargs={'token': session.peer_token})
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['session'], session)
+        lookups = [q['sql'] for q in ctx.captured_queries if 'school_management_lessonsession' in q['sql'].split('WHERE')[0]]
+        self.assertEqual(len(lookups), 1)
+
+    def test_invalid_token_redirects(self):
+        url = reverse('school_management:peer_evaluation_form', kwargs={'token': '0' * 32})
+        response = self.client.get(url)
+        self.assertRedirects(response, reverse('school_management:login'), fetch_redirect_response=False)
+
+
+class PeerResultsTest(TestCase):
+    def setUp(self):
+        self.teacher = CustomUser.objects.create_user(email='t@example.com', full_name='T', password='tpass', role='teacher')
+        self.classroom = ClassRoom.objects.create(class_name='C1', year=2025, semester='first')
+        self.classroom.teachers.add(self.teacher)
+        self.session = LessonSession.objects.create(
+            classroom=self.classroom, session_number=1, date=date(2025, 4, 1), has_peer_evaluation=True
+        )
+        self.client = Client()
+        self.client.force_login(self.teacher)
+        self.student_count = 0
+        cache.clear()
+
+    def add_groups(self, count):
+        groups = []
+        for _ in range(count):
+            number = Group.objects.filter(lesson_session=self.session).count() + 1
+            group = Group.objects.create(lesson_session=self.session, group_number=number)
+            for _ in range(2):
+                self.student_count += 1
+                student = CustomUser.objects.create(
+                    email=f's{self.student_count}@example.com', full_name=f'S{self.student_count}',
+                    role='student', student_number=f'S{self.student_count:03d}'
+                )
+                GroupMember.objects.create(group=group, student=student)
+            groups.append(group)
+        return groups
+
+    def evaluate(self, evaluator, first, second, scores):
+        evaluation = PeerEvaluation.objects.create(
+            lesson_session=self.session, evaluator_token=uuid.uuid4(), evaluator_group=evaluator,
+            first_place_group=first, second_place_group=second, general_comment='good'
+        )
+        for member, score in zip(evaluator.groupmember_set.all(), scores):
+            ContributionEvaluation.objects.create(peer_evaluation=evaluation, evaluatee=member.student, contribution_score=score)
+
+    def test_aggregates(self):
+        g1, g2, g3 = self.add_groups(3)
+        self.evaluate(g1, g2, g3, [4, 5])
+        self.evaluate(g3, g2, g1, [3, 3])
+        self.evaluate(g2, g1, g3, [5, 2])
+
+        results = aggregate_peer_results(self.session)
+        self.assertEqual(results.total_evaluations, 3)
+        self.assertEqual(results.total_groups, 3)
+        stats = {stat['group'].id: stat for stat in results.group_stats}
+        self.assertEqual(results.group_stats[0]['group'], g2)
+        self.assertEqual((stats[g2.id]['first_place_votes'], stats[g2.id]['second_place_votes'], stats[g2.id]['score']), (2, 0, 4))
+        self.assertEqual((stats[g3.id]['first_place_votes'], stats[g3.id]['second_place_votes'], stats[g3.id]['score']), (0, 2, 2))
+        self.assertEqual(stats[g1.id]['evaluations_given'], 1)
+
+        first_student = results.student_stats[0]
+        self.assertEqual(first_student['student_number'], 'S001')
+        self.assertEqual(first_student['group'], g1)
+        self.assertEqual(first_student['first_place_votes'], 1)
+        self.assertEqual(first_student['average_contribution'], 4)
+        self.assertEqual(results.group_votes['グループ2'], {'first': 2, 'second': 0})
+
+    def results_queries(self, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_query_count_is_constant(self):
+        urls = [
+            f'/sessions/{self.session.id}/peer-evaluation/results/',
+            f'/lesson-sessions/{self.session.id}/peer-evaluation/results/',
+        ]
+        groups = self.add_groups(3)
+        self.evaluate(groups[0], groups[1], groups[2], [4, 5])
+        small = [self.results_queries(url) for url in urls]
+
+        groups += self.add_groups(7)
+        for index, group in enumerate(groups):
+            self.evaluate(group, groups[(index + 1) % 10], groups[(index + 2) % 10], [3, 4])
+        large = [self.results_queries(url) for url in urls]
+
+        self.assertEqual(small, large)
+        self.assertContains(self.client.get(urls[0]), '個人貢献度')
+
+    def test_results_cached_until_submission(self):
+        g1, g2, g3 = self.add_groups(3)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.evaluate(g1, g2, g3, [4, 5])
+        self.assertEqual(get_peer_results(self.session).total_evaluations, 1)
+
+        with self.assertNumQueries(0):
+            results = get_peer_results(self.session)
+        self.assertEqual(results.total_evaluations, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.evaluate(g2, g1, g3, [3, 3])
+        results = get_peer_results(self.session)
+        self.assertEqual(results.total_evaluations, 2)
+        self.assertEqual(len(results.student_stats), 4)
+
+        # 締切でも無効化される
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('school_management:close_peer_evaluation', kwargs={'session_id': self.session.id}))
+        with CaptureQueriesContext(connection) as ctx:
+            get_peer_results(self.session)
+        self.assertGreater(len(ctx.captured_queries), 0)
@@ -1,4 +1,6 @@
+from django.db import connection
 from django.test import TestCase, Client
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from school_management.models import CustomUser, ClassRoom, StudentClassPoints
 
@@ -59,3 +61,76 @@ class PointsAPITest(TestCase):
         self.assertEqual(self.student.points, initial_points)
         # 名前は更新されていることを確認
         self.assertEqual(self.student.full_name, 'Updated Name')
+
+
+class AttendanceRatesBulkTest(TestCase):
+    def setUp(self):
+        self.teacher = CustomUser.objects.create_user(email='teacher@example.com', full_name='Teacher One', password='pass123', role='teacher')
+        self.classroom = ClassRoom.objects.create(class_name='Test Class', year=2025, semester='first')
+        self.classroom.teachers.add(self.teacher)
+        self.students = [
+            CustomUser.objects.create_user(email=f's{i}@example.com', full_name=f'S{i}', password='pass123', role='student', student_number=f'S{i:03d}')
+            for i in range(4)
+        ]
+        self.classroom.students.add(*self.students)
+        self.outsider = CustomUser.objects.create_user(email='x@example.com', full_name='X', password='pass123', role='student', student_number='X001')
+        StudentClassPoints.objects.create(student=self.students[0], classroom=self.classroom, points=3)
+        self.url = reverse('school_management:update_attendance_rates', kwargs={'class_id': self.classroom.id})
+        self.client = Client()
+        self.client.force_login(self.teacher)
+
+    def post(self, students):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(self.url, {'students': students}, content_type='application/json')
+        return response, [q['sql'] for q in ctx.captured_queries]
+
+    def test_saves_whole_roster_in_one_write(self):
+        items = [
+            {'student_id': student.id, 'attendance_rate': 50 + i * 10, 'total_points': 10 + i, 'attendance_points': 10.0 + i * 2}
+            for i, student in enumerate(self.students)
+        ]
+        response, queries = self.post(items)
+        data = response.json()
+        self.assertTrue(data['success'])
+        self.assertEqual(data['saved_count'], 4)
+        writes = [q for q in queries if 'school_management_studentclasspoints' in q and q.startswith(('INSERT', 'UPDATE'))]
+        self.assertEqual(len(writes), 1)
+
+        rows = {
+            row.student_id: row
+            for row in StudentClassPoints.objects.filter(classroom=self.classroom)
+        }
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(rows[self.students[0].id].attendance_rate, 50)
+        self.assertEqual(rows[self.students[0].id].points, 10)
+        self.assertEqual(rows[self.students[3].id].attendance_points, 16.0)
+
+    def test_rejects_invalid_items_and_saves_the_rest(self):
+        response, _ = self.post([
+            {'student_id': self.outsider.id, 'attendance_rate': 80},
+            {'student_id': self.students[1].id, 'attendance_rate': 120},
+            {'student_id': self.students[2].id, 'attendance_rate': True},
+            {'student_id': self.students[3].id, 'attendance_rate': 90, 'total_points': 18, 'attendance_points': 18.0},
+        ])
+        data = response.json()
+        self.assertFalse(data['success'])
+        self.assertEqual([r['status'] for r in data['results']], ['error', 'error', 'error', 'saved'])
+        self.assertEqual(data['saved_count'], 1)
+        self.assertFalse(StudentClassPoints.objects.filter(student=self.outsider).exists())
+        self.assertEqual(StudentClassPoints.objects.get(student=self.students[3], classroom=self.classroom).attendance_rate, 90)
+
+    def test_rejects_malformed_student_ids(self):
+        response, _ = self.post([
+            {'student_id': [self.students[0].id], 'attendance_rate': 80},
+            {'student_id': {'a': 1}, 'attendance_rate': 80},
+            {'student_id': True, 'attendance_rate': 80},
+            {'student_id': self.students[1].id, 'attendance_rate': 70},
+        ])
+        data = response.json()
+        self.assertEqual([r['status'] for r in data['results']], ['error', 'error', 'error', 'saved'])
+        self.assertEqual(data['saved_count'], 1)
+
+    def test_rejects_malformed_body(self):
+        self.assertEqual(self.client.post(self.url, 'nope', content_type='application/json').status_code, 400)
+        response, _ = self.post([])
+        self.assertEqual(response.status_code, 400)
@@ -0,0 +1,93 @@
+from unittest import mock
+
+from django.core.cache import caches
+from django.test import TestCase, Client
+from django.urls import reverse
+from school_management.models import CustomUser, ClassRoom, StudentQRCode
+from school_management import qr_images
+
+
+class QRCodeImageTest(TestCase):
+    def setUp(self):
+        caches['qr_images'].clear()
+        self.teacher = CustomUser.objects.create_user(email='t@example.com', full_name='T', password='tpass', role='teacher')
+        self.student = CustomUser.objects.create_user(email='s@example.com', full_name='S', password='spass', role='student', student_number='S1')
+        self.outsider = CustomUser.objects.create_user(email='o@example.com', full_name='O', password='opass', role='student', student_number='S2')
+        self.classroom = ClassRoom.objects.create(class_name='C1', year=2025, semester='first')
+        self.classroom.teachers.add(self.teacher)
+        self.classroom.students.add(self.student)
+        self.qr_code = StudentQRCode.objects.create(student=self.student)
+        self.url = reverse('school_management:qr_code_image', kwargs={'qr_code_id': self.qr_code.qr_code_id})
+        self.client = Client()
+
+    def test_png_is_rendered_once_and_cached(self):
+        self.client.force_login(self.teacher)
+        with mock.patch.object(qr_images, 'render_qr_png', wraps=qr_images.render_qr_png) as render:
+            first = self.client.get(self.url, {'class_id': self.classroom.id})
+            second = self.client.get(self.url, {'class_id': self.classroom.id})
+            self.client.get(self.url)
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first['Content-Type'], 'image/png')
+        self.assertTrue(first.content.startswith(b'\x89PNG'))
+        self.assertEqual(first.content, second.content)
+        # クラス指定の有無でエンコード内容が異なるため2回のみ生成される
+        self.assertEqual(render.call_count, 2)
+
+    def test_etag_returns_not_modified(self):
+        self.client.force_login(self.teacher)
+        response = self.client.get(self.url)
+        cached = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+
+    def test_access_control(self):
+        self.client.force_login(self.student)
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        self.client.force_login(self.outsider)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+    def test_class_qr_codes_page_references_image_urls(self):
+        self.client.force_login(self.teacher)
+        response = self.client.get(reverse('school_management:class_qr_codes', kwargs={'class_id': self.classroom.id}))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, f'{self.url}?class_id={self.classroom.id}')
+        self.assertNotContains(response, 'data:image/png;base64')
+
+
+class ClassQRCodesExportTest(TestCase):
+    def setUp(self):
+        caches['qr_images'].clear()
+        self.teacher = CustomUser.objects.create_user(email='t@example.com', full_name='T', password='tpass', role='teacher')
+        self.classroom = ClassRoom.objects.create(class_name='C1', year=2025, semester='first')
+        self.classroom.teachers.add(self.teacher)
+        for i in range(14):
+            student = CustomUser.objects.create_user(
+                email=f's{i}@example.com', full_name=f'S{i}', password='spass', role='student', student_number=f'S{i:03d}'
+            )
+            self.classroom.students.add(student)
+        self.url = reverse('school_management:class_qr_codes_export', kwargs={'class_id': self.classroom.id})
+        self.client = Client()
+        self.client.force_login(self.teacher)
+
+    def test_pdf_export_creates_missing_codes(self):
+        response = self.client.get(self.url, {'format': 'pdf'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        content = b''.join(response.streaming_content)
+        self.assertTrue(content.startswith(b'%PDF'))
+        # 14名 → 1ページ12件で2ページ
+        self.assertEqual(content.count(b'/Type /Page\n'), 2)
+        self.assertEqual(StudentQRCode.objects.count(), 14)
+
+    def test_zip_export_reuses_cached_images(self):
+        import io
+        import zipfile
+        self.client.get(self.url, {'format': 'pdf'})
+        with mock.patch.object(qr_images, 'render_qr_png') as render:
+            response = self.client.get(self.url, {'format': 'zip'})
+            content = b''.join(response.streaming_content)
+        render.assert_not_called()
+        with zipfile.ZipFile(io.BytesIO(content)) as archive:
+            names = archive.namelist()
+            self.assertEqual(len(names), 14)
+            self.assertTrue(archive.read(names[0]).startswith(b'\x89PNG'))
+        self.assertEqual(StudentQRCode.objects.count(), 14)
@@ -0,0 +1,439 @@
+from datetime import date, timedelta
+import threading
+import time
+from unittest import mock
+import uuid
+
+from django.core.cache import cache
+from django.db import connection, IntegrityError, OperationalError
+from django.test import TestCase, TransactionTestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from school_management.models import (
+    CustomUser, ClassRoom, LessonSession, StudentQRCode, QRCodeScan,
+    StudentLessonPoints, StudentClassPoints, GradebookEntry, TeacherScanTotal, ClassScanTotal,
+)
+from school_management.points import rebuild_scan_counters, record_scan, record_scan_batch
+from school_management.qr_tokens import read_scan_token
+from school_management.scan_debounce import scan_cache
+from school_management.scan_sessions import RESOLVER_CACHE_TIMEOUT, resolve_scan_target
+
+
+@override_settings(QR_SCAN_DEBOUNCE_SECONDS=0)
+class QRCodeScanViewTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        scan_cache().clear()
+        self.teacher = CustomUser.objects.create_user(email='t@example.com', full_name='T', password='tpass', role='teacher')
+        self.student = CustomUser.objects.create_user(email='s@example.com', full_name='S', password='spass', role='student', student_number='S1')
+        self.classroom = ClassRoom.objects.create(class_name='C1', year=2025, semester='first')
+        self.classroom.teachers.add(self.teacher)
+        self.classroom.students.add(self.student)
+        self.session = LessonSession.objects.create(classroom=self.classroom, session_number=1, date=date.today())
+        self.qr_code = StudentQRCode.objects.create(student=self.student)
+        self.client = Client()
+        self.client.force_login(self.teacher)
+
+    def test_scan_awards_points(self):
+        url = reverse('school_management:qr_code_scan', kwargs={'qr_code_id': self.qr_code.qr_code_id})
+        self.client.get(url, {'class_id': self.classroom.id})
+        response = self.client.get(url, {'class_id': self.classroom.id})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['student_class_points'], 2)
+        self.assertEqual(StudentLessonPoints.objects.get(student=self.student, lesson_session=self.session).points, 2)
+        self.assertEqual(StudentClassPoints.objects.get(student=self.student, classroom=self.classroom).points, 2)
+        self.assertEqual(GradebookEntry.objects.get(student=self.student, lesson_session=self.session).qr_points, 2)
+        self.qr_code.refresh_from_db()
+        self.assertIsNotNone(self.qr_code.last_used_at)
+        self.assertEqual(self.qr_code.scan_count, 2)
+        self.assertEqual(response.context['user_scan_count'], 2)
+        self.assertEqual(ClassScanTotal.objects.get(classroom=self.classroom).scan_count, 2)
+
+    def test_json_mode_returns_values_from_write(self):
+        url = reverse('school_management:qr_code_scan', kwargs={'qr_code_id': self.qr_code.qr_code_id})
+        self.client.get(url, {'class_id': self.classroom.id})
+        with CaptureQueriesContext(connection) as html_queries:
+            self.client.get(url, {'class_id': self.classroom.id})
+        with CaptureQueriesContext(connection) as json_queries:
+            response = self.client.get(url, {'class_id': self.classroom.id}, HTTP_ACCEPT='application/json')
+        self.assertEqual(response.json(), {
+            'success': True,
+            'recorded': True,
+            'student_name': 'S',
+            'class_id': self.classroom.id,
+            'lesson_session_id': self.session.id,
+            'points_added': 1,
+            'class_points': 3,
+        })
+        self.assertLess(len(json_queries), len(html_queries))
+
+        response = self.client.get(reverse('school_management:qr_code_scan', kwargs={'qr_code_id': uuid.uuid4()}), {'format': 'json'})
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(response.json()['success'])
+
+    def test_list_pages_use_scan_counters(self):
+        record_scan(self.qr_code, self.teacher, lesson_session=self.session, classroom=self.classroom)
+        with self.assertNumQueries(4):
+            # セッション・ユーザー・クラス一覧・スキャン累計
+            response = self.client.get(reverse('school_management:qr_code_list'))
+        self.assertEqual(response.context['classes'][0]['student_count'], 1)
+        self.assertEqual(response.context['classes'][0]['total_scans'], 1)
+
+        response = self.client.get(reverse('school_management:class_qr_codes', kwargs={'class_id': self.classroom.id}))
+        self.assertEqual(response.context['qr_codes'][0]['scan_count'], 1)
+
+    def test_rebuild_scan_counters(self):
+        record_scan(self.qr_code, self.teacher, lesson_session=self.session, classroom=self.classroom)
+        record_scan(self.qr_code, self.teacher, lesson_session=self.session, classroom=self.classroom)
+        StudentQRCode.objects.update(scan_count=0)
+        TeacherScanTotal.objects.all().delete()
+        ClassScanTotal.objects.update(scan_count=99)
+
+        rebuild_scan_counters()
+
+        self.qr_code.refresh_from_db()
+        self.assertEqual(self.qr_code.scan_count, 2)
+        self.assertEqual(TeacherScanTotal.objects.get(teacher=self.teacher).scan_count, 2)
+        self.assertEqual(ClassScanTotal.objects.get(classroom=self.classroom).scan_count, 2)
+
+
+class ConcurrentScanTest(TransactionTestCase):
+    SCAN_COUNT = 20
+
+    def setUp(self):
+        self.teacher = CustomUser.objects.create_user(email='t@example.com', full_name='T', password='tpass', role='teacher')
+        self.student = CustomUser.objects.create_user(email='s@example.com', full_name='S', password='spass', role='student', student_number='S1')
+        self.classroom = ClassRoom.objects.create(class_name='C1', year=2025, semester='first')
+        self.classroom.teachers.add(self.teacher)
+        self.session = LessonSession.objects.create(classroom=self.classroom, session_number=1, date=date.today())
+        self.qr_code = StudentQRCode.objects.create(student=self.student)
+
+    def test_parallel_scans_do_not_lose_increments(self):
+        barrier = threading.Barrier(self.SCAN_COUNT)
+        errors = []
+
+        def scan():
+            try:
+                barrier.wait()
+                while True:
+                    try:
+                        record_scan(self.qr_code, self.teacher, lesson_session=self.session, classroom=self.classroom)
+                        break
+                    except OperationalError as e:
+                        # SQLite（テスト用インメモリDB）はロック競合で即座に失敗するため、
+                        # ロールバックされたトランザクション全体を再実行する
+                        if 'locked' not in str(e):
+                            raise
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=scan) for _ in range(self.SCAN_COUNT)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(QRCodeScan.objects.filter(qr_code=self.qr_code).count(), self.SCAN_COUNT)
+        self.assertEqual(StudentLessonPoints.objects.get(student=self.student, lesson_session=self.session).points, self.SCAN_COUNT)
+        self.assertEqual(StudentClassPoints.objects.get(student=self.student, classroom=self.classroom).points, self.SCAN_COUNT)
+        self.assertEqual(GradebookEntry.objects.get(student=self.student, lesson_session=self.session).qr_points, self.SCAN_COUNT)
+        self.qr_code.refresh_from_db()
+        self.assertEqual(self.qr_code.scan_count, self.SCAN_COUNT)
+        self.assertEqual(TeacherScanTotal.objects.get(teacher=self.teacher).scan_count, self.SCAN_COUNT)
+        self.assertEqual(ClassScanTotal.objects.get(classroom=self.classroom).scan_count, self.SCAN_COUNT)
+
+
+class ScanTargetCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        scan_cache().clear()
+        self.teacher = CustomUser.objects.create_user(email='t@example.com', full_name='T', password='tpass', role='teacher')
+        self.student = CustomUser.objects.create_user(email='s@example.com', full_name='S', password='spass', role='student', student_number='S1')
+        self.classroom = ClassRoom.objects.create(class_name='C1', year=2025, semester='first')
+        self.classroom.teachers.add(self.teacher)
+        self.classroom.students.add(self.student)
+        self.qr_code = StudentQRCode.objects.create(student=self.student)
+        self.url = reverse('school_management:qr_code_scan', kwargs={'qr_code_id': self.qr_code.qr_code_id})
+        self.client = Client()
+        self.client.force_login(self.teacher)
+
+    def test_resolver_is_cached_until_session_changes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            session = LessonSession.objects.create(classroom=self.classroom, session_number=1, date=date.today())
+        self.assertEqual(resolve_scan_target(self.teacher, str(self.classroom.id)), (self.classroom, session))
+        with self.assertNumQueries(0):
+            self.assertEqual(resolve_scan_target(self.teacher, str(self.classroom.id)), (self.classroom, session))
+
+        # 授業回を作成すると無効化される
+        with self.captureOnCommitCallbacks(execute=True):
+            newer = LessonSession.objects.create(classroom=self.classroom, session_number=2, date=date.today())
+        self.assertEqual(resolve_scan_target(self.teacher, str(self.classroom.id)), (self.classroom, newer))
+
+        # 担当から外れると指定クラスとして扱わない
+        with self.captureOnCommitCallbacks(execute=True):
+            self.classroom.teachers.remove(self.teacher)
+        self.assertEqual(resolve_scan_target(self.teacher, str(self.classroom.id)), (None, None))
+
+    def test_missing_session_is_not_cached(self):
+        self.assertEqual(resolve_scan_target(self.teacher, str(self.classroom.id)), (self.classroom, None))
+        # 別のプロセスで作成された授業回（このプロセスのバージョンは更新されない）
+        session = LessonSession.objects.create(classroom=self.classroom, session_number=1, date=date.today())
+        self.assertEqual(resolve_scan_target(self.teacher, str(self.classroom.id)), (self.classroom, session))
+
+    def test_cached_session_expires_for_other_processes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            session = LessonSession.objects.create(classroom=self.classroom, session_number=1, date=date.today())
+        self.assertEqual(resolve_scan_target(self.teacher, str(self.classroom.id)), (self.classroom, session))
+        newer = LessonSession.objects.create(classroom=self.classroom, session_number=2, date=date.today())
+        self.assertEqual(resolve_scan_target(self.teacher, str(self.classroom.id)), (self.classroom, session))
+        with mock.patch('django.core.cache.backends.locmem.time') as locmem_time:
+            locmem_time.time.return_value = time.time() + RESOLVER_CACHE_TIMEOUT + 1
+            self.assertEqual(resolve_scan_target(self.teacher, str(self.classroom.id)), (self.classroom, newer))
+
+    def test_scan_uses_session_created_after_first_scan(self):
+        self.client.get(self.url, {'class_id': self.classroom.id})
+        with self.captureOnCommitCallbacks(execute=True):
+            session = LessonSession.objects.create(classroom=self.classroom, session_number=1, date=date.today())
+        response = self.client.get(self.url, {'class_id': self.classroom.id})
+        self.assertEqual(response.context['lesson_session'], session)
+        self.assertEqual(StudentLessonPoints.objects.get(student=self.student, lesson_session=session).points, 1)
+
+
+class QRCodeScanBatchTest(TestCase):
+    def setUp(self):
+        self.teacher = CustomUser.objects.create_user(email='t@example.com', full_name='T', password='tpass', role='teacher')
+        self.classroom = ClassRoom.objects.create(class_name='C1', year=2025, semester='first')
+        self.classroom.teachers.add(self.teacher)
+        self.session = LessonSession.objects.create(classroom=self.classroom, session_number=1, date=date.today())
+        self.students = [
+            CustomUser.objects.create_user(email=f's{i}@example.com', full_name=f'S{i}', password='spass', role='student', student_number=f'S{i}')
+            for i in range(2)
+        ]
+        self.qr_codes = [StudentQRCode.objects.create(student=student) for student in self.students]
+        self.url = reverse('school_management:qr_code_scan_batch')
+        self.client = Client()
+        self.client.force_login(self.teacher)
+
+    def post(self, scans):
+        return self.client.post(self.url, {'scans': scans}, content_type='application/json')
+
+    def scan(self, client_scan_id, qr_code, **extra):
+        return {'client_scan_id': client_scan_id, 'qr_code_id': str(qr_code.qr_code_id), 'class_id': self.classroom.id, **extra}
+
+    def test_batch_records_scans_and_aggregates_points(self):
+        scans = [self.scan('a', self.qr_codes[0]), self.scan('b', self.qr_codes[0]), self.scan('c', self.qr_codes[1])]
+        response = self.post(scans)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertTrue(data['success'])
+        self.assertEqual(data['recorded'], 3)
+        self.assertEqual([result['status'] for result in data['results']], ['recorded'] * 3)
+        self.assertEqual(StudentLessonPoints.objects.get(student=self.students[0], lesson_session=self.session).points, 2)
+        self.assertEqual(StudentClassPoints.objects.get(student=self.students[1], classroom=self.classroom).points, 1)
+        self.assertEqual(GradebookEntry.objects.get(student=self.students[0], lesson_session=self.session).qr_points, 2)
+        self.assertEqual(TeacherScanTotal.objects.get(teacher=self.teacher).scan_count, 3)
+        self.assertEqual(ClassScanTotal.objects.get(classroom=self.classroom).scan_count, 3)
+        self.qr_codes[0].refresh_from_db()
+        self.assertEqual(self.qr_codes[0].scan_count, 2)
+
+        # 再送信しても重複登録しない
+        data = self.post(scans + [self.scan('d', self.qr_codes[1]), self.scan('d', self.qr_codes[1])]).json()
+        self.assertEqual([result['status'] for result in data['results']], ['duplicate'] * 3 + ['recorded', 'duplicate'])
+        self.assertEqual(QRCodeScan.objects.count(), 4)
+        self.assertEqual(StudentClassPoints.objects.get(student=self.students[1], classroom=self.classroom).points, 2)
+
+    def test_offline_scan_uses_session_of_scan_day(self):
+        yesterday = date.today() - timedelta(days=1)
+        old_session = LessonSession.objects.create(classroom=self.classroom, session_number=0, date=yesterday)
+        scanned_at = f'{yesterday.isoformat()}T10:00:00'
+        data = self.post([self.scan('a', self.qr_codes[0], scanned_at=scanned_at)]).json()
+        self.assertEqual(data['results'][0]['lesson_session_id'], old_session.id)
+        scan = QRCodeScan.objects.get(client_scan_id='a')
+        self.assertEqual(timezone.localtime(scan.scanned_at).date(), yesterday)
+
+    def test_invalid_items_are_reported(self):
+        other_class = ClassRoom.objects.create(class_name='C2', year=2025, semester='first')
+        data = self.post([
+            self.scan('', self.qr_codes[0]),
+            {'client_scan_id': 'x', 'qr_code_id': 'not-a-uuid'},
+            self.scan('y', self.qr_codes[0], class_id=other_class.id),
+            self.scan('z', self.qr_codes[0], scanned_at='yesterday'),
+            self.scan('feb', self.qr_codes[0], scanned_at='2025-02-30T10:00:00'),
+            self.scan('hour', self.qr_codes[0], scanned_at='2025-01-01T25:00:00'),
+            self.scan('ok', self.qr_codes[0]),
+        ]).json()
+        self.assertFalse(data['success'])
+        self.assertEqual([result['status'] for result in data['results']], ['error'] * 6 + ['recorded'])
+        self.assertEqual(data['results'][4]['error'], 'scanned_at が不正です')
+        self.assertEqual(QRCodeScan.objects.count(), 1)
+
+    def test_malformed_class_id_is_reported(self):
+        data = self.post([
+            self.scan('list', self.qr_codes[0], class_id=[self.classroom.id]),
+            self.scan('bool', self.qr_codes[0], class_id=True),
+            self.scan('text', self.qr_codes[0], class_id='C1'),
+            self.scan('str', self.qr_codes[0], class_id=str(self.classroom.id)),
+        ]).json()
+        self.assertEqual([result['status'] for result in data['results']], ['error'] * 3 + ['recorded'])
+        self.assertEqual(data['results'][0]['error'], 'class_id が不正です')
+        self.assertEqual(QRCodeScan.objects.count(), 1)
+
+    def test_students_cannot_post(self):
+        self.client.force_login(self.students[0])
+        self.assertEqual(self.post([self.scan('a', self.qr_codes[0])]).status_code, 403)
+
+    def test_concurrent_duplicate_is_reported_per_item(self):
+        # 一括登録が2回とも重複で失敗しても、1件ずつ登録し直して重複分だけ duplicate にする
+        def record(scanned_by, scans):
+            if len(scans) > 1:
+                raise IntegrityError('duplicate client_scan_id')
+            if scans[0]['client_scan_id'] == 'b':
+                QRCodeScan.objects.create(qr_code=self.qr_codes[1], scanned_by=scanned_by, client_scan_id='b')
+                raise IntegrityError('duplicate client_scan_id')
+            return record_scan_batch(scanned_by, scans)
+
+        with mock.patch('school_management.views.record_scan_batch', side_effect=record):
+            response = self.post([self.scan('a', self.qr_codes[0]), self.scan('b', self.qr_codes[1])])
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual([result['status'] for result in data['results']], ['recorded', 'duplicate'])
+        self.assertEqual(data['recorded'], 1)
+
+
+@override_settings(QR_SCAN_DEBOUNCE_SECONDS=0)
+class SignedQRCodeScanTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        scan_cache().clear()
+        self.teacher = CustomUser.objects.create_user(email='t@example.com', full_name='T', password='tpass', role='teacher')
+        self.student = CustomUser.objects.create_user(email='s@example.com', full_name='S', password='spass', role='student', student_number='S1')
+        self.classroom = ClassRoom.objects.create(class_name='C1', year=2025, semester='first')
+        self.classroom.teachers.add(self.teacher)
+        self.classroom.students.add(self.student)
+        self.session = LessonSession.objects.create(classroom=self.classroom, session_number=1, date=date.today())
+        self.qr_code = StudentQRCode.objects.create(student=self.student)
+        self.client = Client()
+        self.client.force_login(self.teacher)
+
+    def test_scan_path_formats(self):
+        self.assertEqual(
+            self.qr_code.scan_path(self.classroom.id, signed=False),
+            reverse('school_management:qr_code_scan', kwargs={'qr_code_id': self.qr_code.qr_code_id}) + f'?class_id={self.classroom.id}'
+        )
+        with override_settings(QR_SIGNED_PAYLOADS=True):
+            self.assertEqual(self.qr_code.qr_code_url, self.qr_code.scan_path(signed=True))
+        token = self.qr_code.scan_path(self.classroom.id, signed=True).rstrip('/').rsplit('/', 1)[1]
+        self.assertEqual(read_scan_token(token), (self.qr_code.id, self.student.id, self.classroom.id))
+
+    def test_signed_scan_does_not_read_qr_code(self):
+        url = self.qr_code.scan_path(self.classroom.id, signed=True)
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.context['student_class_points'], 2)
+        self.assertEqual(StudentLessonPoints.objects.get(student=self.student, lesson_session=self.session).points, 2)
+        self.assertFalse([
+            query['sql'] for query in queries.captured_queries
+            if query['sql'].startswith('SELECT') and 'FROM "school_management_studentqrcode"' in query['sql']
+        ])
+
+        # 学生名の表示のために学生だけを主キーで読み込む
+        self.assertEqual(response.context['qr_code'].student.full_name, 'S')
+        with CaptureQueriesContext(connection) as queries:
+            data = self.client.get(url, {'format': 'json'}).json()
+        self.assertEqual(data['student_name'], 'S')
+        user_reads = [
+            query['sql'] for query in queries.captured_queries
+            if 'FROM "school_management_customuser"' in query['sql']
+            and f'"school_management_customuser"."id" = {self.student.id}' in query['sql']
+        ]
+        self.assertEqual(len(user_reads), 1)
+
+    def test_tampered_and_deactivated_tokens_are_rejected(self):
+        url = self.qr_code.scan_path(self.classroom.id, signed=True)
+        other = StudentQRCode.objects.create(student=self.teacher)
+        forged = url.replace(f'/{self.qr_code.id}.', f'/{other.id}.')
+        response = self.client.get(forged)
+        self.assertIsNone(response.context['qr_code'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.qr_code.is_active = False
+            self.qr_code.save()
+        response = self.client.get(url)
+        self.assertEqual(response.context['error_message'], 'このQRコードは無効化されています。')
+        self.assertFalse(QRCodeScan.objects.exists())
+
+    def test_deleted_qr_code_token_is_rejected(self):
+        url = self.qr_code.scan_path(self.classroom.id, signed=True)
+        self.client.get(url + '?format=json')
+        with self.captureOnCommitCallbacks(execute=True):
+            StudentQRCode.objects.filter(pk=self.qr_code.pk).delete()
+        response = self.client.get(url)
+        self.assertEqual(response.context['error_message'], 'このQRコードは無効化されています。')
+
+    def test_deactivation_elsewhere_is_seen_after_cache_expiry(self):
+        url = self.qr_code.scan_path(self.classroom.id, signed=True)
+        self.assertTrue(self.client.get(url, {'format': 'json'}).json()['recorded'])
+        # 別のプロセスでの無効化（このプロセスのキャッシュは変わらない）
+        StudentQRCode.objects.filter(pk=self.qr_code.pk).update(is_active=False)
+        cache.delete('qr_tokens:active_ids')  # QR_DENY_LIST_TTL の経過
+        self.assertEqual(self.client.get(url, {'format': 'json'}).status_code, 404)
+
+    def test_new_qr_code_is_accepted_with_cached_ids(self):
+        self.client.get(self.qr_code.scan_path(self.classroom.id, signed=True), {'format': 'json'})
+        other_student = CustomUser.objects.create_user(email='o@example.com', full_name='O', password='opass', role='student', student_number='S2')
+        other = StudentQRCode.objects.bulk_create([StudentQRCode(student=other_student)])[0]
+        data = self.client.get(other.scan_path(self.classroom.id, signed=True), {'format': 'json'}).json()
+        self.assertEqual(data['student_name'], 'O')
+
+
+@override_settings(QR_SCAN_DEBOUNCE_SECONDS=60)
+class ScanDebounceTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        scan_cache().clear()
+        self.teacher = CustomUser.objects.create_user(email='t@example.com', full_name='T', password='tpass', role='teacher')
+        self.student = CustomUser.objects.create_user(email='s@example.com', full_name='S', password='spass', role='student', student_number='S1')
+        self.classroom = ClassRoom.objects.create(class_name='C1', year=2025, semester='first')
+        self.classroom.teachers.add(self.teacher)
+        self.session = LessonSession.objects.create(classroom=self.classroom, session_number=1, date=date.today())
+        self.qr_code = StudentQRCode.objects.create(student=self.student)
+        self.url = reverse('school_management:qr_code_scan', kwargs={'qr_code_id': self.qr_code.qr_code_id})
+        self.client = Client()
+        self.client.force_login(self.teacher)
+
+    def test_repeated_scan_is_suppressed_without_writes(self):
+        self.client.get(self.url, {'class_id': self.classroom.id})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, {'class_id': self.classroom.id})
+        self.assertTrue(response.context['duplicate'])
+        self.assertFalse([
+            query['sql'] for query in queries.captured_queries
+            if query['sql'].startswith(('INSERT', 'UPDATE', 'DELETE'))
+        ])
+        self.assertEqual(QRCodeScan.objects.count(), 1)
+        self.assertEqual(StudentClassPoints.objects.get(student=self.student, classroom=self.classroom).points, 1)
+
+        response = self.client.get(reverse('school_management:qr_code_list'))
+        self.assertEqual(response.context['suppressed_scans_today'], 1)
+
+    def test_other_teacher_is_not_suppressed(self):
+        other = CustomUser.objects.create_user(email='t2@example.com', full_name='T2', password='tpass', role='teacher')
+        self.classroom.teachers.add(other)
+        self.client.get(self.url, {'class_id': self.classroom.id})
+        self.client.force_login(other)
+        response = self.client.get(self.url, {'class_id': self.classroom.id})
+        self.assertNotIn('duplicate', response.context)
+        self.assertEqual(QRCodeScan.objects.count(), 2)
+
+    def test_debounce_state_is_kept_outside_default_cache(self):
+        self.client.get(self.url, {'class_id': self.classroom.id})
+        # default キャッシュが件数上限で削除されても抑止キーは残る
+        cache.clear()
+        response = self.client.get(self.url, {'class_id': self.classroom.id})
+        self.assertTrue(response.context['duplicate'])
+        self.assertEqual(QRCodeScan.objects.count(), 1)
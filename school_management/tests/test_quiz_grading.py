@@ -0,0 +1,186 @@
+from datetime import date
+
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from school_management.grading import rebuild_current_scores, save_quiz_scores
+from school_management.models import CustomUser, ClassRoom, CurrentQuizScore, GradebookEntry, LessonSession, Quiz, QuizScore
+
+
+class QuizGradingSaveTest(TestCase):
+    def setUp(self):
+        self.teacher = CustomUser.objects.create_user(email='t@example.com', full_name='T', password='tpass', role='teacher')
+        self.classroom = ClassRoom.objects.create(class_name='C1', year=2025, semester='first')
+        self.classroom.teachers.add(self.teacher)
+        self.students = [
+            CustomUser.objects.create(email=f's{i}@example.com', full_name=f'S{i}', role='student', student_number=f'S{i:03d}')
+            for i in range(6)
+        ]
+        self.classroom.students.add(*self.students)
+        self.session = LessonSession.objects.create(classroom=self.classroom, session_number=1, date=date(2025, 4, 1), has_quiz=True)
+        self.quiz = Quiz.objects.create(lesson_session=self.session, quiz_name='Q', max_score=10)
+        self.url = reverse('school_management:quiz_grading', kwargs={'quiz_id': self.quiz.id})
+        self.client = Client()
+        self.client.force_login(self.teacher)
+
+    def save(self, scores):
+        data = {'action': 'save_scores'}
+        data.update({f'score_{student.student_number}': value for student, value in scores.items()})
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(self.url, data)
+        self.assertRedirects(response, self.url, fetch_redirect_response=False)
+        return [q['sql'] for q in ctx.captured_queries]
+
+    def active_scores(self):
+        return dict(QuizScore.objects.filter(quiz=self.quiz, is_cancelled=False).values_list('student__student_number', 'score'))
+
+    def test_saves_only_changed_cells_in_bulk(self):
+        first = dict(zip(self.students, ['5', '6', '7', '8', '', 'abc']))
+        self.save(first)
+        self.assertEqual(self.active_scores(), {'S000': 5, 'S001': 6, 'S002': 7, 'S003': 8})
+
+        second = dict(zip(self.students, ['5', '9', '7', '8', '11', '3']))
+        queries = self.save(second)
+        self.assertEqual(self.active_scores(), {'S000': 5, 'S001': 9, 'S002': 7, 'S003': 8, 'S005': 3})
+        # 取り消しは1回のUPDATE、追加は1回のINSERT
+        self.assertEqual(sum(1 for q in queries if q.startswith('UPDATE "school_management_quizscore"')), 1)
+        self.assertEqual(sum(1 for q in queries if q.startswith('INSERT INTO "school_management_quizscore"')), 1)
+        self.assertEqual(QuizScore.objects.filter(quiz=self.quiz, is_cancelled=True).count(), 1)
+        self.assertEqual(GradebookEntry.objects.get(student=self.students[1], lesson_session=self.session).quiz_score, 9)
+
+    def test_resubmitting_same_scores_writes_nothing(self):
+        scores = dict(zip(self.students, ['1', '2', '3', '4', '5', '6']))
+        self.save(scores)
+        queries = self.save(scores)
+        self.assertFalse([q for q in queries if q.startswith(('UPDATE "school_management_quizscore"', 'INSERT INTO "school_management_quizscore"'))])
+        self.assertEqual(QuizScore.objects.filter(quiz=self.quiz).count(), 6)
+
+
+class QuizGradingAutosaveTest(TestCase):
+    def setUp(self):
+        self.teacher = CustomUser.objects.create_user(email='t@example.com', full_name='T', password='tpass', role='teacher')
+        self.classroom = ClassRoom.objects.create(class_name='C1', year=2025, semester='first')
+        self.classroom.teachers.add(self.teacher)
+        self.students = [
+            CustomUser.objects.create(email=f's{i}@example.com', full_name=f'S{i}', role='student', student_number=f'S{i:03d}')
+            for i in range(3)
+        ]
+        self.classroom.students.add(*self.students)
+        self.outsider = CustomUser.objects.create(email='x@example.com', full_name='X', role='student', student_number='X001')
+        session = LessonSession.objects.create(classroom=self.classroom, session_number=1, date=date(2025, 4, 1), has_quiz=True)
+        self.quiz = Quiz.objects.create(lesson_session=session, quiz_name='Q', max_score=10, grading_method='qr_mobile')
+        self.url = reverse('school_management:quiz_grading_autosave', kwargs={'quiz_id': self.quiz.id})
+        self.client = Client()
+        self.client.force_login(self.teacher)
+
+    def post(self, scores):
+        return self.client.post(self.url, {'scores': scores}, content_type='application/json').json()
+
+    def test_autosave_is_idempotent_and_reports_count(self):
+        data = self.post([{'student_id': self.students[0].id, 'score': 7}])
+        self.assertTrue(data['success'])
+        self.assertEqual(data['results'][0]['status'], 'saved')
+        self.assertEqual(data['graded_count'], 1)
+
+        data = self.post([{'student_id': self.students[0].id, 'score': 7}, {'student_id': self.students[1].id, 'score': 10}])
+        self.assertEqual([r['status'] for r in data['results']], ['unchanged', 'saved'])
+        self.assertEqual(data['graded_count'], 2)
+        self.assertEqual(QuizScore.objects.filter(quiz=self.quiz).count(), 2)
+
+    def test_rejects_invalid_items(self):
+        data = self.post([
+            {'student_id': self.outsider.id, 'score': 5},
+            {'student_id': self.students[2].id, 'score': 11},
+            {'student_id': self.students[1].id, 'score': 4},
+        ])
+        self.assertFalse(data['success'])
+        self.assertEqual([r['status'] for r in data['results']], ['error', 'error', 'saved'])
+        self.assertEqual(data['graded_count'], 1)
+        self.assertEqual(self.client.post(self.url, 'nope', content_type='application/json').status_code, 400)
+
+    def test_rejects_malformed_student_ids(self):
+        data = self.post([
+            {'student_id': {'a': 1}, 'score': 1},
+            {'student_id': [self.students[0].id], 'score': 1},
+            {'student_id': True, 'score': 1},
+            {'student_id': self.students[1].id, 'score': 4},
+        ])
+        self.assertEqual([r['status'] for r in data['results']], ['error', 'error', 'error', 'saved'])
+        self.assertEqual(QuizScore.objects.filter(quiz=self.quiz).count(), 1)
+
+    def test_grading_page_has_quick_buttons(self):
+        response = self.client.get(reverse('school_management:quiz_grading', kwargs={'quiz_id': self.quiz.id}))
+        self.assertEqual(response.context['quick_scores'], [0, 5, 10])
+        self.assertContains(response, 'quick-score')
+
+
+class CurrentQuizScoreTest(TestCase):
+    def setUp(self):
+        self.teacher = CustomUser.objects.create_user(email='t@example.com', full_name='T', password='tpass', role='teacher')
+        self.classroom = ClassRoom.objects.create(class_name='C1', year=2025, semester='first')
+        self.classroom.teachers.add(self.teacher)
+        self.students = [
+            CustomUser.objects.create(email=f's{i}@example.com', full_name=f'S{i}', role='student', student_number=f'S{i:03d}')
+            for i in range(3)
+        ]
+        self.classroom.students.add(*self.students)
+        self.session = LessonSession.objects.create(classroom=self.classroom, session_number=1, date=date(2025, 4, 1), has_quiz=True)
+        self.quiz = Quiz.objects.create(lesson_session=self.session, quiz_name='Q', max_score=10)
+        self.client = Client()
+        self.client.force_login(self.teacher)
+
+    def current(self):
+        return dict(CurrentQuizScore.objects.filter(quiz=self.quiz).values_list('student_id', 'quiz_score__score'))
+
+    def test_regrade_moves_pointer_to_new_score(self):
+        first, second = self.students[:2]
+        save_quiz_scores(self.quiz, {first.id: 5, second.id: 6}, graded_by=self.teacher)
+        save_quiz_scores(self.quiz, {first.id: 8}, graded_by=self.teacher)
+
+        self.assertEqual(self.current(), {first.id: 8, second.id: 6})
+        pointer = CurrentQuizScore.objects.get(quiz=self.quiz, student=first)
+        self.assertFalse(pointer.quiz_score.is_cancelled)
+        # 履歴は QuizScore に残る
+        self.assertEqual(QuizScore.objects.filter(quiz=self.quiz, student=first).count(), 2)
+
+    def test_single_row_writes_keep_pointer_in_sync(self):
+        student = self.students[0]
+        score = QuizScore.objects.create(quiz=self.quiz, student=student, score=4, graded_by=self.teacher)
+        self.assertEqual(self.current(), {student.id: 4})
+
+        score.is_cancelled = True
+        score.save()
+        self.assertEqual(self.current(), {})
+
+        replacement = QuizScore.objects.create(quiz=self.quiz, student=student, score=9, graded_by=self.teacher)
+        self.assertEqual(self.current(), {student.id: 9})
+        replacement.delete()
+        self.assertEqual(self.current(), {})
+        self.assertEqual(GradebookEntry.objects.get(student=student, lesson_session=self.session).quiz_score, 0)
+
+    def test_views_read_current_scores(self):
+        first, second = self.students[:2]
+        save_quiz_scores(self.quiz, {first.id: 5, second.id: 6}, graded_by=self.teacher)
+        save_quiz_scores(self.quiz, {first.id: 7}, graded_by=self.teacher)
+
+        response = self.client.get(reverse('school_management:quiz_results', kwargs={'quiz_id': self.quiz.id}))
+        self.assertEqual([score.score for score in response.context['scores']], [7, 6])
+        self.assertEqual(response.context['stats']['graded_students'], 2)
+
+        response = self.client.get(reverse('school_management:quiz_grading', kwargs={'quiz_id': self.quiz.id}))
+        self.assertEqual(response.context['graded_count'], 2)
+
+        response = self.client.get(reverse(
+            'school_management:class_student_detail',
+            kwargs={'class_id': self.classroom.id, 'student_number': first.student_number},
+        ))
+        self.assertEqual([score.score for score in response.context['quiz_scores']], [7])
+
+    def test_rebuild_current_scores(self):
+        student = self.students[0]
+        save_quiz_scores(self.quiz, {student.id: 3}, graded_by=self.teacher)
+        CurrentQuizScore.objects.all().delete()
+
+        self.assertEqual(rebuild_current_scores(), 1)
+        self.assertEqual(self.current(), {student.id: 3})
@@ -0,0 +1,146 @@
+from datetime import date
+import io
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from school_management.grade_matrix import build_grade_matrix
+from school_management.models import (
+    CustomUser, ClassRoom, LessonSession, StudentQRCode, QRCodeScan, ScanLogCursor,
+    StudentLessonPoints, StudentClassPoints, GradebookEntry, TeacherScanTotal, ClassScanTotal,
+)
+from school_management.points import compact_scan_log, record_scan
+from school_management.scan_debounce import scan_cache
+
+
+@override_settings(QR_SCAN_DEFERRED_POINTS=True, QR_SCAN_DEBOUNCE_SECONDS=0)
+class DeferredScanPointsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        scan_cache().clear()
+        self.teacher = CustomUser.objects.create_user(email='t@example.com', full_name='T', password='tpass', role='teacher')
+        self.student = CustomUser.objects.create_user(email='s@example.com', full_name='S', password='spass', role='student', student_number='S1')
+        self.classroom = ClassRoom.objects.create(class_name='C1', year=2025, semester='first')
+        self.classroom.teachers.add(self.teacher)
+        self.classroom.students.add(self.student)
+        self.session = LessonSession.objects.create(classroom=self.classroom, session_number=1, date=date.today())
+        self.qr_code = StudentQRCode.objects.create(student=self.student)
+        self.scan_url = reverse('school_management:qr_code_scan', kwargs={'qr_code_id': self.qr_code.qr_code_id})
+        self.client = Client()
+        self.client.force_login(self.teacher)
+
+    def displayed_totals(self):
+        qr_page = self.client.get(reverse('school_management:class_qr_codes', kwargs={'class_id': self.classroom.id}))
+        points_page = self.client.get(reverse('school_management:class_points', kwargs={'class_id': self.classroom.id}))
+        grade = points_page.context['student_grades'][0]
+        return {
+            'class_points': qr_page.context['qr_codes'][0]['class_points'],
+            'scan_count': qr_page.context['qr_codes'][0]['scan_count'],
+            'lesson_points': grade['total_points'],
+            'class_points_view': grade['class_points'],
+        }
+
+    def test_scan_only_appends_to_log(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.scan_url, {'class_id': self.classroom.id, 'format': 'json'})
+        self.assertEqual(response.json()['class_points'], 1)
+        writes = [query['sql'] for query in queries.captured_queries if query['sql'].startswith(('INSERT', 'UPDATE'))]
+        self.assertEqual(len(writes), 1)
+        self.assertIn('school_management_qrcodescan', writes[0])
+        self.assertTrue(QRCodeScan.objects.get().points_pending)
+        self.assertFalse(StudentClassPoints.objects.exists())
+
+    def test_compaction_folds_pending_scans(self):
+        for _ in range(3):
+            self.client.get(self.scan_url, {'class_id': self.classroom.id})
+        before = self.displayed_totals()
+        self.assertEqual(before, {'class_points': 3, 'scan_count': 3, 'lesson_points': 3, 'class_points_view': 3})
+
+        self.assertEqual(compact_scan_log(batch_size=2), 3)
+
+        self.assertEqual(self.displayed_totals(), before)
+        self.assertFalse(QRCodeScan.objects.filter(points_pending=True).exists())
+        self.assertEqual(StudentLessonPoints.objects.get(student=self.student, lesson_session=self.session).points, 3)
+        self.assertEqual(StudentClassPoints.objects.get(student=self.student, classroom=self.classroom).points, 3)
+        self.assertEqual(GradebookEntry.objects.get(student=self.student, lesson_session=self.session).qr_points, 3)
+        self.assertEqual(TeacherScanTotal.objects.get(teacher=self.teacher).scan_count, 3)
+        self.assertEqual(ClassScanTotal.objects.get(classroom=self.classroom).scan_count, 3)
+        self.qr_code.refresh_from_db()
+        self.assertEqual(self.qr_code.scan_count, 3)
+        self.assertIsNotNone(self.qr_code.last_used_at)
+        cursor = ScanLogCursor.objects.get(name='points')
+        self.assertEqual(cursor.last_scan_id, QRCodeScan.objects.order_by('-id').first().id)
+        self.assertEqual(cursor.compacted_count, 3)
+
+        # 反映済みの値と新しい未反映分を合算する
+        record_scan(self.qr_code, self.teacher, lesson_session=self.session, classroom=self.classroom)
+        self.assertEqual(self.displayed_totals()['class_points'], 4)
+        self.assertEqual(compact_scan_log(), 1)
+        self.assertEqual(compact_scan_log(), 0)
+        self.assertEqual(StudentClassPoints.objects.get(student=self.student, classroom=self.classroom).points, 4)
+
+    def test_command_reports_compacted_scans(self):
+        record_scan(self.qr_code, self.teacher, classroom=self.classroom)
+        out = io.StringIO()
+        call_command('compact_scan_log', stdout=out)
+        self.assertIn('1件', out.getvalue())
+        self.assertEqual(StudentClassPoints.objects.get(student=self.student, classroom=self.classroom).points, 1)
+        self.assertFalse(StudentLessonPoints.objects.exists())
+
+    def test_detail_pages_include_pending_points(self):
+        for _ in range(2):
+            record_scan(self.qr_code, self.teacher, lesson_session=self.session, classroom=self.classroom)
+
+        response = self.client.get(reverse('school_management:class_detail', kwargs={'class_id': self.classroom.id}))
+        student = next(s for s in response.context['students'] if s.id == self.student.id)
+        self.assertEqual(student.class_point.points, 2)
+
+        response = self.client.get(reverse('school_management:student_detail', kwargs={'student_number': 'S1'}))
+        self.assertEqual(response.context['class_data'][0]['points'], 2)
+
+        self.client.force_login(self.student)
+        response = self.client.get(reverse('school_management:student_dashboard'))
+        self.assertEqual([(p.lesson_session_id, p.points) for p in response.context['lesson_points']], [(self.session.id, 2)])
+        self.assertEqual(response.context['class_points_list'][0]['points'], 2)
+
+        # 反映後も同じ値を表示する
+        compact_scan_log()
+        response = self.client.get(reverse('school_management:student_dashboard'))
+        self.assertEqual([p.points for p in response.context['lesson_points']], [2])
+
+    def test_grade_matrix_includes_first_pending_class_points(self):
+        record_scan(self.qr_code, self.teacher, classroom=self.classroom)
+        self.assertFalse(StudentClassPoints.objects.exists())
+
+        matrix = build_grade_matrix(self.classroom, [self.session])
+        self.assertEqual(matrix.class_points[self.student.id].points, 1)
+
+        response = self.client.get(reverse('school_management:class_evaluation', kwargs={'class_id': self.classroom.id}))
+        self.assertEqual(response.context['student_evaluations'][0]['class_points'], 1)
+
+    def test_absolute_point_writes_do_not_double_count_pending_scans(self):
+        for _ in range(2):
+            record_scan(self.qr_code, self.teacher, classroom=self.classroom)
+
+        # 画面には未反映分を含む 2pt が表示され、教員が 10pt に書き換える
+        response = self.client.post(
+            reverse('school_management:update_student_points', kwargs={'student_id': self.student.id}),
+            {'points': 10, 'class_id': self.classroom.id}, content_type='application/json',
+        )
+        self.assertTrue(response.json()['success'])
+        self.assertEqual(self.displayed_totals()['class_points_view'], 10)
+        compact_scan_log()
+        self.assertEqual(StudentClassPoints.objects.get(student=self.student, classroom=self.classroom).points, 10)
+
+        record_scan(self.qr_code, self.teacher, classroom=self.classroom)
+        response = self.client.post(
+            reverse('school_management:update_attendance_rates', kwargs={'class_id': self.classroom.id}),
+            {'students': [{'student_id': self.student.id, 'attendance_rate': 80, 'total_points': 20, 'attendance_points': 16.0}]},
+            content_type='application/json',
+        )
+        self.assertTrue(response.json()['success'])
+        compact_scan_log()
+        self.assertEqual(StudentClassPoints.objects.get(student=self.student, classroom=self.classroom).points, 20)
@@ -0,0 +1,59 @@
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from school_management.models import CustomUser, ClassRoom, StudentClassPoints
+
+
+class BulkStudentImportTest(TestCase):
+    def setUp(self):
+        self.teacher = CustomUser.objects.create_user(email='t@example.com', full_name='T', password='tpass', role='teacher')
+        self.existing = CustomUser.objects.create_user(
+            email='taken@example.com', full_name='既存', password='spass', role='student', student_number='S000'
+        )
+        self.classroom = ClassRoom.objects.create(class_name='C1', year=2025, semester='first')
+        self.classroom.teachers.add(self.teacher)
+        self.client = Client()
+        self.client.force_login(self.teacher)
+
+    def test_csv_import_creates_students_and_reports_lines(self):
+        lines = [f'S{i:03d},学生{i},s{i}@example.com' for i in range(1, 11)]
+        lines += [
+            'S000,重複',                     # 行11: 既存の学籍番号
+            'S001\t重複2',                   # 行12: 入力内の重複（タブ区切り）
+            'S099,別人,taken@example.com',  # 行13: 既存のメールアドレス
+            'S100',                         # 行14: 項目不足
+        ]
+        url = reverse('school_management:bulk_student_add', kwargs={'class_id': self.classroom.id})
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(url, {'student_data': '\n'.join(lines)})
+        self.assertRedirects(response, reverse('school_management:class_detail', kwargs={'class_id': self.classroom.id}), fetch_redirect_response=False)
+
+        created = CustomUser.objects.filter(student_number__in=[f'S{i:03d}' for i in range(1, 11)])
+        self.assertEqual(created.count(), 10)
+        self.assertEqual(self.classroom.students.count(), 10)
+        self.assertEqual(StudentClassPoints.objects.filter(classroom=self.classroom, points=0).count(), 10)
+        self.assertTrue(created.get(student_number='S005').check_password('student123'))
+        self.assertFalse(CustomUser.objects.filter(student_number__in=['S099', 'S100']).exists())
+        # 行数に関係なく一定のクエリ数
+        self.assertLess(len(ctx.captured_queries), 20)
+
+        errors = [str(m) for m in response.wsgi_request._messages]
+        self.assertEqual(len(errors), 5)  # 成功1件 + 行エラー4件
+        self.assertTrue(errors[1].startswith('行11:'))
+        self.assertTrue(errors[2].startswith('行12:'))
+        self.assertTrue(errors[3].startswith('行13:'))
+        self.assertTrue(errors[4].startswith('行14:'))
+
+    def test_student_create_bulk_mode(self):
+        data = 'S201,学生A,がくせいA\nS202,学生B,がくせいB,b@example.com\nS000,既存,きそん'
+        response = self.client.post(reverse('school_management:student_create'), {
+            'registration_type': 'bulk', 'bulk_student_data': data,
+        })
+        self.assertRedirects(response, reverse('school_management:student_list'), fetch_redirect_response=False)
+        student = CustomUser.objects.get(student_number='S202')
+        self.assertEqual(student.email, 'b@example.com')
+        self.assertEqual(student.furigana, 'がくせいB')
+        self.assertTrue(student.check_password('student_S202'))
+        self.assertIsNone(CustomUser.objects.get(student_number='S201').email)
+        self.assertEqual(CustomUser.objects.filter(student_number='S000').count(), 1)
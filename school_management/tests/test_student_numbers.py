@@ -0,0 +1,45 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase
+from school_management.models import CustomUser
+
+
+class StudentNumberUniquenessTest(TestCase):
+    def create(self, email, student_number, role='student'):
+        return CustomUser.objects.create(email=email, full_name=email, role=role, student_number=student_number)
+
+    def test_unique_only_when_non_empty(self):
+        self.create('a@example.com', 'S001')
+        self.create('t1@example.com', '', role='teacher')
+        self.create('t2@example.com', '', role='teacher')
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            self.create('b@example.com', 'S001')
+
+    def test_dedupe_command_renames_later_duplicates(self):
+        # 制約追加前のデータを再現するため、テスト内だけ一意制約を外す（テスト終了時にロールバックされる）
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP INDEX {connection.ops.quote_name("unique_student_number")}')
+
+        teacher = self.create('t@example.com', 'S001', role='teacher')
+        keep = self.create('a@example.com', 'S001')
+        other = self.create('b@example.com', 'S001')
+        self.create('c@example.com', 'S002')
+
+        out = StringIO()
+        call_command('dedupe_student_numbers', stdout=out)
+        self.assertIn('2件の重複', out.getvalue())
+        self.assertEqual(CustomUser.objects.filter(student_number='S001').count(), 3)
+
+        call_command('dedupe_student_numbers', '--apply', stdout=StringIO())
+        keep.refresh_from_db()
+        teacher.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual(keep.student_number, 'S001')
+        self.assertEqual(teacher.student_number, f'S001-{teacher.id}')
+        self.assertEqual(other.student_number, f'S001-{other.id}')
+
+        out = StringIO()
+        call_command('dedupe_student_numbers', stdout=out)
+        self.assertIn('重複している学籍番号はありません', out.getvalue())
@@ -20,6 +20,7 @@ urlpatterns = [
     path('classes/<int:class_id>/points/', views.class_points_view, name='class_points'),
     path('classes/<int:class_id>/evaluation/', views.class_evaluation_view, name='class_evaluation'),
     path('classes/<int:class_id>/attendance-rate/', views.update_attendance_rate, name='update_attendance_rate'),
+    path('classes/<int:class_id>/attendance-rates/', views.update_attendance_rates, name='update_attendance_rates'),
     path('classes/create/', views.class_create_view, name='class_create'),
     
     # 学生追加（新方式） - より具体的なパターンを先に配置
@@ -39,6 +40,7 @@ urlpatterns = [
     path('sessions/<int:session_id>/quizzes/create/', views.quiz_create_view, name='quiz_create'),
     path('quizzes/<int:quiz_id>/', views.quiz_results_view, name='quiz_detail'),
     path('quizzes/<int:quiz_id>/grading/', views.quiz_grading_view, name='quiz_grading'),
+    path('quizzes/<int:quiz_id>/grading/autosave/', views.quiz_grading_autosave, name='quiz_grading_autosave'),
     path('quizzes/<int:quiz_id>/results/', views.quiz_results_view, name='quiz_results'),
     path('quizzes/<int:quiz_id>/questions/', views.question_manage_view, name='question_manage'),
     path('quizzes/<int:quiz_id>/questions/create/', views.question_create_view, name='question_create'),
@@ -86,6 +88,14 @@ urlpatterns = [
     path('qr-codes/', views.qr_code_list, name='qr_code_list'),
     path('qr-codes/student/<int:student_id>/', views.qr_code_detail, name='qr_code_detail'),
     path('qr-codes/scan/<uuid:qr_code_id>/', views.qr_code_scan, name='qr_code_scan'),
+    path('qr-codes/scan/batch/', views.qr_code_scan_batch, name='qr_code_scan_batch'),
+    path('qr-codes/s/<str:token>/', views.qr_code_scan_signed, name='qr_code_scan_signed'),
+    path('qr-codes/image/<uuid:qr_code_id>.png', views.qr_code_image, name='qr_code_image'),
     path('my-qr-code/', views.student_qr_code_view, name='student_qr_code'),
     path('classes/<int:class_id>/qr-codes/', views.class_qr_codes, name='class_qr_codes'),
+    path('classes/<int:class_id>/qr-codes/export/', views.class_qr_codes_export, name='class_qr_codes_export'),
+    
+    # バックグラウンドジョブ
+    path('jobs/<int:job_id>/', views.job_status, name='job_status'),
+    path('jobs/<int:job_id>/download/', views.job_download, name='job_download'),
 ]
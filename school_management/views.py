@@ -1,19 +1,33 @@
+from django.conf import settings
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import authenticate, login, logout
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from django.http import HttpResponse, JsonResponse
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseBadRequest, HttpResponseForbidden, HttpResponseNotModified, JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
 from django.middleware.csrf import get_token
 from django.db.models import Avg, Count, Q, Max
 from django.db import models, IntegrityError
+from django.core import signing
 from django.utils import timezone
-import qrcode
-import io
-import base64
-from .models import ClassRoom, Student, Teacher, LessonSession, Quiz, QuizScore, PeerEvaluation, Attendance, Group, GroupMember, ContributionEvaluation, CustomUser, StudentQRCode, QRCodeScan, StudentLessonPoints, StudentClassPoints
+from .models import ClassRoom, Student, Teacher, LessonSession, Quiz, CurrentQuizScore, PeerEvaluation, Attendance, Group, GroupMember, ContributionEvaluation, CustomUser, StudentQRCode, QRCodeScan, StudentLessonPoints, StudentClassPoints, GradebookEntry, BackgroundJob, ClassScanTotal, TeacherScanTotal
 from django.urls import reverse
+from .archive import archived_scan_summary
+from .grade_matrix import build_grade_matrix, session_key
+from .grading import current_quiz_scores, save_quiz_scores
+from .jobs import enqueue
+from .peer_results import bump_results_version, get_peer_results
+from .point_rankings import class_point_rankings
+from .points import record_scan, record_scan_batch, save_class_points
+from .qr_images import (
+    content_hash, ensure_qr_codes, get_qr_png, get_qr_pngs, iter_zip, sheet_label, sheet_pdf_file, zip_entry_name,
+)
+from .qr_tokens import is_revoked, read_scan_token
+from .scan_debounce import should_record_scan, suppressed_scan_count
+from .scan_log import merge_pending_lesson_points, pending_class_points, pending_scan_counts
+from .scan_sessions import resolve_scan_target
+from .student_import import format_errors, import_students, parse_student_lines
 
 def login_view(request):
     """ログイン画面"""
@@ -206,12 +220,17 @@ def student_dashboard(request):
         has_peer_evaluation=True
     ).order_by('-date')
     
-    # 学生の授業ごとのポイントを取得
-    lesson_points = StudentLessonPoints.objects.filter(
-        student=request.user
-    ).select_related('lesson_session').order_by('-lesson_session__date')
+    # 学生の授業ごとのポイントを取得（未反映のスキャン分を合算）
+    lesson_points = merge_pending_lesson_points(
+        request.user.id,
+        [classroom.id for classroom in student_classrooms],
+        list(StudentLessonPoints.objects.filter(
+            student=request.user
+        ).select_related('lesson_session').order_by('-lesson_session__date')),
+    )
     
-    # クラスごとのポイントを取得
+    # クラスごとのポイントを取得（未反映のスキャン分を合算）
+    pending_points = pending_class_points([classroom.id for classroom in student_classrooms], [request.user.id])
     class_points_list = []
     for classroom in student_classrooms:
         try:
@@ -219,6 +238,7 @@ def student_dashboard(request):
             class_points = class_points_obj.points
         except StudentClassPoints.DoesNotExist:
             class_points = 0
+        class_points += pending_points.get((request.user.id, classroom.id), 0)
         
         class_points_list.append({
             'classroom': classroom,
@@ -264,6 +284,10 @@ def class_detail_view(request, class_id):
     # テンプレート側で複雑なクエリ呼び出しを避けるため、各 student に class_point を付与
     student_class_points = StudentClassPoints.objects.filter(classroom=classroom, student__in=students)
     scp_map = {scp.student_id: scp for scp in student_class_points}
+    # 未反映のスキャン分を合算（行がまだない学生は保存しない行を作る）
+    for (student_id, _), points in pending_class_points([classroom.id]).items():
+        scp = scp_map.setdefault(student_id, StudentClassPoints(student_id=student_id, classroom=classroom, points=0))
+        scp.points += points
     # 動的に属性を付与（テンプレートで student.class_point として参照できるようにする）
     for s in students:
         setattr(s, 'class_point', scp_map.get(s.id))
@@ -433,17 +457,16 @@ def student_detail_view(request, student_number):
     if not classes.exists():
         classes = student.classroom_set.all()
     
+    # クラスポイントは1回のクエリで取得し、未反映のスキャン分を合算
+    class_points_map = dict(
+        StudentClassPoints.objects.filter(student=student, classroom__in=classes).values_list('classroom_id', 'points')
+    )
+    pending_points = pending_class_points([classroom.id for classroom in classes], [student.id])
     class_data = []
     for classroom in classes:
-        try:
-            class_points_obj = StudentClassPoints.objects.get(student=student, classroom=classroom)
-            class_points = class_points_obj.points
-        except StudentClassPoints.DoesNotExist:
-            class_points = 0
-        
         class_data.append({
             'classroom': classroom,
-            'points': class_points
+            'points': class_points_map.get(classroom.id, 0) + pending_points.get((student.id, classroom.id), 0),
         })
     
     context = {
@@ -469,7 +492,7 @@ def class_student_detail_view(request, class_id, student_number):
     class_sessions = LessonSession.objects.filter(classroom=classroom).order_by('-date')
     
     # このクラスでのクイズ成績を取得
-    quiz_scores = QuizScore.objects.filter(
+    quiz_scores = current_quiz_scores(
         student=student,
         quiz__lesson_session__classroom=classroom
     ).select_related('quiz', 'quiz__lesson_session').order_by('-quiz__lesson_session__date')
@@ -576,69 +599,14 @@ def student_create_view(request):
                 messages.error(request, '学生データを入力してください。')
                 return render(request, 'school_management/student_create.html', {'csrf_token': csrf_token})
             
-            lines = bulk_student_data.split('\n')
-            added_count = 0
-            error_count = 0
-            errors = []
-            
-            for line_num, line in enumerate(lines, 1):
-                line = line.strip()
-                if not line:
-                    continue
-                
-                # カンマで分割
-                parts = [part.strip() for part in line.split(',')]
-                if len(parts) < 3:
-                    errors.append(f'行{line_num}: 必要な項目が不足しています（学籍番号,氏名,ふりがな） - {line}')
-                    error_count += 1
-                    continue
-                
-                student_number = parts[0]
-                full_name = parts[1]
-                furigana = parts[2]
-                email = parts[3] if len(parts) > 3 and parts[3].strip() else None
-                
-                try:
-                    # 重複チェック
-                    if Student.objects.filter(student_number=student_number).exists():
-                        errors.append(f'行{line_num}: 学籍番号 "{student_number}" は既に登録されています')
-                        error_count += 1
-                        continue
-                    
-                    # メールアドレスの重複チェック（null値は除外）
-                    if email and Student.objects.filter(email=email).exists():
-                        errors.append(f'行{line_num}: メールアドレス "{email}" は既に登録されています')
-                        error_count += 1
-                        continue
-                    
-                    # 学生作成
-                    # デフォルトパスワードを生成（学籍番号をベースに）
-                    default_password = f"student_{student_number}"
-                    
-                    Student.objects.create_user(
-                        email=email,
-                        full_name=full_name,
-                        password=default_password,
-                        student_number=student_number,
-                        furigana=furigana,
-                        role='student'
-                    )
-                    added_count += 1
-                    
-                except IntegrityError as e:
-                    # データベース制約違反の場合
-                    error_message = str(e).lower()
-                    if 'student_number' in error_message or 'unique constraint' in error_message:
-                        errors.append(f'行{line_num}: 学籍番号 "{student_number}" は既に登録されています')
-                    elif 'email' in error_message:
-                        errors.append(f'行{line_num}: メールアドレス "{email}" は既に登録されています')
-                    else:
-                        errors.append(f'行{line_num}: データの重複により登録できませんでした')
-                    error_count += 1
-                    
-                except Exception as e:
-                    errors.append(f'行{line_num}: 作成エラー - {str(e)}')
-                    error_count += 1
+            rows, parse_errors = parse_student_lines(
+                bulk_student_data, ('student_number', 'full_name', 'furigana', 'email'), required=3
+            )
+            # デフォルトパスワードは学籍番号をベースに生成
+            students, import_errors = import_students(rows, lambda row: f"student_{row.student_number}")
+            added_count = len(students)
+            errors = format_errors(parse_errors + import_errors)
+            error_count = len(errors)
             
             # 結果メッセージ
             if added_count > 0:
@@ -742,17 +710,10 @@ def peer_evaluation_create_view(request, session_id):
 
 def peer_evaluation_form_view(request, token):
     """匿名ピア評価フォーム（学生用）"""
-    # トークンからセッション情報を取得（簡易実装）
-    import hashlib
-    
     try:
-        # トークンの検証とセッション取得
-        for session in LessonSession.objects.filter(has_peer_evaluation=True):
-            session_token = hashlib.md5(f"peer_{session.id}".encode()).hexdigest()
-            if session_token == token:
-                target_session = session
-                break
-        else:
+        # トークンの検証とセッション取得（インデックス付きの列で1回検索）
+        target_session = LessonSession.objects.filter(peer_token=token, has_peer_evaluation=True).first()
+        if target_session is None:
             messages.error(request, '無効なリンクです。')
             return redirect('school_management:login')
             
@@ -848,9 +809,8 @@ def peer_evaluation_link_view(request, session_id):
     """ピア評価リンク生成"""
     session = get_object_or_404(LessonSession, id=session_id, classroom__teachers=request.user)
     
-    # 匿名トークン生成
-    import hashlib
-    token = hashlib.md5(f"peer_{session.id}".encode()).hexdigest()
+    # 匿名トークン
+    token = session.peer_token
     
     context = {
         'session': session,
@@ -863,70 +823,17 @@ def peer_evaluation_link_view(request, session_id):
 def peer_evaluation_results_view(request, session_id):
     """ピア評価結果表示"""
     session = get_object_or_404(LessonSession, id=session_id, classroom__teachers=request.user)
-    evaluations = session.peerevaluation_set.all()
-    
-    # 結果集計
-    group_votes = {}
-    contribution_scores = {}
-    
-    for evaluation in evaluations:
-        # グループ投票集計
-        if evaluation.first_place_group:
-            group_name = f"グループ{evaluation.first_place_group.group_number}"
-            if group_name not in group_votes:
-                group_votes[group_name] = {'first': 0, 'second': 0}
-            group_votes[group_name]['first'] += 1
-            
-        if evaluation.second_place_group:
-            group_name = f"グループ{evaluation.second_place_group.group_number}"
-            if group_name not in group_votes:
-                group_votes[group_name] = {'first': 0, 'second': 0}
-            group_votes[group_name]['second'] += 1
-        
-        # 貢献度評価集計
-        for contrib_eval in evaluation.contributionevaluation_set.all():
-            student_name = contrib_eval.evaluatee.full_name
-            if student_name not in contribution_scores:
-                contribution_scores[student_name] = []
-            contribution_scores[student_name].append(contrib_eval.contribution_score)
-    
-    # 平均貢献度計算
-    avg_contribution_scores = {}
-    for student, scores in contribution_scores.items():
-        avg_contribution_scores[student] = sum(scores) / len(scores)
-
-    # グループ別集計（新テンプレート用）
-    groups = session.group_set.all()
-    group_stats = {}
-    
-    for group in groups:
-        # このグループが1位に選ばれた回数
-        first_place_votes = evaluations.filter(first_place_group=group).count()
-        # このグループが2位に選ばれた回数
-        second_place_votes = evaluations.filter(second_place_group=group).count()
-        # このグループが評価した回数
-        evaluations_given = evaluations.filter(evaluator_group=group).count()
-        
-        group_stats[group.id] = {
-            'group': group,
-            'first_place_votes': first_place_votes,
-            'second_place_votes': second_place_votes,
-            'total_votes': first_place_votes + second_place_votes,
-            'evaluations_given': evaluations_given,
-            'score': first_place_votes * 2 + second_place_votes  # 1位=2点、2位=1点でスコア計算
-        }
-    
-    # スコア順でソート
-    sorted_groups = sorted(group_stats.values(), key=lambda x: x['score'], reverse=True)
+    results = get_peer_results(session)
     
     context = {
         'lesson_session': session,  # テンプレートとの整合性を保つためにキー名を変更
-        'evaluations': evaluations,
-        'group_votes': group_votes,
-        'avg_contribution_scores': avg_contribution_scores,
-        'group_stats': sorted_groups,  # 新テンプレート用
-        'total_evaluations': evaluations.count(),  # 新テンプレート用
-        'total_groups': groups.count(),  # 新テンプレート用
+        'evaluations': results.evaluations,
+        'group_votes': results.group_votes,
+        'avg_contribution_scores': results.avg_contribution_scores,
+        'group_stats': results.group_stats,  # 新テンプレート用
+        'student_stats': results.student_stats,
+        'total_evaluations': results.total_evaluations,  # 新テンプレート用
+        'total_groups': results.total_groups,  # 新テンプレート用
     }
     return render(request, 'school_management/peer_evaluation_results.html', context)
 
@@ -987,7 +894,7 @@ def quiz_grading_view(request, quiz_id):
     students = quiz.lesson_session.classroom.students.all()
     
     # 採点結果を学生IDをキーにして辞書作成
-    score_objects = QuizScore.objects.filter(quiz=quiz, is_cancelled=False).select_related('student')
+    score_objects = current_quiz_scores(quiz=quiz).select_related('student')
     scores = {score.student.student_number: score for score in score_objects}
     
     # 学生リストに採点情報を追加
@@ -1005,26 +912,20 @@ def quiz_grading_view(request, quiz_id):
         
         if action == 'save_scores':
             # 採点結果保存
-            teacher = request.user  # 現在のユーザーを採点者として使用
-            
+            submitted = {}
             for student in students:
                 score_value = request.POST.get(f'score_{student.student_number}')
                 if score_value and score_value.strip():
                     try:
                         score = int(score_value)
                         if 0 <= score <= quiz.max_score:
-                            # 既存の採点結果があれば削除
-                            QuizScore.objects.filter(quiz=quiz, student=student, is_cancelled=False).update(is_cancelled=True)
-                            # 新しい採点結果を作成
-                            QuizScore.objects.create(
-                                quiz=quiz,
-                                student=student,
-                                score=score,
-                                graded_by=teacher
-                            )
+                            submitted[student.id] = score
                     except ValueError:
                         pass  # 無効な値は無視
             
+            # 変更のあった得点のみ1つのトランザクションで保存（現在のユーザーを採点者として使用）
+            save_quiz_scores(quiz, submitted, graded_by=request.user)
+            
             messages.success(request, '採点結果を保存しました。')
             return redirect('school_management:quiz_grading', quiz_id=quiz_id)
     
@@ -1034,14 +935,85 @@ def quiz_grading_view(request, quiz_id):
         'students': students,
         'graded_count': len(scores),
         'quick_buttons': quiz.quick_buttons or {},
+        'quick_scores': quick_scores(quiz),
     }
     return render(request, 'school_management/quiz_grading.html', context)
 
+
+def quick_scores(quiz):
+    """クイック採点ボタンの点数（quick_buttons が未設定なら 0・半分・満点）"""
+    buttons = quiz.quick_buttons
+    if isinstance(buttons, dict):
+        buttons = list(buttons.values())
+    if not isinstance(buttons, list) or not buttons:
+        buttons = [0, quiz.max_score // 2, quiz.max_score]
+    scores = []
+    for value in buttons:
+        if isinstance(value, int) and 0 <= value <= quiz.max_score and value not in scores:
+            scores.append(value)
+    return scores
+
+
+@login_required
+@require_POST
+def quiz_grading_autosave(request, quiz_id):
+    """採点結果を1件ずつ（または数件まとめて）保存するAPI
+
+    JSON ボディで { "scores": [{"student_id": <学生ID>, "score": <点数>}, ...] } を受け取る。
+    同じ点数の再送信は書き込みを行わない。更新後の採点済み人数を返す。
+    """
+    import json
+    
+    quiz = get_object_or_404(Quiz, id=quiz_id, lesson_session__classroom__teachers=request.user)
+    
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'success': False, 'error': '不正なリクエストです'}, status=400)
+    items = data.get('scores') if isinstance(data, dict) else None
+    if not isinstance(items, list) or not items or len(items) > 200:
+        return JsonResponse({'success': False, 'error': 'scores は1〜200件の配列で指定してください'}, status=400)
+    
+    # クラスに所属しているかを1回のクエリで確認
+    requested_ids = {
+        item.get('student_id') for item in items
+        if isinstance(item, dict)
+        and isinstance(item.get('student_id'), int) and not isinstance(item.get('student_id'), bool)
+    }
+    enrolled_ids = set(
+        quiz.lesson_session.classroom.students.filter(id__in=requested_ids).values_list('id', flat=True)
+    )
+    
+    submitted = {}
+    results = []
+    for item in items:
+        student_id = item.get('student_id') if isinstance(item, dict) else None
+        score = item.get('score') if isinstance(item, dict) else None
+        if not isinstance(student_id, int) or isinstance(student_id, bool) or student_id not in enrolled_ids:
+            results.append({'student_id': student_id, 'status': 'error', 'error': 'この学生はクラスに所属していません'})
+        elif not isinstance(score, int) or isinstance(score, bool) or not 0 <= score <= quiz.max_score:
+            results.append({'student_id': student_id, 'status': 'error', 'error': f'点数は0〜{quiz.max_score}の整数で入力してください'})
+        else:
+            submitted[student_id] = score
+            results.append({'student_id': student_id, 'score': score})
+    
+    changed = set(save_quiz_scores(quiz, submitted, graded_by=request.user))
+    for result in results:
+        if 'score' in result:
+            result['status'] = 'saved' if result['student_id'] in changed else 'unchanged'
+    
+    graded_count = CurrentQuizScore.objects.filter(quiz=quiz).count()
+    return JsonResponse({
+        'success': all(result['status'] != 'error' for result in results),
+        'results': results,
+        'graded_count': graded_count,
+    })
+
 @login_required
 def quiz_results_view(request, quiz_id):
     """小テスト結果表示"""
     quiz = get_object_or_404(Quiz, id=quiz_id, lesson_session__classroom__teachers=request.user)
-    scores = QuizScore.objects.filter(quiz=quiz, is_cancelled=False).select_related('student').order_by('student__student_number')
+    scores = current_quiz_scores(quiz=quiz).select_related('student').order_by('student__student_number')
     
     # 統計情報計算
     score_values = [score.score for score in scores]
@@ -1271,61 +1243,20 @@ def bulk_student_add_csv(request, class_id):
             messages.error(request, '学生データを入力してください。')
             return render(request, 'school_management/bulk_student_add.html', {'classroom': classroom})
         
-        lines = student_data.split('\n')
-        added_count = 0
-        error_count = 0
-        errors = []
+        if settings.BACKGROUND_JOBS:
+            # ワーカーで実行し、進捗ページへ移動する
+            job = enqueue('import_students', {'class_id': classroom.id, 'student_data': student_data}, user=request.user)
+            return redirect('school_management:job_status', job_id=job.id)
         
-        for line_num, line in enumerate(lines, 1):
-            line = line.strip()
-            if not line:
-                continue
-                
-            # タブまたはカンマで分割
-            parts = line.replace('\t', ',').split(',')
-            if len(parts) < 2:
-                errors.append(f'行{line_num}: 形式が正しくありません - {line}')
-                error_count += 1
-                continue
-            
-            student_number = parts[0].strip()
-            full_name = parts[1].strip()
-            email = parts[2].strip() if len(parts) > 2 and parts[2].strip() else None
-            
-            try:
-                # 重複チェック（学籍番号またはメールアドレス）
-                if Student.objects.filter(student_number=student_number).exists():
-                    errors.append(f'行{line_num}: 学生番号が既に存在します - {student_number}')
-                    error_count += 1
-                    continue
-                    
-                # メールアドレスの重複チェック（null値は除外）
-                if email and Student.objects.filter(email=email).exists():
-                    errors.append(f'行{line_num}: メールアドレスが既に存在します - {email}')
-                    error_count += 1
-                    continue
-                
-                # 学生作成（統合ユーザーモデル）
-                student = Student.objects.create_user(
-                    email=email,
-                    full_name=full_name,
-                    password='student123',  # デフォルトパスワード
-                    role='student',
-                    student_number=student_number,
-                )
-                # クラスに学生を追加
-                classroom.students.add(student)
-                # クラスポイントを0で初期化
-                StudentClassPoints.objects.get_or_create(
-                    student=student,
-                    classroom=classroom,
-                    defaults={'points': 0}
-                )
-                added_count += 1
-                
-            except Exception as e:
-                errors.append(f'行{line_num}: エラー - {str(e)}')
-                error_count += 1
+        # タブまたはカンマ区切り（学籍番号,氏名,メールアドレス）
+        rows, parse_errors = parse_student_lines(
+            student_data, ('student_number', 'full_name', 'email'), required=2, separators=(',', '\t')
+        )
+        # 学生作成・クラスへの追加・クラスポイントの初期化を一括で行う
+        students, import_errors = import_students(rows, lambda row: 'student123', classroom=classroom)  # デフォルトパスワード
+        added_count = len(students)
+        errors = format_errors(parse_errors + import_errors)
+        error_count = len(errors)
         
         # 結果メッセージ
         if added_count > 0:
@@ -1745,6 +1676,7 @@ def close_peer_evaluation(request, session_id):
     if request.method == 'POST':
         lesson_session.peer_evaluation_closed = True
         lesson_session.save()
+        bump_results_version(lesson_session.id)
         
         from django.contrib import messages
         messages.success(request, 'ピア評価を締め切りました。')
@@ -1763,6 +1695,7 @@ def reopen_peer_evaluation(request, session_id):
     if request.method == 'POST':
         lesson_session.peer_evaluation_closed = False
         lesson_session.save()
+        bump_results_version(lesson_session.id)
         
         from django.contrib import messages
         messages.success(request, 'ピア評価を再開しました。')
@@ -1778,41 +1711,16 @@ def peer_evaluation_results(request, session_id):
     if request.user.role not in ['teacher', 'admin']:
         return redirect('school_management:dashboard')
     
-    # ピア評価データを取得
-    evaluations = PeerEvaluation.objects.filter(lesson_session=lesson_session).select_related(
-        'evaluator_group', 'first_place_group', 'second_place_group'
-    )
-    
-    # グループ別集計
-    groups = Group.objects.filter(lesson_session=lesson_session)
-    group_stats = {}
-    
-    for group in groups:
-        # このグループが1位に選ばれた回数
-        first_place_votes = evaluations.filter(first_place_group=group).count()
-        # このグループが2位に選ばれた回数
-        second_place_votes = evaluations.filter(second_place_group=group).count()
-        # このグループが評価した回数
-        evaluations_given = evaluations.filter(evaluator_group=group).count()
-        
-        group_stats[group.id] = {
-            'group': group,
-            'first_place_votes': first_place_votes,
-            'second_place_votes': second_place_votes,
-            'total_votes': first_place_votes + second_place_votes,
-            'evaluations_given': evaluations_given,
-            'score': first_place_votes * 2 + second_place_votes  # 1位=2点、2位=1点でスコア計算
-        }
-    
-    # スコア順でソート
-    sorted_groups = sorted(group_stats.values(), key=lambda x: x['score'], reverse=True)
+    # ピア評価データを集計
+    results = get_peer_results(lesson_session)
     
     context = {
         'lesson_session': lesson_session,
-        'evaluations': evaluations,
-        'group_stats': sorted_groups,
-        'total_evaluations': evaluations.count(),
-        'total_groups': groups.count(),
+        'evaluations': results.evaluations,
+        'group_stats': results.group_stats,
+        'student_stats': results.student_stats,
+        'total_evaluations': results.total_evaluations,
+        'total_groups': results.total_groups,
     }
     
     return render(request, 'school_management/peer_evaluation_results.html', context)
@@ -1843,13 +1751,8 @@ def update_student_points(request, student_id):
             # 担当教師のチェックを追加
             classroom = get_object_or_404(ClassRoom, id=class_id, teachers=request.user)
             
-            scp, created = StudentClassPoints.objects.get_or_create(
-                student=student,
-                classroom=classroom,
-                defaults={'points': 0}
-            )
-            scp.points = int(points)
-            scp.save()
+            # 画面の値（未反映のスキャン分を含む）で上書きする
+            save_class_points(classroom, {student.id: {'points': int(points)}})
 
             return JsonResponse({'success': True, 'message': 'ポイントが更新されました'})
         except Exception as e:
@@ -1892,30 +1795,27 @@ def qr_code_list(request):
         messages.error(request, '教員のみアクセス可能です。')
         return redirect('school_management:dashboard')
     
-    # 担当クラスを取得
-    classrooms = ClassRoom.objects.filter(teachers=request.user).order_by('-year', '-semester', 'class_name')
+    # 担当クラスを取得（学生数は集計、スキャン数はスキャン時に加算済みの累計を使う）
+    classrooms = ClassRoom.objects.filter(teachers=request.user).annotate(
+        student_count=Count('students', distinct=True)
+    ).order_by('-year', '-semester', 'class_name')
+    scan_totals = dict(
+        ClassScanTotal.objects.filter(classroom__in=classrooms).values_list('classroom_id', 'scan_count')
+    )
+    pending_scans = pending_scan_counts('classroom_id', [classroom.id for classroom in classrooms])
     
-    # 各クラスの学生数とポイント情報を取得
-    class_data = []
-    for classroom in classrooms:
-        student_count = classroom.students.count()
-        
-        # このクラスの学生のQRコードスキャン数を集計
-        students = classroom.students.all()
-        total_scans = 0
-        for student in students:
-            qr_code = StudentQRCode.objects.filter(student=student).first()
-            if qr_code:
-                total_scans += qr_code.scans.count()
-        
-        class_data.append({
+    class_data = [
+        {
             'classroom': classroom,
-            'student_count': student_count,
-            'total_scans': total_scans,
-        })
+            'student_count': classroom.student_count,
+            'total_scans': scan_totals.get(classroom.id, 0) + pending_scans.get(classroom.id, 0),
+        }
+        for classroom in classrooms
+    ]
     
     context = {
         'classes': class_data,
+        'suppressed_scans_today': suppressed_scan_count(request.user.id),
     }
     return render(request, 'school_management/qr_code_list.html', context)
 
@@ -1938,30 +1838,26 @@ def class_qr_codes(request, class_id):
     # このクラスに在籍している学生のみを取得
     students = classroom.students.all()
     
+    # QRコードとクラスポイントをまとめて取得（QRコードがない学生は一括作成）
+    student_qr_codes = ensure_qr_codes(students)
+    class_points_map = dict(
+        StudentClassPoints.objects.filter(classroom=classroom).values_list('student_id', 'points')
+    )
+    # 未反映のスキャン分
+    pending_points = pending_class_points([classroom.id])
+    pending_scans = pending_scan_counts('qr_code_id', [qr_code.id for qr_code in student_qr_codes.values()])
+    
     # 各学生のQRコード情報を取得
     qr_codes = []
     for student in students:
-        qr_code, created = StudentQRCode.objects.get_or_create(
-            student=student,
-            defaults={'is_active': True}
-        )
-        scan_url = request.build_absolute_uri(
-            reverse('school_management:qr_code_scan', kwargs={'qr_code_id': qr_code.qr_code_id})
-        ) + f'?class_id={class_id}'
-        
-        # このクラスでのポイントを取得
-        try:
-            class_points_obj = StudentClassPoints.objects.get(student=student, classroom=classroom)
-            class_points = class_points_obj.points
-        except StudentClassPoints.DoesNotExist:
-            class_points = 0
+        qr_code = student_qr_codes[student.id]
         
         qr_codes.append({
             'student': student,
             'qr_code': qr_code,
-            'scan_count': qr_code.scans.count(),
-            'qr_image': generate_qr_code_image(scan_url),
-            'class_points': class_points  # クラスごとのポイントを追加
+            'scan_count': qr_code.scan_count + pending_scans.get(qr_code.id, 0),
+            'qr_image_url': qr_image_url(qr_code, class_id),
+            'class_points': class_points_map.get(student.id, 0) + pending_points.get((student.id, classroom.id), 0)  # クラスごとのポイントを追加
         })
     
     context = {
@@ -1971,6 +1867,43 @@ def class_qr_codes(request, class_id):
     return render(request, 'school_management/class_qr_codes.html', context)
 
 
+@login_required
+def class_qr_codes_export(request, class_id):
+    """クラス全員のQRコードを1つのPDF（またはPNGのZIP）として出力"""
+    if not request.user.is_teacher:
+        messages.error(request, '教員のみアクセス可能です。')
+        return redirect('school_management:dashboard')
+    
+    classroom = get_object_or_404(ClassRoom, id=class_id, teachers=request.user)
+    export_format = request.GET.get('format', 'pdf')
+    if export_format not in ('pdf', 'zip'):
+        return HttpResponseBadRequest('format は pdf または zip を指定してください')
+    
+    if settings.BACKGROUND_JOBS:
+        # ワーカーで作成し、進捗ページからダウンロードする
+        job = enqueue('qr_sheet', {
+            'class_id': classroom.id,
+            'format': export_format,
+            'base_url': request.build_absolute_uri('/'),
+        }, user=request.user)
+        return redirect('school_management:job_status', job_id=job.id)
+    
+    students = list(classroom.students.all().order_by('student_number'))
+    student_qr_codes = ensure_qr_codes(students)
+    scan_urls = [build_scan_url(request, student_qr_codes[student.id], class_id) for student in students]
+    pngs = get_qr_pngs(scan_urls)
+    
+    filename = f'qr_codes_class{classroom.id}'
+    if export_format == 'zip':
+        files = [(zip_entry_name(student), pngs[scan_url]) for student, scan_url in zip(students, scan_urls)]
+        response = StreamingHttpResponse(iter_zip(files), content_type='application/zip')
+        response['Content-Disposition'] = f'attachment; filename="{filename}.zip"'
+        return response
+    
+    items = [(sheet_label(student), pngs[scan_url]) for student, scan_url in zip(students, scan_urls)]
+    return FileResponse(sheet_pdf_file(items), as_attachment=True, filename=f'{filename}.pdf', content_type='application/pdf')
+
+
 @login_required
 def qr_code_detail(request, student_id):
     """学生のQRコード詳細表示"""
@@ -1993,9 +1926,6 @@ def qr_code_detail(request, student_id):
     
     # スキャン履歴を取得
     scans = qr_code.scans.select_related('scanned_by').order_by('-scanned_at')
-    scan_url = request.build_absolute_uri(
-        reverse('school_management:qr_code_scan', kwargs={'qr_code_id': qr_code.qr_code_id})
-    )
     
     # クラスIDをGETパラメータから取得
     class_id = request.GET.get('class_id')
@@ -2010,129 +1940,297 @@ def qr_code_detail(request, student_id):
         'student': student,
         'qr_code': qr_code,
         'scans': scans,
-        'qr_image': generate_qr_code_image(scan_url),
-        'total_points': scans.aggregate(total=models.Sum('points_awarded'))['total'] or 0,
+        'qr_image_url': qr_image_url(qr_code),
         'classroom': classroom,
+        **scan_history_totals(qr_code, scans),
     }
     return render(request, 'school_management/qr_code_detail.html', context)
 
 
+def scan_history_totals(qr_code, scans):
+    """スキャン数・獲得ポイントの合計（現在のスキャン履歴 + アーカイブ済みの集計）"""
+    live = scans.aggregate(count=Count('id'), total=models.Sum('points_awarded'))
+    archived_count, archived_points = archived_scan_summary(qr_code=qr_code)
+    return {
+        'scan_count': live['count'] + archived_count,
+        'total_points': (live['total'] or 0) + archived_points,
+        'archived_scan_count': archived_count,
+    }
+
+
+def _wants_json(request):
+    """?format=json または Accept: application/json の場合にJSONで応答する"""
+    return request.GET.get('format') == 'json' or 'application/json' in request.headers.get('Accept', '')
+
+
 def qr_code_scan(request, qr_code_id):
-    """QRコードスキャン処理（先生専用）"""
+    """QRコードスキャン処理（先生専用）
+
+    ?format=json または Accept: application/json の場合は、スキャナーアプリ向けに
+    学生名・付与ポイント・加算後のクラスポイントだけをJSONで返す。
+    """
     try:
-        qr_code = get_object_or_404(StudentQRCode, qr_code_id=qr_code_id, is_active=True)
-        
-        # ログインしていない場合はログインページにリダイレクト
-        if not request.user.is_authenticated:
-            messages.warning(request, 'QRコードをスキャンするにはログインが必要です。')
-            return redirect('school_management:login')
-        
-        # 先生のみスキャン可能
-        if not request.user.is_teacher:
-            messages.error(request, 'QRコードのスキャンは先生のみ可能です。')
-            return redirect('school_management:student_dashboard')
-        
-        # クラスIDをGETパラメータから取得
-        class_id = request.GET.get('class_id')
-        target_classroom = None
-        if class_id:
-            try:
-                target_classroom = ClassRoom.objects.get(id=class_id, teachers=request.user)
-            except ClassRoom.DoesNotExist:
-                pass
-        
-        # 現在の授業セッションを取得（先生が担当する授業の中で今日の日付のもの）
-        from datetime import date
-        today = date.today()
-        current_session = None
-        
-        # 先生が担当する授業セッションを取得
-        if target_classroom:
-            # 指定されたクラスの今日の授業セッション
-            teacher_sessions = LessonSession.objects.filter(
-                classroom=target_classroom,
-                date=today
-            ).order_by('-created_at')
-        else:
-            # すべての担当クラスから今日の授業セッション
-            teacher_sessions = LessonSession.objects.filter(
-                classroom__teachers=request.user,
-                date=today
-            ).order_by('-created_at')
-        
-        if teacher_sessions.exists():
-            current_session = teacher_sessions.first()
-        
-        # スキャン処理
-        scan = QRCodeScan.objects.create(
-            qr_code=qr_code,
-            scanned_by=request.user,
-            lesson_session=current_session,
-            points_awarded=1
-        )
-        
-        # ポイントを更新（授業セッションがなくてもクラスが指定されていればポイント付与）
-        update_classroom = current_session.classroom if current_session else target_classroom
-        
-        if update_classroom:
-            # 授業セッションごとのポイント（セッションがある場合のみ）
-            if current_session:
-                student_lesson_points, created = StudentLessonPoints.objects.get_or_create(
-                    student=qr_code.student,
-                    lesson_session=current_session,
-                    defaults={'points': 0}
-                )
-                student_lesson_points.points += 1
-                student_lesson_points.save()
+        qr_code = get_object_or_404(StudentQRCode.objects.select_related('student'), qr_code_id=qr_code_id, is_active=True)
+        return _record_qr_scan(request, qr_code, request.GET.get('class_id'))
+    except Http404 as e:
+        return _qr_scan_error(request, f'QRコードのスキャンに失敗しました: {str(e)}', status=404)
+    except Exception as e:
+        return _qr_scan_error(request, f'QRコードのスキャンに失敗しました: {str(e)}')
 
-            # クラス累計ポイントを更新（必ず更新）
-            try:
-                scp, scp_created = StudentClassPoints.objects.get_or_create(
-                    student=qr_code.student,
-                    classroom=update_classroom,
-                    defaults={'points': 0}
-                )
-                scp.points += 1
-                scp.save()
-            except Exception as e:
-                # クラスポイント更新失敗をログに記録
-                import logging
-                logger = logging.getLogger(__name__)
-                logger.error(f'クラスポイント更新エラー: {str(e)}')
-        
-        # QRコードの最終使用日時を更新
-        qr_code.last_used_at = timezone.now()
-        qr_code.save()
-        
-        # スキャン成功ページを表示
-        user_scan_count = QRCodeScan.objects.filter(scanned_by=request.user).count()
-        
-        # 学生のクラスポイントを取得（表示用）
-        student_class_points = None
-        if update_classroom:
-            try:
-                scp = StudentClassPoints.objects.get(student=qr_code.student, classroom=update_classroom)
-                student_class_points = scp.points
-            except StudentClassPoints.DoesNotExist:
-                student_class_points = 0
-        
+
+def qr_code_scan_signed(request, token):
+    """署名付きQRコードのスキャン処理（先生専用、JSON応答は qr_code_scan と同じ）
+
+    トークンの署名を検証し、QRコード・クラスはトークンの値を使う（StudentQRCode は検索しない）。
+    表示する学生名のために学生のみ主キーで読み込む。
+    """
+    try:
+        qr_code_pk, student_id, class_id = read_scan_token(token)
+    except signing.BadSignature:
+        return _qr_scan_error(request, 'QRコードが正しくありません。', status=404)
+    if is_revoked(qr_code_pk):
+        return _qr_scan_error(request, 'このQRコードは無効化されています。', status=404)
+    student = CustomUser.objects.only('id', 'full_name', 'student_number').filter(pk=student_id).first()
+    if student is None:
+        return _qr_scan_error(request, 'QRコードが正しくありません。', status=404)
+    
+    try:
+        return _record_qr_scan(request, StudentQRCode(pk=qr_code_pk, student=student), class_id)
+    except Exception as e:
+        return _qr_scan_error(request, f'QRコードのスキャンに失敗しました: {str(e)}')
+
+
+def _qr_scan_error(request, error_message, status=400):
+    if _wants_json(request):
+        return JsonResponse({'success': False, 'error': error_message}, status=status)
+    context = {
+        'qr_code': None,
+        'error_message': error_message,
+    }
+    return render(request, 'school_management/qr_code_scan.html', context)
+
+
+def _qr_scan_json(qr_code, classroom, lesson_session, recorded, class_points=None):
+    return JsonResponse({
+        'success': True,
+        'recorded': recorded,
+        'student_name': qr_code.student.full_name,
+        'class_id': classroom.id if classroom else None,
+        'lesson_session_id': lesson_session.id if lesson_session else None,
+        'points_added': 1 if recorded and classroom else 0,
+        'class_points': class_points,
+    })
+
+
+def _record_qr_scan(request, qr_code, class_id):
+    """スキャンを記録して結果ページ（またはJSON）を返す（qr_code_scan / qr_code_scan_signed 共通）"""
+    # ログインしていない場合はログインページにリダイレクト
+    if not request.user.is_authenticated:
+        if _wants_json(request):
+            return JsonResponse({'success': False, 'error': 'QRコードをスキャンするにはログインが必要です。'}, status=401)
+        messages.warning(request, 'QRコードをスキャンするにはログインが必要です。')
+        return redirect('school_management:login')
+    
+    # 先生のみスキャン可能
+    if not request.user.is_teacher:
+        if _wants_json(request):
+            return JsonResponse({'success': False, 'error': 'QRコードのスキャンは先生のみ可能です。'}, status=403)
+        messages.error(request, 'QRコードのスキャンは先生のみ可能です。')
+        return redirect('school_management:student_dashboard')
+    
+    # 指定クラスと今日の授業セッションを取得（教員・クラス・日付ごとにキャッシュ）
+    target_classroom, current_session = resolve_scan_target(request.user, class_id)
+    
+    # ポイントを更新（授業セッションがなくてもクラスが指定されていればポイント付与）
+    update_classroom = current_session.classroom if current_session else target_classroom
+    
+    # 直前に同じスキャンがあれば記録せずに応答する
+    if not should_record_scan(qr_code.pk, request.user.id, current_session, update_classroom):
+        if _wants_json(request):
+            return _qr_scan_json(qr_code, update_classroom, current_session, recorded=False)
         context = {
             'qr_code': qr_code,
             'lesson_session': current_session,
             'scan_time': timezone.now().strftime('%Y年%m月%d日 %H:%M'),
-            'user_scan_count': user_scan_count,
             'classroom': update_classroom,
-            'student_class_points': student_class_points,
-            'points_added': True if update_classroom else False,
-        }
-        return render(request, 'school_management/qr_code_scan.html', context)
-        
-    except Exception as e:
-        context = {
-            'qr_code': None,
-            'error_message': f'QRコードのスキャンに失敗しました: {str(e)}'
+            'duplicate': True,
+            'points_added': False,
         }
         return render(request, 'school_management/qr_code_scan.html', context)
+    
+    # スキャン履歴の作成とポイント加算を1トランザクションで実行
+    scan = record_scan(
+        qr_code,
+        request.user,
+        lesson_session=current_session,
+        classroom=update_classroom,
+        points=1
+    )
+    
+    # スキャナーアプリ向けには書き込み時に得た値だけを返す
+    if _wants_json(request):
+        return _qr_scan_json(qr_code, update_classroom, current_session, recorded=True, class_points=scan.class_points)
+    
+    # スキャン成功ページを表示
+    user_scan_count = TeacherScanTotal.objects.filter(teacher=request.user).values_list('scan_count', flat=True).first() or 0
+    user_scan_count += pending_scan_counts('scanned_by_id', [request.user.id]).get(request.user.id, 0)
+    
+    context = {
+        'qr_code': qr_code,
+        'lesson_session': current_session,
+        'scan_time': timezone.now().strftime('%Y年%m月%d日 %H:%M'),
+        'user_scan_count': user_scan_count,
+        'classroom': update_classroom,
+        'student_class_points': scan.class_points,
+        'points_added': True if update_classroom else False,
+    }
+    return render(request, 'school_management/qr_code_scan.html', context)
+
+
+@login_required
+@require_POST
+def qr_code_scan_batch(request):
+    """端末にためたスキャンをまとめて登録するAPI（先生専用）
+
+    JSON ボディで { "scans": [{"qr_code_id", "class_id", "scanned_at", "client_scan_id"}, ...] } を受け取る。
+    client_scan_id が登録済みのスキャンは再登録せず duplicate を返すため、同じ内容を何度送信してもよい。
+    """
+    import json
+    import uuid
+    from datetime import timedelta
+    from django.utils.dateparse import parse_datetime
+    
+    if not request.user.is_teacher:
+        return JsonResponse({'success': False, 'error': 'QRコードのスキャンは先生のみ可能です。'}, status=403)
+    
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'success': False, 'error': '不正なリクエストです'}, status=400)
+    items = data.get('scans') if isinstance(data, dict) else None
+    if not isinstance(items, list) or not items or len(items) > 500:
+        return JsonResponse({'success': False, 'error': 'scans は1〜500件の配列で指定してください'}, status=400)
+    items = [item if isinstance(item, dict) else {} for item in items]
+    
+    # QRコード・担当クラスをまとめて取得
+    def parse_uuid(value):
+        try:
+            return uuid.UUID(value) if isinstance(value, str) else None
+        except ValueError:
+            return None
+    
+    qr_code_ids = {parse_uuid(item.get('qr_code_id')) for item in items} - {None}
+    qr_codes = {
+        qr_code.qr_code_id: qr_code
+        for qr_code in StudentQRCode.objects.filter(qr_code_id__in=qr_code_ids, is_active=True)
+    }
+    classrooms = {classroom.id: classroom for classroom in ClassRoom.objects.filter(teachers=request.user)}
+    
+    now = timezone.now()
+    results = []
+    valid = []
+    for item in items:
+        client_scan_id = item.get('client_scan_id')
+        result = {'client_scan_id': client_scan_id}
+        results.append(result)
+        
+        qr_code = qr_codes.get(parse_uuid(item.get('qr_code_id')))
+        class_id = item.get('class_id')
+        class_id_valid = True
+        if class_id is None or class_id == '':
+            class_id = None
+        elif isinstance(class_id, str) and class_id.isdecimal():
+            class_id = int(class_id)
+        elif not isinstance(class_id, int) or isinstance(class_id, bool):
+            class_id_valid = False
+        scanned_at = now
+        if item.get('scanned_at') is not None:
+            try:
+                scanned_at = parse_datetime(item['scanned_at']) if isinstance(item['scanned_at'], str) else None
+            except ValueError:
+                # 形式は正しいが存在しない日時（2月30日・25時など）
+                scanned_at = None
+            if scanned_at is not None and timezone.is_naive(scanned_at):
+                scanned_at = timezone.make_aware(scanned_at)
+        
+        if not isinstance(client_scan_id, str) or not 1 <= len(client_scan_id) <= 64:
+            result.update(status='error', error='client_scan_id は1〜64文字の文字列で指定してください')
+        elif qr_code is None:
+            result.update(status='error', error='QRコードが見つかりません')
+        elif not class_id_valid:
+            result.update(status='error', error='class_id が不正です')
+        elif class_id is not None and class_id not in classrooms:
+            result.update(status='error', error='このクラスにアクセスする権限がありません')
+        elif scanned_at is None or scanned_at > now + timedelta(minutes=5):
+            result.update(status='error', error='scanned_at が不正です')
+        else:
+            valid.append((result, qr_code, classrooms.get(class_id), scanned_at))
+    
+    # スキャン日の授業セッションを1回のクエリで取得（クラス・日付ごとに最新のもの）
+    days = {timezone.localtime(scanned_at).date() for _, _, _, scanned_at in valid}
+    class_sessions = {}
+    day_sessions = {}
+    for lesson_session in LessonSession.objects.filter(
+        classroom__teachers=request.user, date__in=days
+    ).select_related('classroom').order_by('created_at'):
+        class_sessions[(lesson_session.classroom_id, lesson_session.date)] = lesson_session
+        day_sessions[lesson_session.date] = lesson_session
+    
+    def pending_scans():
+        # 登録済み・同じ送信内で重複している client_scan_id を除く
+        client_scan_ids = [result['client_scan_id'] for result, _, _, _ in valid]
+        seen = set(QRCodeScan.objects.filter(
+            scanned_by=request.user, client_scan_id__in=client_scan_ids
+        ).values_list('client_scan_id', flat=True))
+        scans = []
+        for result, qr_code, target_classroom, scanned_at in valid:
+            if result['client_scan_id'] in seen:
+                result['status'] = 'duplicate'
+                continue
+            seen.add(result['client_scan_id'])
+            day = timezone.localtime(scanned_at).date()
+            if target_classroom:
+                current_session = class_sessions.get((target_classroom.id, day))
+            else:
+                current_session = day_sessions.get(day)
+            scans.append({
+                'result': result,
+                'qr_code': qr_code,
+                'lesson_session': current_session,
+                'classroom': current_session.classroom if current_session else target_classroom,
+                'scanned_at': scanned_at,
+                'client_scan_id': result['client_scan_id'],
+            })
+        return scans
+    
+    try:
+        scans = pending_scans()
+        created_scans = record_scan_batch(request.user, scans)
+    except IntegrityError:
+        # 同じスキャンが同時に送信された場合は、登録済みのものを除いて1件ずつやり直す
+        scans = []
+        created_scans = []
+        for scan in pending_scans():
+            try:
+                created_scans += record_scan_batch(request.user, [scan])
+            except IntegrityError:
+                scan['result']['status'] = 'duplicate'
+                continue
+            scans.append(scan)
+    
+    for scan, created in zip(scans, created_scans):
+        scan['result'].update(
+            status='recorded',
+            student_id=scan['qr_code'].student_id,
+            lesson_session_id=created.lesson_session_id,
+            points_added=bool(scan['classroom']),
+        )
+    
+    return JsonResponse({
+        'success': all(result['status'] != 'error' for result in results),
+        'results': results,
+        'recorded': len(created_scans),
+    })
 
 
 @login_required
@@ -2153,35 +2251,51 @@ def student_qr_code_view(request):
     context = {
         'qr_code': qr_code,
         'scans': scans,
-        'qr_image': generate_qr_code_image(qr_code.qr_code_url),
-        'total_points': scans.aggregate(total=models.Sum('points_awarded'))['total'] or 0,
+        'qr_image_url': qr_image_url(qr_code),
+        **scan_history_totals(qr_code, scans),
     }
     return render(request, 'school_management/student_qr_code.html', context)
 
 
-def generate_qr_code_image(url):
-    """QRコード画像を生成"""
-    try:
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=10,
-            border=4,
-        )
-        qr.add_data(url)
-        qr.make(fit=True)
-        
-        img = qr.make_image(fill_color="black", back_color="white")
-        
-        # 画像をbase64エンコード
-        buffer = io.BytesIO()
-        img.save(buffer, format='PNG')
-        img_str = base64.b64encode(buffer.getvalue()).decode()
-        
-        return f"data:image/png;base64,{img_str}"
-    except Exception as e:
-        print(f"QRコード生成エラー: {e}")
-        return None
+def build_scan_url(request, qr_code, class_id=None):
+    """QRコードにエンコードするスキャンURLを生成（QR_SIGNED_PAYLOADS の場合は署名付きURL）"""
+    return request.build_absolute_uri(qr_code.scan_path(class_id))
+
+
+def qr_image_url(qr_code, class_id=None):
+    """QRコード画像（PNG）のURLを生成"""
+    url = reverse('school_management:qr_code_image', kwargs={'qr_code_id': qr_code.qr_code_id})
+    if class_id:
+        url += f'?class_id={class_id}'
+    return url
+
+
+@login_required
+def qr_code_image(request, qr_code_id):
+    """QRコード画像（PNG）を返す。生成済みの画像はキャッシュから返す"""
+    qr_code = get_object_or_404(StudentQRCode, qr_code_id=qr_code_id)
+    
+    # 本人または担当教員のみ取得可能
+    if request.user.id != qr_code.student_id:
+        if not request.user.is_teacher or not ClassRoom.objects.filter(
+            teachers=request.user, students=qr_code.student_id
+        ).exists():
+            return HttpResponseForbidden()
+    
+    class_id = request.GET.get('class_id')
+    if class_id and not class_id.isdigit():
+        return HttpResponseBadRequest()
+    
+    scan_url = build_scan_url(request, qr_code, class_id)
+    etag = f'"{content_hash(scan_url)}"'
+    if request.headers.get('If-None-Match') == etag:
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(get_qr_png(scan_url), content_type='image/png')
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, max-age=86400'
+    return response
+
 
 @login_required
 def class_evaluation_view(request, class_id):
@@ -2192,99 +2306,29 @@ def class_evaluation_view(request, class_id):
     # 授業回の一覧を取得
     sessions = LessonSession.objects.filter(classroom=classroom).order_by('session_number')
     
+    # 成績マトリクスを一括集計（学生数・授業回数に依存しない固定数のクエリ）
+    matrix = build_grade_matrix(classroom, sessions)
+    total_sessions = len(matrix.sessions)
+    
     # 各学生の評価データを取得
     student_evaluations = []
     
     for student in students:
         # 各授業回のデータ（ポイント + ピア評価スコア）
-        session_data = {}
-        session_count = 0
-        total_qr_points = 0
-        
-        for session in sessions:
-            session_key = f"第{session.session_number}回"
-            
-            # QRコードポイントを取得
-            qr_points = 0
-            lesson_point = StudentLessonPoints.objects.filter(
-                lesson_session=session,
-                student=student
-            ).first()
-            if lesson_point:
-                qr_points = lesson_point.points
-                session_count += 1
-                total_qr_points += qr_points
-            
-            # 小テストスコアを取得
-            quiz_score = 0
-            has_quiz = False
-            try:
-                quiz = Quiz.objects.filter(lesson_session=session).first()
-                if quiz:
-                    has_quiz = True
-                    quiz_score_obj = QuizScore.objects.filter(
-                        quiz=quiz,
-                        student=student,
-                        is_cancelled=False
-                    ).first()
-                    if quiz_score_obj:
-                        # 小テストのスコア（0-100点）をそのまま使用
-                        quiz_score = quiz_score_obj.score
-            except Exception as e:
-                print(f"小テストスコア取得エラー: {e}")
-                pass
-            
-            # ピア評価スコアを取得（1位=5点、2位=3点）
-            peer_evaluation_score = 0
-            try:
-                # この学生が所属するグループを取得
-                student_groups = Group.objects.filter(
-                    lesson_session=session,
-                    groupmember__student=student
-                )
-                
-                if student_groups.exists() and session.has_peer_evaluation:
-                    from .models import PeerEvaluation
-                    # この学生のグループが1位に選ばれた回数
-                    first_place_count = PeerEvaluation.objects.filter(
-                        lesson_session=session,
-                        first_place_group__in=student_groups
-                    ).count()
-                    
-                    # この学生のグループが2位に選ばれた回数
-                    second_place_count = PeerEvaluation.objects.filter(
-                        lesson_session=session,
-                        second_place_group__in=student_groups
-                    ).count()
-                    
-                    # 1位×5点 + 2位×3点
-                    peer_evaluation_score = first_place_count * 5 + second_place_count * 3
-            except Exception as e:
-                print(f"ピア評価スコア取得エラー: {e}")
-                pass
-            
-            session_data[session_key] = {
-                'qr_points': qr_points,
-                'quiz_score': quiz_score,
-                'peer_score': peer_evaluation_score,
-                'total_score': qr_points + quiz_score + peer_evaluation_score,
-                'date': session.date,
-                'has_peer_evaluation': session.has_peer_evaluation,
-                'has_quiz': has_quiz
-            }
+        session_data = matrix.session_data(student)
+        session_count, total_qr_points = matrix.attended_sessions(student)
         
-        # 出席率と平均ポイントを計算
-        total_sessions = sessions.count()
         # データベースから保存された出席率、出席点、ポイントを取得
         saved_multiplied_points = 0
         attendance_rate = 0
         saved_attendance_points = 0
-        try:
-            student_class_points = StudentClassPoints.objects.get(student=student, classroom=classroom)
-            attendance_rate = student_class_points.attendance_rate
+        student_class_points = matrix.class_points.get(student.id)
+        if student_class_points:
             saved_multiplied_points = student_class_points.points
+        if student_class_points and student_class_points.pk:
+            attendance_rate = student_class_points.attendance_rate
             saved_attendance_points = student_class_points.attendance_points
-        except StudentClassPoints.DoesNotExist:
+        else:
             # 保存されていない場合は自動計算
             attendance_rate = (session_count / total_sessions * 100) if total_sessions > 0 else 0
         
@@ -2329,31 +2373,16 @@ def class_evaluation_view(request, class_id):
             'qr_points': total_qr_points,  # クラスのQRコードポイントの合計
         })
     
-    session_list = [f"第{session.session_number}回" for session in sessions]
+    session_list = [session_key(session) for session in matrix.sessions]
     
-    # 各授業回のピア評価平均値を計算
-    session_peer_averages = {}
-    for session in sessions:
-        if session.has_peer_evaluation:
-            from .models import ContributionEvaluation
-            peer_scores = ContributionEvaluation.objects.filter(
-                peer_evaluation__lesson_session=session
-            ).aggregate(avg_score=models.Avg('contribution_score'))
-            
-            avg_score = round(peer_scores['avg_score'] or 0, 1)
-            session_peer_averages[session.id] = avg_score
-            print(f"Session {session.session_number}: PE average = {avg_score}")
-        else:
-            session_peer_averages[session.id] = None
-            print(f"Session {session.session_number}: No peer evaluation")
-    
-    print(f"Session peer averages: {session_peer_averages}")
+    # 各授業回のピア評価平均値
+    session_peer_averages = matrix.peer_averages
     
     context = {
         'classroom': classroom,
         'student_evaluations': student_evaluations,
         'session_list': session_list,
-        'sessions': sessions,  # 日付情報も渡す
+        'sessions': matrix.sessions,  # 日付情報も渡す
         'session_peer_averages': session_peer_averages,  # ピア評価平均値
         'total_sessions': len(session_list),
     }
@@ -2388,96 +2417,141 @@ def update_attendance_rate(request, class_id):
     if not classroom.students.filter(id=student_id).exists():
         return JsonResponse({'success': False, 'error': 'この学生はクラスに所属していません'})
     
-    # 出席率、出席点、合計点をデータベースに保存
-    student_class_points, created = StudentClassPoints.objects.get_or_create(
-        student=student,
-        classroom=classroom,
-        defaults={'points': total_points, 'attendance_rate': attendance_rate, 'attendance_points': attendance_points}
-    )
-    
-    if not created:
-        # 既存のレコードのpoints、出席率、出席点を更新
-        student_class_points.points = total_points
-        student_class_points.attendance_rate = attendance_rate
-        student_class_points.attendance_points = attendance_points
-        student_class_points.save()
+    # 出席率、出席点、合計点をデータベースに保存（合計点は未反映のスキャン分を含む画面の値）
+    save_class_points(classroom, {student.id: {
+        'points': total_points,
+        'attendance_rate': attendance_rate,
+        'attendance_points': attendance_points,
+    }})
     
     return JsonResponse({'success': True, 'message': '出席率を保存しました'})
 
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
 @login_required
-def class_points_view(request, class_id):
-    """クラスごとのポイント一覧"""
-    classroom = get_object_or_404(ClassRoom, id=class_id, teachers=request.user)
-    students = classroom.students.all().order_by('student_number')
+@require_POST
+def update_attendance_rates(request, class_id):
+    """クラスの学生の出席率をまとめて更新するAPI
+
+    JSON ボディで { "students": [{"student_id": <学生ID>, "attendance_rate": <出席率>,
+    "total_points": <合計点>, "attendance_points": <出席点>}, ...] } を受け取る。
+    所属の確認は1回のクエリで行い、有効な行を1つのトランザクションでまとめて保存する。
+    """
+    import json
     
-    # 各学生のクラス内成績を取得
-    student_grades = []
+    classroom = get_object_or_404(ClassRoom, id=class_id, teachers=request.user)
     
-    for student in students:
-        # このクラスの授業回でのポイントを取得
-        lesson_points = StudentLessonPoints.objects.filter(
-            student=student,
-            lesson_session__classroom=classroom
-        ).select_related('lesson_session').order_by('lesson_session__session_number')
-        
-        total_class_points = sum(point.points for point in lesson_points)
-        session_count = lesson_points.count()
-        average_points = round(total_class_points / session_count, 1) if session_count > 0 else 0
-        
-        # 成績評価
-        if average_points >= 5:
-            grade_level = '優秀'
-            grade_color = 'success'
-        elif average_points >= 3:
-            grade_level = '良好'
-            grade_color = 'warning'
-        elif average_points >= 1:
-            grade_level = '普通'
-            grade_color = 'info'
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'success': False, 'error': '不正なリクエストです'}, status=400)
+    items = data.get('students') if isinstance(data, dict) else None
+    if not isinstance(items, list) or not items or len(items) > 500:
+        return JsonResponse({'success': False, 'error': 'students は1〜500件の配列で指定してください'}, status=400)
+    
+    # クラスに所属しているかを1回のクエリで確認
+    requested_ids = {
+        item.get('student_id') for item in items
+        if isinstance(item, dict)
+        and isinstance(item.get('student_id'), int) and not isinstance(item.get('student_id'), bool)
+    }
+    enrolled_ids = set(classroom.students.filter(id__in=requested_ids).values_list('id', flat=True))
+    
+    rows = {}
+    results = []
+    for item in items:
+        item = item if isinstance(item, dict) else {}
+        student_id = item.get('student_id')
+        attendance_rate = item.get('attendance_rate')
+        total_points = item.get('total_points', 0)
+        attendance_points = item.get('attendance_points', 0)
+        if not isinstance(student_id, int) or isinstance(student_id, bool) or student_id not in enrolled_ids:
+            results.append({'student_id': student_id, 'status': 'error', 'error': 'この学生はクラスに所属していません'})
+        elif not _is_number(attendance_rate) or not 0 <= attendance_rate <= 100:
+            results.append({'student_id': student_id, 'status': 'error', 'error': '出席率は0〜100の範囲で入力してください'})
+        elif not _is_number(total_points) or not _is_number(attendance_points):
+            results.append({'student_id': student_id, 'status': 'error', 'error': '合計点・出席点は数値で指定してください'})
         else:
-            grade_level = '要努力'
-            grade_color = 'secondary'
-        
-        # クラス単位の合計ポイントを取得（StudentClassPoints があれば優先して表示）
-        try:
-            student_class_point = StudentClassPoints.objects.get(student=student, classroom=classroom).points
-        except StudentClassPoints.DoesNotExist:
-            student_class_point = None
-
-        student_grades.append({
-            'student': student,
-            'total_points': total_class_points,
-            'average_points': average_points,
-            'session_count': session_count,
-            'lesson_points': lesson_points,
-            'grade_level': grade_level,
-            'grade_color': grade_color,
-            'overall_points': student.points,  # 全体のポイント（参考用）
-            'class_points': student_class_point,  # クラス単位のポイント（あれば表示）
-        })
+            rows[student_id] = {
+                'points': total_points,
+                'attendance_rate': attendance_rate,
+                'attendance_points': attendance_points,
+            }
+            results.append({'student_id': student_id, 'status': 'saved'})
     
-    # 平均ポイント順でソート
-    student_grades.sort(key=lambda x: x['average_points'], reverse=True)
+    save_class_points(classroom, rows)
+    return JsonResponse({
+        'success': all(result['status'] != 'error' for result in results),
+        'results': results,
+        'saved_count': len(rows),
+    })
+
+@login_required
+def class_points_view(request, class_id):
+    """クラスごとのポイント一覧"""
+    classroom = get_object_or_404(ClassRoom, id=class_id, teachers=request.user)
     
-    # クラス全体の統計
-    total_students = len(student_grades)
-    if total_students > 0:
-        class_average = round(sum(grade['average_points'] for grade in student_grades) / total_students, 1)
-        max_average = max(grade['average_points'] for grade in student_grades)
-        min_average = min(grade['average_points'] for grade in student_grades)
-    else:
-        class_average = 0
-        max_average = 0
-        min_average = 0
+    # 学生ごとの合計・平均・順位とクラス全体の統計はDB側で集計する
+    student_grades, class_stats = class_point_rankings(classroom)
     
     context = {
         'classroom': classroom,
         'student_grades': student_grades,
-        'class_stats': {
-            'total_students': total_students,
-            'class_average': class_average,
-            'max_average': max_average,
-            'min_average': min_average,
-        }
+        'class_stats': class_stats,
     }
     return render(request, 'school_management/class_points.html', context)
+
+
+def job_status_data(job):
+    """ジョブの状態（ポーリング用JSON）"""
+    data = {
+        'id': job.id,
+        'job_type': job.job_type,
+        'status': job.status,
+        'status_display': job.get_status_display(),
+        'progress_current': job.progress_current,
+        'progress_total': job.progress_total,
+        'progress_percent': job.progress_percent,
+        'message': job.message,
+        'result': job.result,
+        'download_url': None,
+    }
+    if job.status == 'succeeded' and job.result_filename:
+        data['download_url'] = reverse('school_management:job_download', kwargs={'job_id': job.id})
+    if job.status == 'failed':
+        data['error'] = 'ジョブの実行中にエラーが発生しました。'
+    return data
+
+
+@login_required
+def job_status(request, job_id):
+    """バックグラウンドジョブの進捗表示（?format=json でポーリング用JSONを返す）"""
+    jobs = BackgroundJob.objects.defer('result_file')
+    if not request.user.is_superuser:
+        jobs = jobs.filter(created_by=request.user)
+    job = get_object_or_404(jobs, id=job_id)
+    
+    if _wants_json(request):
+        return JsonResponse(job_status_data(job))
+    
+    context = {
+        'job': job,
+        'job_data': job_status_data(job),
+    }
+    return render(request, 'school_management/job_status.html', context)
+
+
+@login_required
+def job_download(request, job_id):
+    """バックグラウンドジョブの結果ファイルをダウンロード"""
+    jobs = BackgroundJob.objects.filter(status='succeeded', result_file__isnull=False)
+    if not request.user.is_superuser:
+        jobs = jobs.filter(created_by=request.user)
+    job = get_object_or_404(jobs, id=job_id)
+    
+    response = HttpResponse(bytes(job.result_file), content_type=job.result_content_type)
+    response['Content-Disposition'] = f'attachment; filename="{job.result_filename}"'
+    return response
@@ -184,6 +184,48 @@ STORAGES = {
     },
 }
 
+# Cache
+# QRコード画像はLRU（MAX_ENTRIESを超えると古いものから削除）でキャッシュする。
+# 'scans' はスキャンの連続抑止キー・抑止回数・授業回解決のバージョンを保持する。連続スキャン中に
+# default の件数上限（300）で削除されないよう別のキャッシュにし、上限は QR_SCAN_CACHE_ENTRIES で指定する
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'qr_images': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'qr-images',
+        'TIMEOUT': None,
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get('QR_IMAGE_CACHE_ENTRIES', '2000')),
+        },
+    },
+    'scans': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'scans',
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get('QR_SCAN_CACHE_ENTRIES', '50000')),
+        },
+    },
+}
+
+# Background jobs
+# True の場合、学生一括追加やQRシート出力は `manage.py run_workers` で実行するジョブとして登録する
+BACKGROUND_JOBS = os.environ.get('BACKGROUND_JOBS', 'False') == 'True'
+
+# QR codes
+# True の場合、QRコードには署名付きトークンのURLを埋め込む（スキャン時にQRコードを読み込まずに検証する）。
+# 従来のQRコードIDのURLも引き続きスキャンできる
+QR_SIGNED_PAYLOADS = os.environ.get('QR_SIGNED_PAYLOADS', 'False') == 'True'
+# 署名付きQRコードの検証に使う有効なQRコードIDのキャッシュ秒数。default キャッシュがプロセスごと（LocMemCache）の場合、
+# 他のプロセスでの無効化・削除はこの秒数以内に反映される（すぐに反映させるには共有キャッシュを使う）
+QR_DENY_LIST_TTL = int(os.environ.get('QR_DENY_LIST_TTL', '60'))
+# 同じ教員が同じQRコードを同じ授業回でこの秒数以内に再スキャンした場合は記録しない（0で無効）
+QR_SCAN_DEBOUNCE_SECONDS = int(os.environ.get('QR_SCAN_DEBOUNCE_SECONDS', '3'))
+# True の場合、スキャン時はスキャン履歴の追加のみ行い、ポイント・スキャン数は
+# `manage.py compact_scan_log` でまとめて反映する（表示時は未反映分を合算する）
+QR_SCAN_DEFERRED_POINTS = os.environ.get('QR_SCAN_DEFERRED_POINTS', 'False') == 'True'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 